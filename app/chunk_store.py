@@ -0,0 +1,226 @@
+import json
+import os
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+import numpy as np
+
+FORMAT_VERSION = 1
+HEADER_FILENAME = "header.json"
+
+class ChunkStore:
+    """
+    Columnar, memory-mapped store of indexed chunks.
+
+    Chunk contents live in one contiguous UTF-8 buffer addressed by an offsets
+    array, and every metadata key is its own column: an int32 code per chunk
+    pointing into a table of distinct JSON-encoded values (-1 when the chunk
+    has no value for that key). Opening the store maps the files without
+    reading them, and only the rows that are accessed get decoded, so worker
+    processes share the pages through the OS cache instead of each holding a
+    private copy.
+
+    Files in the store directory:
+        header.json                    row count and metadata keys
+        ids.npy                        int64 chunk id per row
+        sorted_ids.npy / id_order.npy  ids in sorted order and their rows, for id -> row lookups
+        content.bin / content_offsets.npy
+        meta.<key>.codes.npy           int32 value code per row
+        meta.<key>.values.bin / meta.<key>.offsets.npy
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        with open(self.directory / HEADER_FILENAME, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk store format in {self.directory}")
+
+        self.count = header["count"]
+        self.metadata_keys = header["metadata_keys"]
+        self.ids = self._load_array("ids.npy")
+        self._sorted_ids = self._load_array("sorted_ids.npy")
+        self._id_order = self._load_array("id_order.npy")
+        self._content = self._map_buffer("content.bin")
+        self._content_offsets = self._load_array("content_offsets.npy")
+        self._metadata = {
+            key: (
+                self._load_array(f"meta.{key}.codes.npy"),
+                self._map_buffer(f"meta.{key}.values.bin"),
+                self._load_array(f"meta.{key}.offsets.npy")
+            )
+            for key in self.metadata_keys
+        }
+        # Distinct metadata values are few (sources, types), so decoded ones are kept
+        self._value_cache: Dict[str, Dict[int, Any]] = {key: {} for key in self.metadata_keys}
+
+    @classmethod
+    def open(cls, directory: Path) -> "ChunkStore":
+        return cls(directory)
+
+    @staticmethod
+    def exists(directory: Path) -> bool:
+        return (Path(directory) / HEADER_FILENAME).exists()
+
+    def _load_array(self, name: str) -> np.ndarray:
+        return np.load(self.directory / name, mmap_mode="r")
+
+    def _map_buffer(self, name: str):
+        path = self.directory / name
+        if path.stat().st_size == 0:
+            return np.empty(0, dtype=np.uint8)
+        return np.memmap(path, dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def content(self, row: int) -> str:
+        start, end = self._content_offsets[row], self._content_offsets[row + 1]
+        return bytes(self._content[start:end]).decode("utf-8")
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        metadata = {}
+        for key, (codes, values, offsets) in self._metadata.items():
+            code = int(codes[row])
+            if code < 0:
+                continue
+            cache = self._value_cache[key]
+            if code not in cache:
+                cache[code] = json.loads(bytes(values[offsets[code]:offsets[code + 1]]).decode("utf-8"))
+            metadata[key] = cache[code]
+        return metadata
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        """Decode one chunk as {"id", "content", "metadata"}."""
+        row = int(row)
+        if row < 0 or row >= self.count:
+            raise IndexError(row)
+        return {
+            "id": int(self.ids[row]),
+            "content": self.content(row),
+            "metadata": self.metadata(row)
+        }
+
+    def get_many(self, rows: Sequence[int]) -> List[Dict[str, Any]]:
+        return [self[row] for row in rows]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(self.count):
+            yield self[row]
+
+    def rows_for_ids(self, chunk_ids: Sequence[int]) -> np.ndarray:
+        """Map chunk ids to row numbers, with -1 for ids not in the store."""
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        if not self.count:
+            return np.full(len(chunk_ids), -1, dtype=np.int64)
+        positions = np.clip(np.searchsorted(self._sorted_ids, chunk_ids), 0, self.count - 1)
+        rows = np.asarray(self._id_order[positions], dtype=np.int64)
+        rows[self._sorted_ids[positions] != chunk_ids] = -1
+        return rows
+
+    @classmethod
+    def write(cls, directory: Path, chunks: Iterable[Dict[str, Any]]) -> "ChunkStore":
+        """
+        Write chunks ({"id", "content", "metadata"} dicts) as a new store.
+
+        Each file is written to a temporary name and renamed into place, so
+        processes that still map the previous version keep reading it intact.
+        """
+        writer = ChunkStoreWriter(directory)
+        for chunk in chunks:
+            writer.add(chunk)
+        return writer.close()
+
+class ChunkStoreWriter:
+    """
+    Writes a chunk store one chunk at a time.
+
+    Contents are appended to a temporary file as chunks arrive; only ids,
+    offsets and metadata codes are kept in memory until close() writes the
+    remaining columns and renames everything into place.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._content_tmp_path = self.directory / "content.bin.tmp"
+        self._content = open(self._content_tmp_path, "wb")
+        self._ids = array("q")
+        self._content_offsets = array("q", [0])
+        self._metadata_keys: List[str] = []
+        self._codes: Dict[str, array] = {}
+        self._value_codes: Dict[str, Dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Ids of the chunks added so far, in row order."""
+        return np.frombuffer(self._ids, dtype=np.int64)
+
+    def add(self, chunk: Dict[str, Any]) -> None:
+        row = len(self._ids)
+        data = chunk["content"].encode("utf-8")
+        self._content.write(data)
+        self._content_offsets.append(self._content_offsets[-1] + len(data))
+        self._ids.append(chunk["id"])
+
+        metadata = chunk["metadata"]
+        for key in metadata:
+            if key not in self._codes:
+                self._metadata_keys.append(key)
+                self._codes[key] = array("i", [-1]) * row
+                self._value_codes[key] = {}
+        for key in self._metadata_keys:
+            if key in metadata:
+                encoded = json.dumps(metadata[key], ensure_ascii=False)
+                value_codes = self._value_codes[key]
+                self._codes[key].append(value_codes.setdefault(encoded, len(value_codes)))
+            else:
+                self._codes[key].append(-1)
+
+    def close(self) -> ChunkStore:
+        """Finish the store and open it."""
+        self._content.close()
+        os.replace(self._content_tmp_path, self.directory / "content.bin")
+        save_array(self.directory / "content_offsets.npy", np.array(self._content_offsets, dtype=np.int64))
+
+        ids = np.array(self._ids, dtype=np.int64)
+        id_order = np.argsort(ids, kind="stable")
+        save_array(self.directory / "ids.npy", ids)
+        save_array(self.directory / "sorted_ids.npy", ids[id_order])
+        save_array(self.directory / "id_order.npy", id_order)
+
+        for key in self._metadata_keys:
+            offsets, values = _pack([v.encode("utf-8") for v in self._value_codes[key]])
+            save_array(self.directory / f"meta.{key}.codes.npy", np.array(self._codes[key], dtype=np.int32))
+            save_bytes(self.directory / f"meta.{key}.values.bin", values)
+            save_array(self.directory / f"meta.{key}.offsets.npy", offsets)
+
+        # The header goes last so an interrupted write leaves no header for a new store
+        header = {"format": FORMAT_VERSION, "count": len(ids), "metadata_keys": self._metadata_keys}
+        tmp_path = self.directory / f"{HEADER_FILENAME}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self.directory / HEADER_FILENAME)
+
+        return ChunkStore(self.directory)
+
+def _pack(blobs: List[bytes]):
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+    return offsets, b"".join(blobs)
+
+def save_array(path: Path, array: np.ndarray) -> None:
+    """Write an .npy file via a temporary file, so existing memory maps stay valid."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+def save_bytes(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
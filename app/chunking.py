@@ -0,0 +1,163 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Rough tokens-per-character ratio for English prose with LLaMA-style tokenizers
+CHARS_PER_TOKEN = 4
+
+# all-MiniLM-L6-v2 truncates its input after 256 word pieces, so larger
+# chunks would only be partly represented by their embedding
+DEFAULT_CHUNK_TOKENS = 256
+DEFAULT_CHUNK_OVERLAP = 32
+
+MAX_SECTION_TITLE_LENGTH = 120
+
+SECTION_HEADING = re.compile(
+    r"^(?:section|sec\.|article|chapter|part|schedule|clause|order|rule)\s+[\w.()-]+",
+    re.IGNORECASE
+)
+SENTENCE_END = re.compile(r"(?<=[.;:?!])\s+")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in a text.
+
+    A character-count heuristic, which is close enough for sizing prompts and
+    chunks and avoids loading a tokenizer.
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def split_to_budget(text: str, max_tokens: int, separators=("\n\n", "\n", " ")) -> List[str]:
+    """Split text on the coarsest separator that brings every piece within max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    if not separators:
+        step = max_tokens * CHARS_PER_TOKEN
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    separator, finer = separators[0], separators[1:]
+    pieces = []
+    current = ""
+    for part in text.split(separator):
+        candidate = f"{current}{separator}{part}" if current else part
+        if estimate_tokens(candidate) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if estimate_tokens(part) <= max_tokens:
+            current = part
+        else:
+            pieces.extend(split_to_budget(part, max_tokens, finer))
+            current = ""
+    if current:
+        pieces.append(current)
+    return pieces
+
+def section_title(line: str) -> Optional[str]:
+    """
+    Return the section title a line opens, or None.
+
+    Recognizes numbered headings ("Section 302. Punishment for murder.",
+    "Article 21", "CHAPTER XVI"), also when the section body follows on the
+    same line, and short all-caps title lines.
+    """
+    match = SECTION_HEADING.match(line)
+    if match:
+        if len(line) <= MAX_SECTION_TITLE_LENGTH:
+            return line
+        # Keep the number and caption of "Section 378. Theft.—Whoever ...", or just the number
+        caption = " ".join(SENTENCE_END.split(line)[:2])
+        return caption if len(caption) <= MAX_SECTION_TITLE_LENGTH else match.group(0)
+    # Short all-caps lines are titles in most statutes and judgments
+    letters = [c for c in line if c.isalpha()]
+    if len(line) <= MAX_SECTION_TITLE_LENGTH and len(letters) >= 4 and line.isupper():
+        return line
+    return None
+
+def _line_units(line: str, max_tokens: int) -> List[str]:
+    """Split a line longer than max_tokens into sentences, then words."""
+    if estimate_tokens(line) <= max_tokens:
+        return [line]
+    units = []
+    for sentence in SENTENCE_END.split(line):
+        units.extend(split_to_budget(sentence, max_tokens, (" ",)))
+    return units
+
+def chunk_pages(
+    pages: Iterable[Tuple[Optional[int], str]],
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_CHUNK_OVERLAP
+) -> List[Dict[str, Any]]:
+    """
+    Split page texts into chunks of at most max_tokens estimated tokens.
+
+    Lines are packed in order across page breaks. A section heading always
+    starts a new chunk, and consecutive chunks of the same section repeat up
+    to overlap_tokens of trailing lines so text cut at a boundary stays
+    retrievable.
+
+    Args:
+        pages: (page_number, text) pairs in order; page_number is None for
+            sources without pages
+        max_tokens: Token budget of one chunk
+        overlap_tokens: Tokens repeated between neighbouring chunks of a section
+
+    Returns:
+        List of {"content", "page", "page_end", "section"} dicts; page,
+        page_end and section are None when unknown
+    """
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    chunks = []
+    current: List[Tuple[Optional[int], str, int]] = []
+    current_tokens = 0
+    fresh = 0  # units added since the last chunk, as opposed to carried-over overlap
+    body = 0  # fresh units that are not headings
+    section = None
+
+    def flush(keep_overlap):
+        nonlocal current, current_tokens, fresh, body
+        if fresh:
+            chunks.append({
+                "content": "\n".join(text for _, text, _ in current),
+                "page": current[0][0],
+                "page_end": current[-1][0],
+                "section": section
+            })
+        carried = []
+        carried_tokens = 0
+        if keep_overlap:
+            for unit in reversed(current[1:]):
+                if carried_tokens + unit[2] > overlap_tokens:
+                    break
+                carried.insert(0, unit)
+                carried_tokens += unit[2]
+        current, current_tokens, fresh, body = carried, carried_tokens, 0, 0
+
+    for page, text in pages:
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            title = section_title(line)
+            if title is not None:
+                if body:
+                    flush(keep_overlap=False)
+                    section = title
+                else:
+                    # Consecutive headings ("CHAPTER XVII" / "OF OFFENCES AGAINST PROPERTY") form one title
+                    section = f"{section} {title}"[:MAX_SECTION_TITLE_LENGTH] if fresh and section else title
+                    if not fresh:
+                        current, current_tokens = [], 0
+            for unit in _line_units(line, max_tokens):
+                tokens = estimate_tokens(unit)
+                if current and current_tokens + tokens > max_tokens:
+                    flush(keep_overlap=True)
+                    if current_tokens + tokens > max_tokens:
+                        current, current_tokens = [], 0
+                current.append((page, unit, tokens))
+                current_tokens += tokens
+                fresh += 1
+                if title != line:
+                    body += 1
+    flush(keep_overlap=False)
+    return chunks
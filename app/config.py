@@ -0,0 +1,5 @@
+import os
+
+def env_flag(name: str, default: str) -> bool:
+    """Read a boolean setting such as "true"/"false" or "1"/"0" from the environment."""
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,90 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from app.chunking import estimate_tokens, split_to_budget
+
+DEFAULT_CONTEXT_TOKENS = 1500
+
+# Sentences end at . ? or ! followed by a capitalized word. Colons and
+# semicolons are not boundaries ("Answer: ..."), and neither is "Sec. 302".
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.?!])\s+(?=[\"'(\[]?[A-Z])")
+# Shorter sentences ("Yes.", "(a) Theft.") are kept even when repeated
+MIN_DEDUP_WORDS = 4
+
+def _sentence_key(sentence: str) -> Optional[str]:
+    words = re.findall(r"\w+", sentence.lower())
+    return " ".join(words) if len(words) >= MIN_DEDUP_WORDS else None
+
+def pack_context(chunks: List[Dict[str, Any]], max_tokens: int = DEFAULT_CONTEXT_TOKENS) -> Dict[str, Any]:
+    """
+    Build the LLM context from ranked chunks within a token budget.
+
+    Chunks are taken in rank order. Repeated chunks and sentences already in
+    the context (e.g. the overlap between neighbouring PDF chunks) are
+    dropped, and packing stops at the first sentence that no longer fits, so
+    the context ends on a sentence boundary.
+
+    Args:
+        chunks: Retrieved {"content", "metadata"} dicts, best first
+        max_tokens: Token budget of the packed context
+
+    Returns:
+        {"context": the packed text, "chunks": the chunks that contributed
+        text, "tokens": estimated tokens of the context,
+        "deduplicated": repeated chunks and sentences dropped,
+        "truncated": whether the budget cut content off}
+    """
+    seen = set()
+    seen_chunks = set()
+    parts = []
+    used = []
+    remaining = max_tokens
+    deduplicated = 0
+    truncated = False
+
+    for chunk in chunks:
+        chunk_key = " ".join(re.findall(r"\w+", chunk["content"].lower()))
+        if chunk_key in seen_chunks:
+            deduplicated += 1
+            continue
+        seen_chunks.add(chunk_key)
+        lines = []
+        for line in chunk["content"].splitlines():
+            kept = []
+            for sentence in SENTENCE_BOUNDARY.split(line.strip()):
+                if not sentence:
+                    continue
+                key = _sentence_key(sentence)
+                if key is not None and key in seen:
+                    deduplicated += 1
+                    continue
+                # +1 for the space or newline joining it to the previous sentence
+                cost = estimate_tokens(sentence) + 1
+                if cost > remaining:
+                    if not parts and not lines and not kept:
+                        # Never return an empty context because the best sentence is too long
+                        kept.append(split_to_budget(sentence, max(1, remaining - 1), (" ",))[0])
+                    truncated = True
+                    break
+                kept.append(sentence)
+                remaining -= cost
+                if key is not None:
+                    seen.add(key)
+            if kept:
+                lines.append(" ".join(kept))
+            if truncated:
+                break
+        if lines:
+            parts.append("\n".join(lines))
+            used.append(chunk)
+        if truncated:
+            break
+
+    context = "\n".join(parts)
+    return {
+        "context": context,
+        "chunks": used,
+        "tokens": estimate_tokens(context),
+        "deduplicated": deduplicated,
+        "truncated": truncated
+    }
@@ -0,0 +1,103 @@
+import hashlib
+import re
+from typing import Dict, FrozenSet, List, Sequence, Set
+
+import numpy as np
+
+# Word 3-grams: paraphrases keep most of them, unrelated texts that share a
+# template ("Imprisonment for 2 years, or fine, or both.") keep few
+SHINGLE_SIZE = 3
+# 32 bands of 2 rows: pairs with Jaccard similarity 0.5 become candidates
+# with probability 1 - (1 - 0.5**2)**32, i.e. almost always
+NUM_PERM = 64
+LSH_ROWS = 2
+DEFAULT_THRESHOLD = 0.6
+
+_WORD = re.compile(r"\w+")
+
+_rng = np.random.default_rng(0x5EED)
+# Odd multipliers and offsets of the multiply-shift hash family, one pair per permutation
+_PERM_A = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """Lowercased word n-grams of a text; texts shorter than `size` words give one shingle."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def numbers(text: str) -> FrozenSet[str]:
+    """Words of a text that contain a digit: section numbers, years, amounts, terms."""
+    return frozenset(word for word in _WORD.findall(text.lower()) if any(c.isdigit() for c in word))
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def minhash_signature(shingle_set: Set[str]) -> np.ndarray:
+    """NUM_PERM min-hashes of a shingle set, as a uint64 array."""
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingle_set),
+        dtype=np.uint64,
+        count=len(shingle_set)
+    )
+    with np.errstate(over="ignore"):
+        permuted = hashes[:, None] * _PERM_A + _PERM_B
+    # The high bits of a multiply-shift hash are the well mixed ones
+    return (permuted >> np.uint64(32)).min(axis=0)
+
+def near_duplicate_clusters(texts: Sequence[str], threshold: float = DEFAULT_THRESHOLD) -> List[List[int]]:
+    """
+    Group texts whose word-shingle Jaccard similarity is at least `threshold`.
+
+    Texts that mention different numbers are never grouped, however similar:
+    "punishment under section 337" and "punishment under section 338" differ
+    in the one word that matters.
+
+    Candidate pairs come from MinHash locality-sensitive hashing and are
+    confirmed with the exact Jaccard similarity, so the cost stays close to
+    linear in the number of texts. Similarity is transitive within a cluster
+    (A~B and B~C put A, B and C together).
+
+    Args:
+        texts: Texts to compare
+        threshold: Minimum Jaccard similarity of two near-duplicates
+
+    Returns:
+        Clusters as lists of positions in `texts`, each sorted, ordered by
+        their first position; texts without duplicates are singleton clusters
+    """
+    shingle_sets = [shingles(text) for text in texts]
+    number_sets = [numbers(text) for text in texts]
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    buckets: Dict[bytes, List[int]] = {}
+    for i, shingle_set in enumerate(shingle_sets):
+        signature = minhash_signature(shingle_set)
+        for band in range(0, NUM_PERM, LSH_ROWS):
+            key = band.to_bytes(2, "big") + signature[band:band + LSH_ROWS].tobytes()
+            buckets.setdefault(key, []).append(i)
+
+    checked = set()
+    for members in buckets.values():
+        for position, i in enumerate(members):
+            for j in members[position + 1:]:
+                root_i, root_j = find(i), find(j)
+                if root_i == root_j or (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                if number_sets[i] == number_sets[j] and jaccard(shingle_sets[i], shingle_sets[j]) >= threshold:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(texts)):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda cluster: cluster[0])
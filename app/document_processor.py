@@ -1,7 +1,10 @@
 import pdfplumber
 import io
 from typing import List, Dict, Any
+from app.chunking import estimate_tokens, split_to_budget
+from app.metrics import timed
 
+@timed("pdf_extract")
 def extract_text_from_pdf(file_content: bytes) -> Dict[str, Any]:
     """
     Extract text from PDF file content.
@@ -111,3 +114,42 @@ def analyze_document_structure(text: str) -> Dict[str, Any]:
         "average_words_per_sentence": len(words) / max(len([s for s in sentences if s.strip()]), 1),
         "estimated_reading_time_minutes": round(len(words) / 200, 2)  # Average reading speed: 200 words/min
     }
+
+def split_text_chunks(text_chunks: List[Dict[str, Any]], max_tokens: int) -> List[Dict[str, Any]]:
+    """
+    Group the per-page text chunks of extract_text_from_pdf into sections of at most max_tokens.
+
+    Consecutive pages are packed together; a page longer than max_tokens is
+    split on paragraph, then line, then word boundaries.
+
+    Args:
+        text_chunks: List of {"page", "text"} dicts in page order
+        max_tokens: Token budget of one section
+
+    Returns:
+        List of {"first_page", "last_page", "text"} dicts
+    """
+    sections = []
+    current = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            sections.append({
+                "first_page": current[0][0],
+                "last_page": current[-1][0],
+                "text": "\n\n".join(text for _, text in current)
+            })
+        current = []
+        current_tokens = 0
+
+    for chunk in text_chunks:
+        for piece in split_to_budget(chunk["text"], max_tokens):
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                flush()
+            current.append((chunk["page"], piece))
+            current_tokens += piece_tokens
+    flush()
+    return sections
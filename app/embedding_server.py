@@ -0,0 +1,193 @@
+"""
+A local process that owns the embedding model for every API worker of a host.
+
+Workers started by `python -m app.serve --embedding-server` do not load the
+model themselves; app.rag sends query texts over a Unix socket instead and
+gets the embeddings back. Requests that arrive while the model is busy are
+encoded together in one call, so the worker processes also share batches.
+
+The server can run on its own, e.g. under a process supervisor:
+
+    EMBEDDING_SERVER_AUTHKEY=... python -m app.embedding_server --socket /run/legal/embed.sock
+
+and the API workers then need EMBEDDING_SERVER=/run/legal/embed.sock and the
+same EMBEDDING_SERVER_AUTHKEY.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.embeddings import LEGACY_EMBEDDING, configured_embedding, load_embedding_model
+
+# Unix socket of the embedding server; unset means workers load the model themselves
+EMBEDDING_SERVER = os.getenv("EMBEDDING_SERVER")
+# Texts encoded in one model call at most, across all waiting requests
+MAX_BATCH_TEXTS = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "64"))
+
+def _authkey() -> bytes:
+    authkey = os.getenv("EMBEDDING_SERVER_AUTHKEY")
+    if not authkey:
+        raise ValueError("EMBEDDING_SERVER_AUTHKEY must be set to use the embedding server.")
+    return authkey.encode("utf-8")
+
+def _spec_key(spec: Dict[str, Any]) -> str:
+    return json.dumps(spec, sort_keys=True)
+
+class EmbeddingServer:
+    """
+    Encodes texts for clients connected over a Unix socket.
+
+    Each connection is served by its own thread, which queues the request
+    and waits. One encoder thread takes every queued request (up to
+    `max_batch_texts` texts) and encodes those with the same embedding spec
+    in one model call. Models are loaded per spec on first use, so an index
+    rebuilt with another backend keeps working without a restart.
+    """
+
+    def __init__(self, address: str, authkey: bytes, max_batch_texts: int = MAX_BATCH_TEXTS):
+        self.address = address
+        self.authkey = authkey
+        self.max_batch_texts = max_batch_texts
+        self._models: Dict[str, Any] = {}
+        self._requests: "queue.Queue" = queue.Queue()
+
+    def load(self, spec: Dict[str, Any]):
+        key = _spec_key(spec)
+        if key not in self._models:
+            self._models[key] = load_embedding_model(spec)
+        return self._models[key]
+
+    def serve_forever(self) -> None:
+        # The socket file is only accessible to this user
+        previous_umask = os.umask(0o077)
+        try:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(previous_umask)
+        threading.Thread(target=self._encode_loop, name="embedding-encoder", daemon=True).start()
+        print(f"Embedding server listening on {self.address}")
+        with listener:
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    # A client that fails authentication must not stop the server
+                    print(f"Embedding server rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def _serve_connection(self, connection) -> None:
+        with connection:
+            while True:
+                try:
+                    spec, texts = connection.recv()
+                except (EOFError, OSError):
+                    return
+                request = {"spec": spec, "texts": texts, "done": threading.Event()}
+                self._requests.put(request)
+                request["done"].wait()
+                connection.send(request["result"])
+
+    def _encode_loop(self) -> None:
+        while True:
+            batch = [self._requests.get()]
+            n_texts = len(batch[0]["texts"])
+            while n_texts < self.max_batch_texts:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_texts += len(request["texts"])
+
+            groups: Dict[str, List[Dict[str, Any]]] = {}
+            for request in batch:
+                groups.setdefault(_spec_key(request["spec"]), []).append(request)
+            for requests in groups.values():
+                self._encode_group(requests)
+
+    def _encode_group(self, requests: List[Dict[str, Any]]) -> None:
+        try:
+            texts = [text for request in requests for text in request["texts"]]
+            embeddings = np.asarray(self.load(requests[0]["spec"]).encode(texts), dtype=np.float32)
+            start = 0
+            for request in requests:
+                end = start + len(request["texts"])
+                request["result"] = ("ok", embeddings[start:end])
+                start = end
+        except Exception as e:
+            for request in requests:
+                request["result"] = ("error", f"{type(e).__name__}: {e}")
+        for request in requests:
+            request["done"].set()
+
+class RemoteEmbeddingModel:
+    """
+    Stand-in for the SentenceTransformer in app.rag that encodes in the embedding server.
+
+    Every thread (and every forked process) opens its own connection on first
+    use, since one connection carries one request at a time.
+    """
+
+    def __init__(self, address: str, spec: Dict[str, Any], authkey: Optional[bytes] = None):
+        self.address = address
+        self.spec = spec
+        self.authkey = authkey or _authkey()
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        try:
+            connection = self._connection()
+            connection.send((self.spec, list(texts)))
+            status, payload = connection.recv()
+        except (EOFError, OSError) as e:
+            # Reconnect on the next call, e.g. after the server restarted
+            self._local.connection = None
+            raise ConnectionError(f"Embedding server at {self.address} is unavailable: {e}") from e
+        if status != "ok":
+            raise RuntimeError(f"Embedding server failed to encode: {payload}")
+        return payload
+
+def query_model(spec: Dict[str, Any]):
+    """The model app.rag encodes queries with: the embedding server's when configured, else a local one."""
+    if EMBEDDING_SERVER:
+        return RemoteEmbeddingModel(EMBEDDING_SERVER, spec)
+    return load_embedding_model(spec)
+
+def index_embedding() -> Dict[str, Any]:
+    """Embedding spec of the index on disk, or the configured one when there is no index yet."""
+    from app.vector_index import load_meta
+    from app.rag import INDEX_PATH
+    if not Path(INDEX_PATH).exists():
+        return configured_embedding()
+    return load_meta(INDEX_PATH).get("embedding", LEGACY_EMBEDDING)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", required=True, help="Path of the Unix socket to listen on")
+    args = parser.parse_args()
+
+    server = EmbeddingServer(args.socket, _authkey())
+    # Loaded before listening, so clients only connect once encoding works
+    server.load(index_embedding())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
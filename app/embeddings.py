@@ -0,0 +1,52 @@
+import os
+from typing import Any, Dict, Optional
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# torch:     SentenceTransformer on PyTorch, as before
+# onnx:      the same weights exported to ONNX and run with ONNX Runtime
+# onnx_int8: ONNX with dynamically quantized int8 weights
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx_int8")
+
+# Quantized export shipped in the model repository; pick the variant matching
+# the CPU (e.g. onnx/model_qint8_arm64.onnx or onnx/model_quint8_avx2.onnx)
+DEFAULT_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+def configured_embedding() -> Dict[str, Any]:
+    """The embedding model and backend selected by EMBEDDING_MODEL / EMBEDDING_BACKEND."""
+    return embedding_spec(os.getenv("EMBEDDING_BACKEND", "torch"), os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL_NAME))
+
+def embedding_spec(backend: str, model_name: str = DEFAULT_MODEL_NAME) -> Dict[str, Any]:
+    """
+    Describe an embedding configuration as it is recorded in the index metadata.
+
+    Embeddings from different backends are close but not identical, so the
+    index records the spec it was built with and queries are encoded with
+    the same one.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Choose one of: {', '.join(EMBEDDING_BACKENDS)}")
+    spec = {"model": model_name, "backend": backend}
+    if backend == "onnx_int8":
+        spec["file_name"] = os.getenv("EMBEDDING_INT8_FILE", DEFAULT_INT8_FILE)
+    return spec
+
+# Indexes built before the backend was recorded used the PyTorch model
+LEGACY_EMBEDDING = {"model": DEFAULT_MODEL_NAME, "backend": "torch"}
+
+def load_embedding_model(spec: Optional[Dict[str, Any]] = None):
+    """
+    Load a SentenceTransformer for an embedding spec (default: configured_embedding()).
+
+    The ONNX backends need the sentence-transformers[onnx] extra (see
+    requirements.txt).
+    """
+    spec = spec or configured_embedding()
+    # Imported here so tools that never encode don't pay for loading torch
+    from sentence_transformers import SentenceTransformer
+
+    if spec["backend"] == "torch":
+        return SentenceTransformer(spec["model"])
+    if spec["backend"] == "onnx":
+        return SentenceTransformer(spec["model"], backend="onnx")
+    return SentenceTransformer(spec["model"], backend="onnx", model_kwargs={"file_name": spec["file_name"]})
@@ -1,20 +1,771 @@
 import os
-import pdfplumber
-import faiss
-import pickle
+import argparse
+import hashlib
+import multiprocessing
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
 import json
+import numpy as np
+from app.sparse import BM25Builder, SparseBM25Index, tokenize
+from app.chunk_store import ChunkStore, ChunkStoreWriter
+from app.chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_CHUNK_OVERLAP, chunk_pages
+from app.dedup import DEFAULT_THRESHOLD as DEFAULT_QA_DEDUP_THRESHOLD, near_duplicate_clusters
+from app.question_index import QuestionIndex
+from app.partitions import PartitionedIndex, stored_vectors
+from app.embeddings import EMBEDDING_BACKENDS, LEGACY_EMBEDDING, configured_embedding, embedding_spec, load_embedding_model
+from app.vector_index import (
+    INDEX_TYPES, create_index, add_vectors, needs_training, save_index, load_index, supports_removal
+)
 
 # Get the project root directory (parent of 'app' directory)
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data" / "legal_docs"
 INDEX_DIR = BASE_DIR / "faiss_index"
+INDEX_PATH = INDEX_DIR / "index.faiss"
+CHUNK_STORE_DIR = INDEX_DIR / "chunks"
+BM25_DIR = INDEX_DIR / "bm25"
+QUESTION_INDEX_DIR = INDEX_DIR / "questions"
+PARTITIONS_DIR = INDEX_DIR / "partitions"
+MANIFEST_PATH = INDEX_DIR / "manifest.json"
+CHECKPOINT_DIR = INDEX_DIR / ".ingest_checkpoint"
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# 2: chunk ids also hash the chunk metadata; older manifests force a full rebuild
+MANIFEST_VERSION = 2
 
-def ingest_documents():
+DEFAULT_BATCH_SIZE = 64
+# Pages parsed per worker task, so one large PDF is spread over several workers
+PDF_PAGES_PER_TASK = 25
+# IVF training sample size per cell, and vectors added to a trained IVF index per call
+TRAIN_SAMPLES_PER_CELL = 256
+IVF_ADD_BATCH = 16384
+PROGRESS_INTERVAL = 2.0
+
+model = None
+# Embedding spec (app.embeddings) the model is loaded with, set by ingest_documents
+model_embedding = None
+
+def _get_model():
+    # Loaded on first use so importing this module (or --help) stays fast
+    global model
+    if model is None:
+        model = load_embedding_model(model_embedding)
+    return model
+
+def _use_embedding(embedding):
+    global model, model_embedding
+    if embedding != model_embedding:
+        model = None
+        model_embedding = embedding
+
+def file_sha256(file_path):
+    """Content hash used to detect changed source files."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(source, content, occurrence=0, metadata=None):
+    """
+    Stable 63-bit id for a chunk.
+
+    Derived from the source file name, the chunk text and its metadata, so an
+    unchanged chunk keeps its id (and its stored records) when other parts of
+    the file change, while a chunk whose page, section or alternate questions
+    changed gets a new one and is re-indexed. `occurrence` tells apart
+    identical chunks within the same file.
+    """
+    key = f"{source}\0{occurrence}\0{content}\0{json.dumps(metadata or {}, sort_keys=True)}"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFFFFFFFFFFFFFF
+
+def _read_pdf_pages(file_path, start=0, end=None):
+    """Extract the text of pages [start, end) of a PDF, "" for pages without text."""
+    import pdfplumber
+    with pdfplumber.open(str(file_path)) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages[start:end]]
+
+def _text_chunks(file, doc_type, pages, chunking):
+    """
+    Chunk the (page_number, text) pages of a PDF or TXT file.
+
+    Page numbers and the enclosing section heading are kept in each chunk's
+    metadata.
+    """
+    chunking = chunking or default_chunking()
     texts = []
+    for chunk in chunk_pages(pages, chunking["max_tokens"], chunking["overlap_tokens"]):
+        metadata = {"source": file, "type": doc_type}
+        if chunk["page"] is not None:
+            metadata["page"] = chunk["page"]
+            if chunk["page_end"] != chunk["page"]:
+                metadata["page_end"] = chunk["page_end"]
+        if chunk["section"]:
+            metadata["section"] = chunk["section"]
+        texts.append({"content": chunk["content"], "metadata": metadata})
+    return texts
+
+def default_chunking():
+    """
+    Chunking settings from INGEST_CHUNK_TOKENS, INGEST_CHUNK_OVERLAP and
+    INGEST_QA_DEDUP_THRESHOLD (0 keeps every QA pair).
+    """
+    return {
+        "max_tokens": int(os.getenv("INGEST_CHUNK_TOKENS", str(DEFAULT_CHUNK_TOKENS))),
+        "overlap_tokens": int(os.getenv("INGEST_CHUNK_OVERLAP", str(DEFAULT_CHUNK_OVERLAP))),
+        "qa_dedup_threshold": float(os.getenv("INGEST_QA_DEDUP_THRESHOLD", str(DEFAULT_QA_DEDUP_THRESHOLD)))
+    }
+
+def _collapse_qa_pairs(file, qa_pairs, threshold):
+    """
+    Keep one question/answer pair per cluster of near-duplicates.
+
+    The JSON corpora phrase many questions several ways with nearly the same
+    answer. The first pair of each cluster is indexed, and the questions of
+    the others are kept in its metadata as "alternate_questions".
+    """
+    texts = [f"Question: {item['question']}\nAnswer: {item['answer']}" for item in qa_pairs]
+    clusters = near_duplicate_clusters(texts, threshold) if threshold else [[i] for i in range(len(texts))]
+    chunks = []
+    for cluster in clusters:
+        first = cluster[0]
+        metadata = {"source": file, "type": "json_qa"}
+        alternates = [qa_pairs[i]["question"] for i in cluster[1:]]
+        if alternates:
+            metadata["alternate_questions"] = alternates
+        chunks.append({"content": texts[first], "metadata": metadata})
+    return chunks
+
+def sparse_text(chunk):
+    """Text indexed by BM25 for a chunk: its content plus any alternate questions."""
+    alternates = chunk["metadata"].get("alternate_questions")
+    if not alternates:
+        return chunk["content"]
+    return "\n".join([chunk["content"], *alternates])
+
+def _assign_ids(file, texts):
+    seen = {}
+    for chunk in texts:
+        occurrence = seen.get(chunk["content"], 0)
+        seen[chunk["content"]] = occurrence + 1
+        chunk["id"] = chunk_id(file, chunk["content"], occurrence, chunk["metadata"])
+    return texts
+
+def extract_chunks(file, data_dir=None, chunking=None):
+    """
+    Extract the text chunks of one source file.
+
+    PDF and TXT files are split into token-bounded chunks. Every JSON
+    question/answer pair is one chunk, except that near-duplicate pairs are
+    collapsed into one (see _collapse_qa_pairs).
+
+    Args:
+        file: File name inside the data directory
+        data_dir: Directory holding the file (default: DATA_DIR)
+        chunking: {"max_tokens", "overlap_tokens", "qa_dedup_threshold"}
+            (default: default_chunking())
+
+    Returns:
+        A list of {"id", "content", "metadata"} dicts
+    """
+    file_path = Path(data_dir or DATA_DIR) / file
+    texts = []
+    if file.endswith(".pdf"):
+        page_texts = _read_pdf_pages(file_path)
+        texts = _text_chunks(file, "pdf", enumerate(page_texts, 1), chunking)
+
+    elif file.endswith(".txt"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            text = f.read()
+
+        texts = _text_chunks(file, "txt", [(None, text)], chunking)
+
+    elif file.endswith(".json"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if isinstance(data, list):
+            qa_pairs = [item for item in data if "question" in item and "answer" in item]
+            texts = _collapse_qa_pairs(file, qa_pairs, (chunking or default_chunking())["qa_dedup_threshold"])
+
+    return _assign_ids(file, texts)
+
+def _file_tasks(data_dir, file, split_pdfs, chunking):
+    """
+    Split a file into parse tasks of (data_dir, file, page_range, chunking).
+
+    Large PDFs are split into page ranges so several workers can parse one
+    document; every other file is a single task with page_range None.
+    """
+    if split_pdfs and file.endswith(".pdf"):
+        try:
+            import pdfplumber
+            with pdfplumber.open(str(data_dir / file)) as pdf:
+                n_pages = len(pdf.pages)
+        except Exception:
+            # Let the worker hit (and report) the same error
+            n_pages = 0
+        if n_pages > PDF_PAGES_PER_TASK:
+            return [
+                (data_dir, file, (start, min(start + PDF_PAGES_PER_TASK, n_pages)), chunking)
+                for start in range(0, n_pages, PDF_PAGES_PER_TASK)
+            ]
+    return [(data_dir, file, None, chunking)]
+
+def _parse_task(task):
+    data_dir, file, page_range, chunking = task
+    if page_range is None:
+        return extract_chunks(file, data_dir, chunking)
+    return _read_pdf_pages(data_dir / file, *page_range)
+
+def _parse_results(tasks, workers):
+    """Run parse tasks, yielding (task, result, error) in task order."""
+    if workers <= 1:
+        for task in tasks:
+            try:
+                yield task, _parse_task(task), None
+            except Exception as e:
+                yield task, None, e
+        return
+
+    # Spawned rather than forked workers: the parent may already hold the
+    # embedding model and its thread pools, which do not survive a fork
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        task_iter = iter(tasks)
+        # Only a few tasks run ahead of the consumer, which bounds the parsed text held in memory
+        pending = deque((task, executor.submit(_parse_task, task)) for task in islice(task_iter, 2 * workers))
+        while pending:
+            task, future = pending.popleft()
+            next_task = next(task_iter, None)
+            if next_task is not None:
+                pending.append((next_task, executor.submit(_parse_task, next_task)))
+            try:
+                yield task, future.result(), None
+            except Exception as e:
+                yield task, None, e
+
+def iter_file_chunks(files, workers=1, data_dir=None, chunking=None):
+    """
+    Parse source files, in parallel when workers > 1.
+
+    Yields (file, chunks, error) in the order of `files`; `error` is the
+    exception that stopped the file from being parsed, with chunks empty.
+    """
+    data_dir = Path(data_dir or DATA_DIR)
+    chunking = chunking or default_chunking()
+    file_tasks = [(file, _file_tasks(data_dir, file, workers > 1, chunking)) for file in files]
+    results = _parse_results([task for _, tasks in file_tasks for task in tasks], workers)
+
+    for file, tasks in file_tasks:
+        parts = []
+        error = None
+        for _ in tasks:
+            _, result, task_error = next(results)
+            error = error or task_error
+            parts.append(result)
+        if error is not None:
+            yield file, [], error
+        elif tasks[0][2] is None:
+            yield file, parts[0], None
+        else:
+            # Page ranges arrive in order, so positions in the joined list are page numbers
+            page_texts = [page for part in parts for page in part]
+            yield file, _assign_ids(file, _text_chunks(file, "pdf", enumerate(page_texts, 1), chunking)), None
+
+def load_manifest():
+    if not MANIFEST_PATH.exists():
+        return None
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def save_manifest(manifest):
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+def _set_torch_threads(threads):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+def _encode(texts, batch_size):
+    embeddings = _get_model().encode(texts, batch_size=batch_size)
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+def _batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class EmbeddingCheckpoint:
+    """
+    Embeddings produced so far by a full rebuild.
+
+    Every encoded batch is appended to a raw float32 file, next to the ids of
+    its chunks, and the count is recorded in state.json. When a run is
+    interrupted, the next one reuses the stored vectors for the chunks it
+    finds again in the same position instead of encoding them again.
+
+    The file doubles as the source of IVF training samples, since IVF indexes
+    only accept vectors once trained.
+    """
+
+    def __init__(self, directory, embedding):
+        self.directory = Path(directory)
+        self.vectors_path = self.directory / "embeddings.f32"
+        self.ids_path = self.directory / "ids.i64"
+        self.state_path = self.directory / "state.json"
+        self.embedding = embedding
+        self.position = 0
+        self.embedded = 0
+        self.dimension = None
+
+        state = self._read_state()
+        if state is not None and state.get("embedding") == embedding:
+            self.embedded = state["embedded"]
+            self.dimension = state["dimension"]
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        # Drop anything appended after the last recorded batch
+        self._truncate(self.embedded)
+        if self.embedded:
+            print(f"Resuming from checkpoint: {self.embedded} chunk(s) already embedded")
+
+        self._vectors_file = open(self.vectors_path, "ab")
+        self._ids_file = open(self.ids_path, "ab")
+
+    def _read_state(self):
+        if not (self.state_path.exists() and self.vectors_path.exists() and self.ids_path.exists()):
+            return None
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_state(self):
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"embedding": self.embedding, "embedded": self.embedded, "dimension": self.dimension}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _truncate(self, count):
+        self.embedded = count
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(count * (self.dimension or 0) * 4)
+        with open(self.ids_path, "ab") as f:
+            f.truncate(count * 8)
+
+    def _read(self, path, dtype, start, count, width=1):
+        itemsize = np.dtype(dtype).itemsize
+        return np.fromfile(path, dtype=dtype, count=count * width, offset=start * width * itemsize).reshape(count, width)
+
+    def embed(self, chunks, batch_size):
+        """Return the embeddings of the next batch of chunks in the stream."""
+        start = self.position
+        self.position += len(chunks)
+        ids = np.array([c["id"] for c in chunks], dtype=np.int64)
+
+        reused = max(0, min(self.position, self.embedded) - start)
+        if reused:
+            stored_ids = self._read(self.ids_path, np.int64, start, reused).ravel()
+            mismatch = np.nonzero(stored_ids != ids[:reused])[0]
+            if len(mismatch):
+                # The corpus changed from here on; stored vectors past this point are stale
+                reused = int(mismatch[0])
+                self._truncate(start + reused)
+                self._write_state()
+
+        parts = []
+        if reused:
+            parts.append(self._read(self.vectors_path, np.float32, start, reused, self.dimension))
+        if reused < len(chunks):
+            embeddings = _encode([c["content"] for c in chunks[reused:]], batch_size)
+            self.dimension = embeddings.shape[1]
+            self._vectors_file.write(embeddings.tobytes())
+            self._ids_file.write(ids[reused:].tobytes())
+            self._vectors_file.flush()
+            self._ids_file.flush()
+            self.embedded = self.position
+            self._write_state()
+            parts.append(embeddings)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def vectors(self):
+        """Memory-map every vector embedded in this run."""
+        self._vectors_file.flush()
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.position, self.dimension))
+
+    def remove(self):
+        self._vectors_file.close()
+        self._ids_file.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class _Progress:
+    """Prints chunk throughput at most every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.chunks = 0
+
+    def update(self, n_chunks, files_done, n_files):
+        self.chunks += n_chunks
+        now = time.perf_counter()
+        if now - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = now
+            print(f"  {files_done}/{n_files} files, {self.chunks} chunks embedded ({self.rate():.1f} chunks/s)")
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.chunks / elapsed if elapsed > 0 else 0.0
+
+def _collapsed_pairs(chunks):
+    return sum(len(c["metadata"].get("alternate_questions", ())) for c in chunks)
+
+def _report_collapsed(n_indexed, n_collapsed, dimension):
+    """Print how much near-duplicate collapsing shrank the indexed QA pairs."""
+    if not n_collapsed:
+        return
+    total = n_indexed + n_collapsed
+    saved_mb = n_collapsed * dimension * 4 / (1024 * 1024)
+    print(
+        f"Collapsed {n_collapsed} near-duplicate QA pair(s): {n_indexed} of {total} chunks indexed "
+        f"({100 * n_collapsed / total:.1f}% fewer vectors, ~{saved_mb:.1f} MB of float32 embeddings saved)"
+    )
+
+def _report_partitions(partitions):
+    print("Partitions: " + ", ".join(f"{name} ({size} chunks)" for name, size in sorted(partitions.sizes.items())))
+
+def _save_stores(store_writer, bm25, questions, partitions, index, index_meta, manifest):
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    store_writer.close()
+    bm25.save(BM25_DIR)
+    questions.save(QUESTION_INDEX_DIR)
+    partitions.save(PARTITIONS_DIR)
+    # The index is written last: the API reloads once it sees the index change
+    save_index(index, index_meta, INDEX_PATH)
+    save_manifest(manifest)
+
+def _train_and_fill(checkpoint, ids, index_type, index_params):
+    """Build an IVF index from the vectors spilled to the checkpoint."""
+    vectors = checkpoint.vectors()
+    n_vectors, dimension = vectors.shape
+    index, index_meta = create_index(dimension, index_type, n_vectors=n_vectors, with_ids=True, **index_params)
+
+    n_train = min(n_vectors, index_meta["build_params"]["nlist"] * TRAIN_SAMPLES_PER_CELL)
+    sample = np.sort(np.random.default_rng(0).choice(n_vectors, n_train, replace=False))
+    print(f"Training '{index_type}' index on {n_train} of {n_vectors} vectors...")
+    index.train(np.ascontiguousarray(vectors[sample]))
+
+    for start in range(0, n_vectors, IVF_ADD_BATCH):
+        end = start + IVF_ADD_BATCH
+        add_vectors(index, vectors[start:end], ids[start:end])
+    index_meta["ntotal"] = int(index.ntotal)
+    return index, index_meta
+
+def _full_rebuild(supported_files, file_hashes, index_type, index_params, embedding, chunking, workers, batch_size):
+    """
+    Re-parse, embed and index every file as one stream.
+
+    Parsed chunks flow straight into the chunk store writer, the BM25 builder
+    and the embedding batches, so memory holds one batch of texts rather than
+    the corpus. Flat and HNSW indexes receive vectors batch by batch; IVF
+    indexes are trained on a sample of the checkpointed vectors at the end.
+    The questions of QA chunks are embedded a second time, on their own, for
+    the question index. Every chunk's vector and tokens also go to the
+    partition of its source corpus.
+    """
+    print(f"Found {len(supported_files)} file(s). Processing with {workers} worker(s), batch size {batch_size}...")
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+
+    checkpoint = EmbeddingCheckpoint(CHECKPOINT_DIR, embedding)
+    store_writer = ChunkStoreWriter(CHUNK_STORE_DIR)
+    bm25_builder = BM25Builder()
+    questions = QuestionIndex()
+    partitions = PartitionedIndex(index_type=index_type, index_params=index_params)
+    manifest_files = {}
+    index = None
+    index_meta = None
+    progress = _Progress()
+    collapsed = 0
+
+    def chunk_stream():
+        nonlocal collapsed
+        for file, chunks, error in iter_file_chunks(supported_files, workers, chunking=chunking):
+            if error is not None:
+                print(f"Error processing {file}: {error}")
+                continue
+            print(f"Processing: {file} ({len(chunks)} chunks)")
+            manifest_files[file] = {"sha256": file_hashes[file], "chunk_ids": [c["id"] for c in chunks]}
+            collapsed += _collapsed_pairs(chunks)
+            yield from chunks
+
+    for batch in _batched(chunk_stream(), batch_size):
+        embeddings = checkpoint.embed(batch, batch_size)
+        ids = np.array([c["id"] for c in batch], dtype=np.int64)
+        if not needs_training(index_type):
+            if index is None:
+                index, index_meta = create_index(embeddings.shape[1], index_type, with_ids=True, **index_params)
+            add_vectors(index, embeddings, ids)
+        questions.add_chunks(batch, lambda texts: _encode(texts, batch_size))
+        tokens = [tokenize(sparse_text(chunk)) for chunk in batch]
+        partitions.add_chunks(batch, embeddings, tokens)
+        for chunk, chunk_tokens in zip(batch, tokens):
+            store_writer.add(chunk)
+            bm25_builder.add_document(chunk_tokens)
+        progress.update(len(batch), len(manifest_files), len(supported_files))
+
+    if not len(store_writer):
+        checkpoint.remove()
+        print("No text extracted from PDF files. Please check your PDF files.")
+        return
+
+    print(f"Embedded {progress.chunks} chunks in {progress.elapsed():.1f}s ({progress.rate():.1f} chunks/s)")
+    _report_collapsed(len(store_writer), collapsed, checkpoint.dimension)
+
+    if needs_training(index_type):
+        index, index_meta = _train_and_fill(checkpoint, store_writer.ids, index_type, index_params)
+    else:
+        index_meta["ntotal"] = int(index.ntotal)
+    # Recorded so the API encodes queries with the same model and backend
+    index_meta["embedding"] = embedding
+
+    print("Creating BM25 sparse index...")
+    bm25 = bm25_builder.build()
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "index_type": index_type,
+        "index_params": index_params,
+        "embedding": embedding,
+        "chunking": chunking,
+        "question_index": True,
+        "partitions": True,
+        "files": manifest_files
+    }
+    print(f"Question index: {len(questions)} stored question(s)")
+    _report_partitions(partitions)
+    _save_stores(store_writer, bm25, questions, partitions, index, index_meta, manifest)
+    checkpoint.remove()
+
+    print(f"Ingestion completed. Index saved to {INDEX_DIR}/")
+    print(f"Total documents indexed: {len(store_writer)}")
+
+def _diff_files(manifest, supported_files, file_hashes):
+    """Return the (new or changed, deleted) source files relative to the manifest."""
+    old_files = manifest["files"]
+    changed = [f for f in supported_files if f not in old_files or old_files[f]["sha256"] != file_hashes[f]]
+    deleted = [f for f in old_files if f not in file_hashes]
+    return changed, deleted
+
+def _reusable_vectors(index, store, removed_rows, new_chunks):
+    """
+    Stored vectors of removed chunks whose text reappears among the new chunks.
+
+    A chunk whose metadata changed (e.g. it moved to another page) gets a new
+    id, but its text and so its embedding are the same. Returns {new chunk
+    id: vector}, empty when the index cannot return its vectors.
+    """
+    new_ids_by_content = {}
+    for chunk in new_chunks:
+        new_ids_by_content.setdefault(chunk["content"], []).append(chunk["id"])
+    old_ids = {}
+    for row in removed_rows:
+        content = store.content(row)
+        if content in new_ids_by_content and content not in old_ids:
+            old_ids[content] = store.ids[row]
+    vectors = stored_vectors(index, np.array(list(old_ids.values()), dtype=np.int64))
+    if vectors is None:
+        return {}
+    return {
+        new_id: vector
+        for content, vector in zip(old_ids, vectors)
+        for new_id in new_ids_by_content[content]
+    }
+
+def _embed_chunks(chunks, reused, dimension, batch_size):
+    """Embeddings of chunks, encoding only those without a reused vector."""
+    embeddings = np.empty((len(chunks), dimension), dtype=np.float32)
+    missing = []
+    for row, chunk in enumerate(chunks):
+        vector = reused.get(chunk["id"])
+        if vector is None:
+            missing.append(row)
+        else:
+            embeddings[row] = vector
+    if missing:
+        embeddings[missing] = _encode([chunks[row]["content"] for row in missing], batch_size)
+    return embeddings
+
+def _incremental_update(manifest, changed, deleted, file_hashes, chunking, workers, batch_size):
+    """
+    Apply added, changed and deleted source files to the existing stores.
+
+    Only chunks whose ids are new are indexed, and of those only chunks whose
+    text is new are embedded; chunks that disappeared are removed from the
+    FAISS index by id, from BM25, from the question index, from their
+    partition and from the text store.
+    """
+    old_files = manifest["files"]
+    print(f"Incremental update: {len(changed)} new/changed file(s), {len(deleted)} deleted file(s)")
+
+    removed_ids = set()
+    new_chunks = []
+    parsed = 0
+    collapsed = 0
+    manifest_files = dict(old_files)
+
+    for file in deleted:
+        print(f"Removing: {file}")
+        removed_ids.update(old_files[file]["chunk_ids"])
+        del manifest_files[file]
+
+    for file, chunks, error in iter_file_chunks(changed, workers, chunking=chunking):
+        if error is not None:
+            # Leave the old entry so the file is retried on the next run
+            print(f"Error processing {file}: {error}")
+            continue
+        print(f"Processing: {file}")
+        parsed += len(chunks)
+        collapsed += _collapsed_pairs(chunks)
+        old_ids = set(old_files.get(file, {}).get("chunk_ids", []))
+        new_ids = {c["id"] for c in chunks}
+        removed_ids.update(old_ids - new_ids)
+        new_chunks.extend(c for c in chunks if c["id"] not in old_ids)
+        manifest_files[file] = {"sha256": file_hashes[file], "chunk_ids": [c["id"] for c in chunks]}
+
+    index, index_meta = load_index(INDEX_PATH)
+    store = ChunkStore.open(CHUNK_STORE_DIR)
+    bm25 = SparseBM25Index.load(BM25_DIR)
+
+    removed = np.array(sorted(removed_ids), dtype=np.int64)
+    is_removed = np.isin(store.ids, removed)
+    # Read before the removed vectors leave the index
+    reused = _reusable_vectors(index, store, np.nonzero(is_removed)[0], new_chunks)
+    if removed_ids:
+        index.remove_ids(removed)
+        bm25.remove_documents(np.nonzero(is_removed)[0])
+    store_writer = ChunkStoreWriter(CHUNK_STORE_DIR)
+    for row in np.nonzero(~is_removed)[0]:
+        store_writer.add(store[row])
+
+    def encode(texts):
+        return _encode(texts, batch_size)
+
+    if QuestionIndex.exists(QUESTION_INDEX_DIR):
+        questions = QuestionIndex.load(QUESTION_INDEX_DIR)
+        questions.remove_chunks(removed_ids)
+    else:
+        # Built before the question index existed: index the questions of the kept chunks
+        questions = QuestionIndex()
+        for rows in _batched(np.nonzero(~is_removed)[0], batch_size):
+            questions.add_chunks(store.get_many(rows), encode)
+    questions.add_chunks(new_chunks, encode)
+
+    if PartitionedIndex.exists(PARTITIONS_DIR):
+        partitions = PartitionedIndex.open(PARTITIONS_DIR)
+        partitions.remove_chunks(removed_ids)
+    else:
+        # Built before partitions existed: partition the kept chunks, reusing
+        # their stored vectors where the index can return them
+        partitions = PartitionedIndex(index_type=manifest["index_type"], index_params=manifest["index_params"])
+        for rows in _batched(np.nonzero(~is_removed)[0], batch_size):
+            chunks = store.get_many(rows)
+            embeddings = stored_vectors(index, store.ids[rows])
+            if embeddings is None:
+                embeddings = encode([c["content"] for c in chunks])
+            partitions.add_chunks(chunks, embeddings, [tokenize(sparse_text(c)) for c in chunks])
+
+    if new_chunks:
+        print(f"Indexing {len(new_chunks)} new chunk(s), {len(reused)} with their stored embedding...")
+        progress = _Progress()
+        new_tokens = []
+        for batch in _batched(new_chunks, batch_size):
+            embeddings = _embed_chunks(batch, reused, index.d, batch_size)
+            add_vectors(index, embeddings, np.array([c["id"] for c in batch], dtype=np.int64))
+            tokens = [tokenize(sparse_text(c)) for c in batch]
+            partitions.add_chunks(batch, embeddings, tokens)
+            new_tokens.extend(tokens)
+            for chunk in batch:
+                store_writer.add(chunk)
+            progress.update(len(batch), len(changed), len(changed))
+        print(f"Embedded {progress.chunks} chunks in {progress.elapsed():.1f}s ({progress.rate():.1f} chunks/s)")
+        bm25.add_documents(new_tokens)
+
+    _report_collapsed(parsed, collapsed, index.d)
+    index_meta["ntotal"] = int(index.ntotal)
+    manifest["files"] = manifest_files
+    manifest["question_index"] = True
+    manifest["partitions"] = True
+    _report_partitions(partitions)
+    _save_stores(store_writer, bm25, questions, partitions, index, index_meta, manifest)
+
+    print(f"Removed {len(removed_ids)} chunk(s), added {len(new_chunks)} chunk(s).")
+    print(f"Total documents indexed: {len(store_writer)}")
+
+def default_workers():
+    return min(4, os.cpu_count() or 1)
+
+def ingest_documents(
+    index_type=None,
+    index_params=None,
+    rebuild=False,
+    workers=None,
+    batch_size=None,
+    threads=None,
+    embedding_backend=None,
+    chunking=None
+):
+    """
+    Build or update the FAISS, BM25, question, partition and text stores from the files in DATA_DIR.
+
+    By default only source files whose content hash differs from the manifest
+    are re-processed. A full rebuild happens when `rebuild` is set, when no
+    compatible manifest exists, when the index type or parameters change, or
+    when the index type cannot remove vectors (HNSW).
+
+    Args:
+        index_type: FAISS index layout (one of INDEX_TYPES); defaults to the
+            FAISS_INDEX_TYPE environment variable, or "flat"
+        index_params: Extra build/search parameters for build_index, e.g.
+            {"nlist": 256, "nprobe": 16} or {"hnsw_m": 32, "ef_search": 64}
+        rebuild: Re-embed and re-index every file
+        workers: Parser processes (default: INGEST_WORKERS, or min(4, CPUs));
+            1 parses in this process
+        batch_size: Chunks embedded per batch (default: INGEST_BATCH_SIZE, or 64)
+        threads: Torch threads used for embedding (default: INGEST_THREADS, or
+            the torch default)
+        embedding_backend: One of app.embeddings.EMBEDDING_BACKENDS (default:
+            EMBEDDING_BACKEND, or "torch"); changing it re-embeds every file
+        chunking: {"max_tokens", "overlap_tokens"} for PDF/TXT chunks and
+            {"qa_dedup_threshold"} for JSON QA pairs (default:
+            INGEST_CHUNK_TOKENS / INGEST_CHUNK_OVERLAP /
+            INGEST_QA_DEDUP_THRESHOLD, or 256 / 32 / 0.6); changing it
+            re-chunks every file
+    """
+    index_type = index_type or os.getenv("FAISS_INDEX_TYPE", "flat")
+    index_params = index_params or {}
+    workers = workers or int(os.getenv("INGEST_WORKERS", "0")) or default_workers()
+    batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", str(DEFAULT_BATCH_SIZE)))
+    threads = threads or int(os.getenv("INGEST_THREADS", "0"))
+    embedding = configured_embedding()
+    if embedding_backend:
+        embedding = embedding_spec(embedding_backend, embedding["model"])
+    _use_embedding(embedding)
+    chunking = {**default_chunking(), **(chunking or {})}
 
     if not DATA_DIR.exists():
         DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -24,98 +775,83 @@ def ingest_documents():
     if not DATA_DIR.is_dir():
         raise ValueError(f"{DATA_DIR} exists but is not a directory")
 
-    supported_files = [f for f in os.listdir(str(DATA_DIR)) if f.endswith(".pdf") or f.endswith(".txt") or f.endswith(".json")]
-    
+    supported_files = sorted(f for f in os.listdir(str(DATA_DIR)) if f.endswith(".pdf") or f.endswith(".txt") or f.endswith(".json"))
+
     if not supported_files:
         print(f"No PDF, TXT, or JSON files found in {DATA_DIR}")
         print(f"Please add files to {DATA_DIR} and run this script again.")
         return
 
-    print(f"Found {len(supported_files)} file(s). Processing...")
-    
-    for file in supported_files:
-        file_path = DATA_DIR / file
-        print(f"Processing: {file}")
-        try:
-            text = ""
-            if file.endswith(".pdf"):
-                with pdfplumber.open(str(file_path)) as pdf:
-                    for i, page in enumerate(pdf.pages):
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
-                
-                if text:
-                    texts.append({
-                        "content": text,
-                        "metadata": {
-                            "source": file,
-                            "type": "pdf" 
-                        }
-                    })
-
-            elif file.endswith(".txt"):
-                with open(file_path, "r", encoding="utf-8") as f:
-                    text = f.read()
-
-                if text:
-                    texts.append({
-                        "content": text,
-                        "metadata": {
-                            "source": file,
-                            "type": "txt"
-                        }
-                    })
-
-            elif file.endswith(".json"):
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    
-                if isinstance(data, list):
-                    for item in data:
-                        if "question" in item and "answer" in item:
-                            qa_text = f"Question: {item['question']}\nAnswer: {item['answer']}"
-                            texts.append({
-                                "content": qa_text,
-                                "metadata": {
-                                    "source": file,
-                                    "type": "json_qa"
-                                }
-                            })
-        except Exception as e:
-            print(f"Error processing {file}: {e}")
-            continue
-
-    if not texts:
-        print("No text extracted from PDF files. Please check your PDF files.")
-        return
-
-    print(f"Extracted {len(texts)} text chunks. Creating embeddings...")
-    # Extract just the text content for embedding
-    text_contents = [t["content"] for t in texts]
-    embeddings = model.encode(text_contents)
-    print(f"Created embeddings with shape: {embeddings.shape}")
+    file_hashes = {f: file_sha256(DATA_DIR / f) for f in supported_files}
 
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
+    _set_torch_threads(threads)
 
-    INDEX_DIR.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, str(INDEX_DIR / "index.faiss"))
-
-    # Create and save BM25 index
-    print("Creating BM25 sparse index...")
-    from rank_bm25 import BM25Okapi
-    tokenized_corpus = [doc.split() for doc in text_contents]
-    bm25 = BM25Okapi(tokenized_corpus)
-    
-    with open(INDEX_DIR / "bm25_index.pkl", "wb") as f:
-        pickle.dump(bm25, f)
-
-    with open(INDEX_DIR / "texts.pkl", "wb") as f:
-        pickle.dump(texts, f)
+    manifest = None if rebuild else load_manifest()
+    stores_exist = INDEX_PATH.exists() and ChunkStore.exists(CHUNK_STORE_DIR) and BM25_DIR.exists()
+    if (
+        manifest is None
+        or not stores_exist
+        or manifest.get("index_type") != index_type
+        or manifest.get("index_params") != index_params
+        or manifest.get("embedding", LEGACY_EMBEDDING) != embedding
+        or manifest.get("chunking") != chunking
+    ):
+        _full_rebuild(supported_files, file_hashes, index_type, index_params, embedding, chunking, workers, batch_size)
+        return
 
-    print(f"Ingestion completed. Index saved to {INDEX_DIR}/")
-    print(f"Total documents indexed: {len(texts)}")
+    changed, deleted = _diff_files(manifest, supported_files, file_hashes)
+    if not changed and not deleted and manifest.get("question_index") and manifest.get("partitions"):
+        print("Index is up to date. No source files changed.")
+    elif (changed or deleted) and not supports_removal(index_type):
+        print(f"'{index_type}' indexes cannot remove vectors; rebuilding the full index.")
+        _full_rebuild(supported_files, file_hashes, index_type, index_params, embedding, chunking, workers, batch_size)
+    else:
+        _incremental_update(manifest, changed, deleted, file_hashes, chunking, workers, batch_size)
 
 if __name__ == "__main__":
-    ingest_documents()
+    parser = argparse.ArgumentParser(description="Build the legal document indexes.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None, help="FAISS index layout (default: flat)")
+    parser.add_argument("--nlist", type=int, help="IVF cells (default: 4*sqrt(N))")
+    parser.add_argument("--nprobe", type=int, help="IVF cells searched per query")
+    parser.add_argument("--pq-m", type=int, help="Sub-quantizers for ivf_pq")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, help="HNSW build-time search depth")
+    parser.add_argument("--ef-search", type=int, help="HNSW query-time search depth")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index every file instead of only changed ones")
+    parser.add_argument("--workers", type=int, help="Parser processes (default: min(4, CPUs))")
+    parser.add_argument("--batch-size", type=int, help=f"Chunks embedded per batch (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--threads", type=int, help="Torch threads used for embedding")
+    parser.add_argument("--chunk-tokens", type=int, help=f"Max tokens per PDF/TXT chunk (default: {DEFAULT_CHUNK_TOKENS})")
+    parser.add_argument("--chunk-overlap", type=int, help=f"Tokens shared by neighbouring chunks (default: {DEFAULT_CHUNK_OVERLAP})")
+    parser.add_argument(
+        "--qa-dedup-threshold", type=float,
+        help=f"Word-shingle Jaccard similarity above which QA pairs are collapsed; 0 disables (default: {DEFAULT_QA_DEDUP_THRESHOLD})"
+    )
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, help="Embedding runtime (default: torch)")
+    args = parser.parse_args()
+
+    pipeline_options = (
+        "index_type", "rebuild", "workers", "batch_size", "threads", "embedding_backend", "chunk_tokens", "chunk_overlap",
+        "qa_dedup_threshold"
+    )
+    index_params = {
+        name: value for name, value in vars(args).items()
+        if name not in pipeline_options and value is not None
+    }
+    ingest_documents(
+        index_type=args.index_type,
+        index_params=index_params,
+        rebuild=args.rebuild,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        threads=args.threads,
+        embedding_backend=args.embedding_backend,
+        chunking={
+            name: value for name, value in (
+                ("max_tokens", args.chunk_tokens),
+                ("overlap_tokens", args.chunk_overlap),
+                ("qa_dedup_threshold", args.qa_dedup_threshold)
+            )
+            if value is not None
+        }
+    )
@@ -0,0 +1,411 @@
+"""
+Background jobs for /analyze/jobs.
+
+A submitted document is queued and answered with a job id at once. A fixed
+number of asyncio worker tasks per process run the jobs, so however many
+uploads arrive, at most that many documents are analyzed at a time. PDF
+extraction runs in a small process pool rather than on the event loop's
+thread pool. Clients poll the job for its status, the partial results
+reported so far and finally the result.
+
+Jobs live in memory by default. With ANALYZE_JOBS_DB set they are kept in a
+SQLite file instead, so every worker process on the host (see app.serve) can
+report any job and the pending-job limit covers all of them.
+"""
+import asyncio
+import contextvars
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from app.metrics import analysis_jobs
+
+PENDING_STATUSES = ("queued", "running")
+
+# With a shared store, every process with a job queue records a heartbeat this
+# often; pending jobs of a process that missed ORPHAN_AFTER_BEATS are failed
+HEARTBEAT_SECONDS = float(os.getenv("ANALYZE_JOBS_HEARTBEAT_SECONDS", "10"))
+ORPHAN_AFTER_BEATS = 3
+
+# Reports a job's progress: its current stage plus any partial results
+Report = Callable[..., Awaitable[None]]
+
+class QueueFullError(Exception):
+    """As many jobs are pending as the queue accepts."""
+
+def new_job(filename: str, question: Optional[str], ttl_seconds: float) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "stage": None,
+        "filename": filename,
+        "question": question,
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + ttl_seconds,
+        "partial": {},
+        "result": None,
+        "error": None,
+        "status_code": None,
+        # Process running the job; with a shared store, jobs of a process
+        # that died are failed by whichever process notices
+        "owner": owner_token()
+    }
+
+_owner: Optional[Tuple[int, str]] = None
+
+def owner_token() -> str:
+    """
+    A random id of this process, e.g. "4711-9f2c...".
+
+    Unlike the bare pid it is never reused by a later process (after a
+    restart, containers hand out the same pids again). A forked worker
+    gets its own.
+    """
+    global _owner
+    pid = os.getpid()
+    if _owner is None or _owner[0] != pid:
+        _owner = (pid, f"{pid}-{uuid.uuid4().hex}")
+    return _owner[1]
+
+class MemoryJobStore:
+    """Jobs of this process in a dict; other worker processes cannot see them."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add_if_below(self, job: Dict[str, Any], limit: int) -> bool:
+        """Add the job unless `limit` jobs are already pending; returns whether it was added."""
+        with self._lock:
+            if sum(pending["status"] in PENDING_STATUSES for pending in self._jobs.values()) >= limit:
+                return False
+            self._jobs[job["job_id"]] = dict(job)
+            return True
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def count_pending(self) -> int:
+        with self._lock:
+            return sum(job["status"] in PENDING_STATUSES for job in self._jobs.values())
+
+    def prune(self) -> int:
+        """Drop expired jobs, returning how many."""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job["expires_at"] < now]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def heartbeat(self, owner: str) -> None:
+        # Nothing outlives this process
+        pass
+
+    def fail_orphaned(self) -> int:
+        return 0
+
+class SQLiteJobStore:
+    """
+    Jobs in a SQLite file shared by the worker processes of one host.
+
+    Each job is one row holding its JSON document, with the fields the store
+    queries on (status, owner, expiry) in columns of their own.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, owner TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS owners (owner TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection for one transaction, committed on success and closed afterwards."""
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _write(self, connection: sqlite3.Connection, job: Dict[str, Any]) -> None:
+        connection.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, owner, expires_at, data) VALUES (?, ?, ?, ?, ?)",
+            (job["job_id"], job["status"], job["owner"], job["expires_at"], json.dumps(job))
+        )
+
+    def add_if_below(self, job: Dict[str, Any], limit: int) -> bool:
+        with self._connect() as connection:
+            # Count and insert in one write transaction, so that processes
+            # submitting at the same time cannot all pass the limit
+            connection.execute("BEGIN IMMEDIATE")
+            if self._count_pending(connection) >= limit:
+                return False
+            self._write(connection, job)
+            return True
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._connect() as connection:
+            # Take the write lock before reading, so concurrent updates do not interleave
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is not None:
+                job = json.loads(row[0])
+                job.update(fields, updated_at=time.time())
+                self._write(connection, job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _count_pending(self, connection: sqlite3.Connection) -> int:
+        return connection.execute(
+            f"SELECT COUNT(*) FROM jobs WHERE status IN ({', '.join('?' for _ in PENDING_STATUSES)})",
+            PENDING_STATUSES
+        ).fetchone()[0]
+
+    def count_pending(self) -> int:
+        with self._connect() as connection:
+            return self._count_pending(connection)
+
+    def prune(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("DELETE FROM jobs WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def heartbeat(self, owner: str) -> None:
+        """Record that the process with this owner token is alive."""
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO owners (owner, heartbeat_at) VALUES (?, ?)", (owner, time.time()))
+
+    def fail_orphaned(self) -> int:
+        """
+        Fail pending jobs whose process stopped sending heartbeats, e.g. after
+        a crash or restart.
+        """
+        stale = time.time() - HEARTBEAT_SECONDS * ORPHAN_AFTER_BEATS
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT job_id FROM jobs WHERE status IN ({', '.join('?' for _ in PENDING_STATUSES)}) "
+                "AND owner NOT IN (SELECT owner FROM owners WHERE heartbeat_at >= ?)",
+                PENDING_STATUSES + (stale,)
+            ).fetchall()
+            connection.execute("DELETE FROM owners WHERE heartbeat_at < ?", (stale,))
+        for (job_id,) in rows:
+            self.update(job_id, status="failed", status_code=503, error="The server restarted before the job finished.")
+        return len(rows)
+
+class JobQueue:
+    """
+    Runs submitted jobs on `workers` asyncio tasks.
+
+    At most `max_pending` jobs may be queued or running at once (across all
+    processes with a shared store); further submissions raise
+    QueueFullError. Jobs are kept for `ttl_seconds` after they were last
+    updated, then expire.
+    """
+
+    def __init__(self, store, workers: int = 2, max_pending: int = 32, ttl_seconds: float = 3600):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop (again after stop)."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self.store.heartbeat(owner_token())
+        self.store.fail_orphaned()
+        for _ in range(self.workers):
+            # A fresh context, so jobs do not inherit the submitting request's timings
+            self._tasks.append(asyncio.create_task(self._work(), context=contextvars.Context()))
+        self._tasks.append(asyncio.create_task(self._beat(), context=contextvars.Context()))
+
+    async def stop(self) -> None:
+        """Stop the workers; jobs still queued or running fail."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._queue is not None and not self._queue.empty():
+            job_id, _ = self._queue.get_nowait()
+            await self._finish(job_id, "failed", status_code=503, error="The server shut down before the job ran.")
+
+    async def submit(self, run: Callable[[Report], Awaitable[Dict[str, Any]]], filename: str, question: Optional[str]) -> Dict[str, Any]:
+        """
+        Queue a job and return its initial state.
+
+        Args:
+            run: coroutine function doing the work; it gets a report(stage,
+                **partial) callback and returns the job's result
+            filename: uploaded file name, shown in the job status
+            question: question about the document, if any
+        """
+        self.start()
+        await asyncio.to_thread(self.store.prune)
+        job = new_job(filename, question, self.ttl_seconds)
+        if not await asyncio.to_thread(self.store.add_if_below, job, self.max_pending):
+            self.rejected += 1
+            analysis_jobs.labels(status="rejected").inc()
+            raise QueueFullError(f"{self.max_pending} jobs are already pending; retry later.")
+        self._queue.put_nowait((job["job_id"], run))
+        self.submitted += 1
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The current state of a job, or None when it does not exist or expired."""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["expires_at"] < time.time():
+            return None
+        return job
+
+    async def _update(self, job_id: str, **fields: Any) -> None:
+        await asyncio.to_thread(self.store.update, job_id, expires_at=time.time() + self.ttl_seconds, **fields)
+
+    async def _finish(self, job_id: str, status: str, **fields: Any) -> None:
+        if status == "completed":
+            self.completed += 1
+        else:
+            self.failed += 1
+        analysis_jobs.labels(status=status).inc()
+        await self._update(job_id, status=status, stage=None, **fields)
+
+    async def _beat(self) -> None:
+        """Keep this process's jobs from being taken for orphans, and fail those of dead processes."""
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            try:
+                await asyncio.to_thread(self.store.heartbeat, owner_token())
+                await asyncio.to_thread(self.store.fail_orphaned)
+            except sqlite3.Error as e:
+                print(f"Job heartbeat failed: {e}")
+
+    async def _work(self) -> None:
+        while True:
+            job_id, run = await self._queue.get()
+            partial: Dict[str, Any] = {}
+
+            async def report(stage: str, **results: Any) -> None:
+                partial.update(results)
+                await self._update(job_id, stage=stage, partial=dict(partial))
+
+            try:
+                await self._update(job_id, status="running")
+                result = await run(report)
+            except asyncio.CancelledError:
+                await self._finish(job_id, "failed", status_code=503, error="The server shut down before the job finished.")
+                raise
+            except Exception as e:
+                # HTTPException carries the status and message /analyze would have returned
+                await self._finish(
+                    job_id, "failed",
+                    status_code=getattr(e, "status_code", 500),
+                    error=getattr(e, "detail", None) or f"Error processing document: {e}"
+                )
+            else:
+                await self._finish(job_id, "completed", result=result)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "pending": await asyncio.to_thread(self.store.count_pending),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
+
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+_extraction_pool_lock = threading.Lock()
+
+def extraction_pool() -> ProcessPoolExecutor:
+    """
+    Process pool for PDF extraction in jobs, created on first use.
+
+    Workers are spawned rather than forked, so they start from a clean
+    interpreter instead of a copy of the API process and its model.
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ProcessPoolExecutor(
+                max_workers=int(os.getenv("ANALYZE_JOBS_EXTRACT_PROCESSES", "2")),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _extraction_pool
+
+def _discard_extraction_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool, unless another caller has replaced it already."""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is pool:
+            _extraction_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+async def run_in_extraction_pool(function: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run function(*args) in the extraction pool.
+
+    A worker that died (e.g. the parser crashed on a bad PDF) breaks the
+    whole pool, so the pool is replaced and the call retried once.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = extraction_pool()
+        try:
+            return await loop.run_in_executor(pool, function, *args)
+        except BrokenProcessPool:
+            _discard_extraction_pool(pool)
+            if attempt:
+                raise
+
+def shutdown_extraction_pool() -> None:
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is not None:
+            _extraction_pool.shutdown(wait=False, cancel_futures=True)
+            _extraction_pool = None
+
+def create_job_queue() -> JobQueue:
+    """Build the /analyze job queue from ANALYZE_JOBS_* environment settings."""
+    path = os.getenv("ANALYZE_JOBS_DB")
+    return JobQueue(
+        SQLiteJobStore(path) if path else MemoryJobStore(),
+        workers=int(os.getenv("ANALYZE_JOBS_WORKERS", "2")),
+        max_pending=int(os.getenv("ANALYZE_JOBS_MAX_PENDING", "32")),
+        ttl_seconds=float(os.getenv("ANALYZE_JOBS_TTL_SECONDS", "3600"))
+    )
@@ -1,37 +1,258 @@
-from groq import Groq
+from groq import Groq, AsyncGroq, APIConnectionError, APIStatusError
+import asyncio
+import hashlib
+import httpx
 import os
+import random
+import threading
+import time
 from dotenv import load_dotenv
+from app.config import env_flag
+from app.metrics import llm_coalesced, llm_requests, llm_retries, llm_tokens, record_stage, span
 
 load_dotenv()
 
+MODEL_NAME = "llama-3.1-8b-instant"  # Updated from deprecated llama-3.1-70b-versatile
+TEMPERATURE = 0.1
+MAX_TOKENS = 1200
+
+# Connection pool shared by all Groq calls of the process
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+# Per read of the response; a stream may take longer in total
+TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+# Calls in flight at once; further calls wait for a slot
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+# Rate limits (429), server errors (5xx) and connection failures are retried
+# with exponential backoff and full jitter, or after the server's Retry-After
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+
+# Concurrent identical completions share one Groq call
+SINGLE_FLIGHT = env_flag("LLM_SINGLE_FLIGHT", "true")
+
 client = None
+async_client = None
+# The async client and its limit belong to the event loop they were created in
+_async_loop = None
+_async_limit = None
+_sync_limit = threading.BoundedSemaphore(MAX_CONCURRENCY)
+# Key of an in-flight completion -> the task producing it
+_in_flight = {}
+
+def _get_api_key():
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError(
+            "GROQ_API_KEY environment variable is not set. "
+            "Please create a .env file with your GROQ_API_KEY."
+        )
+    return api_key
+
+def _pool_options():
+    return {
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_SECONDS
+        ),
+        "timeout": httpx.Timeout(TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+    }
 
 def _get_client():
     global client
     if client is None:
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError(
-                "GROQ_API_KEY environment variable is not set. "
-                "Please create a .env file with your GROQ_API_KEY."
-            )
-        client = Groq(api_key=api_key)
+        # Retries are done by _with_retries, so the SDK's own are turned off
+        client = Groq(api_key=_get_api_key(), max_retries=0, http_client=httpx.Client(**_pool_options()))
     return client
 
+def _get_async_client():
+    global async_client, _async_loop, _async_limit
+    loop = asyncio.get_running_loop()
+    if async_client is None or _async_loop is not loop:
+        if async_client is not None and _async_loop.is_running():
+            # Its connections belong to the other loop, so they are closed there;
+            # a client whose loop has finished can no longer be closed
+            asyncio.run_coroutine_threadsafe(async_client.close(), _async_loop)
+        async_client = AsyncGroq(api_key=_get_api_key(), max_retries=0, http_client=httpx.AsyncClient(**_pool_options()))
+        _async_loop = loop
+        _async_limit = asyncio.Semaphore(MAX_CONCURRENCY)
+    return async_client
+
+async def close_async_client():
+    """Close the async client of the running event loop and its pooled connections, e.g. at shutdown."""
+    global async_client, _async_loop, _async_limit
+    if async_client is None or _async_loop is not asyncio.get_running_loop():
+        return
+    closing = async_client
+    async_client = _async_loop = _async_limit = None
+    await closing.close()
+
+def _build_messages(prompt):
+    return [{"role": "user", "content": prompt}]
+
+def _count_usage(usage):
+    """Add the token usage Groq reports for a completion to the LLM token counters."""
+    if usage is None:
+        return
+    llm_tokens.labels(kind="prompt").inc(usage.prompt_tokens or 0)
+    llm_tokens.labels(kind="completion").inc(usage.completion_tokens or 0)
+
+def _retry_delay(error, attempt):
+    """
+    Seconds to wait before retry number `attempt` (1-based) after `error`,
+    or None when the error is not worth retrying.
+    """
+    if isinstance(error, APIStatusError):
+        if error.status_code != 429 and error.status_code < 500:
+            return None
+        retry_after = error.response.headers.get("retry-after")
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), RETRY_MAX_SECONDS)
+        except ValueError:
+            pass
+    elif not isinstance(error, APIConnectionError):
+        return None
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+
+def _retry_reason(error):
+    return str(error.status_code) if isinstance(error, APIStatusError) else "connection"
+
+def _next_retry(error, attempt):
+    """
+    Decide on retry number `attempt` after `error` for both retry loops:
+    the seconds to wait (the retry is counted and logged), or None to raise.
+    """
+    delay = _retry_delay(error, attempt) if attempt <= MAX_RETRIES else None
+    if delay is not None:
+        llm_retries.labels(reason=_retry_reason(error)).inc()
+        print(f"Groq call failed ({error}); retry {attempt}/{MAX_RETRIES} in {delay:.2f}s")
+    return delay
+
+async def _with_retries_async(call):
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            attempt += 1
+            delay = _next_retry(e, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+def _with_retries(call):
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            attempt += 1
+            delay = _next_retry(e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
 def generate_response(prompt):
     """
     Generate a response using Groq's LLM API.
-    
+
     Model options:
     - llama-3.1-8b-instant (fast, reliable - currently used)
     - llama-3.3-70b-versatile (if available, high quality)
     - mixtral-8x7b-32768 (alternative option)
     """
     client = _get_client()
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",  # Updated from deprecated llama-3.1-70b-versatile
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.1,
-        max_tokens=1200
-    )
+    llm_requests.labels(mode="complete").inc()
+    with _sync_limit, span("llm"):
+        response = _with_retries(lambda: client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=_build_messages(prompt),
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS
+        ))
+    _count_usage(response.usage)
     return response.choices[0].message.content
+
+async def _complete_async(prompt):
+    client = _get_async_client()
+    llm_requests.labels(mode="complete").inc()
+    async with _async_limit:
+        with span("llm"):
+            response = await _with_retries_async(lambda: client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=_build_messages(prompt),
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS
+            ))
+    _count_usage(response.usage)
+    return response.choices[0].message.content
+
+def _completion_key(prompt):
+    return hashlib.sha256(f"{MODEL_NAME}\0{TEMPERATURE}\0{MAX_TOKENS}\0{prompt}".encode("utf-8")).hexdigest()
+
+async def generate_response_async(prompt):
+    """
+    Async variant of generate_response for use inside request handlers.
+
+    Awaits the Groq call instead of blocking the event loop, so concurrent
+    requests overlap their LLM latency. A call with the same prompt and
+    settings as one still in flight waits for that call's result instead of
+    sending its own (see LLM_SINGLE_FLIGHT); a caller that goes away does not
+    cancel the call for the others.
+    """
+    if not SINGLE_FLIGHT:
+        return await _complete_async(prompt)
+
+    key = _completion_key(prompt)
+    task = _in_flight.get(key)
+    if task is not None and task.get_loop() is asyncio.get_running_loop():
+        llm_coalesced.inc()
+    else:
+        task = asyncio.ensure_future(_complete_async(prompt))
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _in_flight.pop(key, None) if _in_flight.get(key) is done else None)
+    return await asyncio.shield(task)
+
+async def generate_response_stream(prompt):
+    """
+    Stream a response from Groq's LLM API.
+
+    Yields the answer text incrementally as completion chunks arrive, so the
+    caller can forward the first tokens before the full answer is generated.
+    Only opening the stream is retried; once tokens have been sent a failure
+    is raised to the caller. Closing the generator early closes the stream.
+    """
+    client = _get_async_client()
+    llm_requests.labels(mode="stream").inc()
+    async with _async_limit:
+        started = time.perf_counter()
+        first_token = False
+        stream = await _with_retries_async(lambda: client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=_build_messages(prompt),
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            stream=True
+        ))
+        # Closing the stream releases its connection to the pool, also when
+        # the caller stops early (e.g. the client disconnected)
+        async with stream:
+            async for chunk in stream:
+                # Groq reports usage on the last chunk, under x_groq
+                x_groq = getattr(chunk, "x_groq", None)
+                _count_usage(getattr(x_groq, "usage", None) or getattr(chunk, "usage", None))
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    if not first_token:
+                        first_token = True
+                        record_stage("llm_first_token", time.perf_counter() - started)
+                    yield content
+        record_stage("llm_stream", time.perf_counter() - started)
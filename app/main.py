@@ -1,19 +1,91 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-from app.prompts import extract_key_points_prompt, analyze_key_points_prompt
-from app.llm import generate_response
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+import time
+from app.prompts import analyze_key_points_prompt
+from app.llm import close_async_client, generate_response_stream
 from app.document_processor import extract_text_from_pdf, analyze_document_structure
-from app.services import QueryProcessingService
+from app.services import (
+    create_query_service,
+    create_document_analysis_service,
+    create_document_session_service,
+    document_digest,
+    new_document,
+    new_analysis_timings,
+    record_analysis_timings
+)
+from app.rag import available_sources, warm_up_async
+from app.partitions import UnknownSourceError
+from app.sessions import SessionNotFoundError
+from app.jobs import QueueFullError, create_job_queue, run_in_extraction_pool, shutdown_extraction_pool
+from app.config import env_flag
+from app.metrics import PROMETHEUS_CONTENT_TYPE, render, request_seconds, server_timing, span, start_request_timings
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
 from fastapi.middleware.cors import CORSMiddleware
 
-limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(title="AI Legal Assistant")
+# Readiness reported by /ready, updated by the warm-up task started at startup
+warmup_state = {"status": "starting", "warmup_seconds": None, "detail": None, "attempts": 0}
+# A failed warm-up (e.g. no index ingested yet) is retried with exponential backoff
+WARMUP_RETRY_BASE_SECONDS = float(os.getenv("RAG_WARMUP_RETRY_BASE_SECONDS", "1"))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("RAG_WARMUP_RETRY_MAX_SECONDS", "60"))
+
+async def _warm_up():
+    delay = WARMUP_RETRY_BASE_SECONDS
+    while True:
+        warmup_state["status"] = "warming_up"
+        warmup_state["attempts"] += 1
+        try:
+            seconds = await warm_up_async()
+        except Exception as e:
+            # Stays "failed" (and /ready 503) until the next attempt
+            warmup_state["status"] = "failed"
+            warmup_state["detail"] = str(e)
+            print(f"Warm-up failed: {e}; retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+            continue
+        warmup_state["status"] = "ready"
+        warmup_state["detail"] = None
+        warmup_state["warmup_seconds"] = round(seconds, 3)
+        print(f"Warm-up completed in {seconds:.2f}s")
+        return
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Preload the embedding model and indexes in the background at startup.
+
+    The server accepts connections immediately; /ready turns 200 once the
+    warm-up query has gone through every retrieval stage. Set RAG_WARMUP=false
+    to skip this and load lazily on the first request instead. The /analyze
+    job workers run for the lifetime of the app, and the Groq connection pool
+    is closed with it.
+    """
+    job_queue.start()
+    warmup_task = None
+    if env_flag("RAG_WARMUP", "true"):
+        warmup_task = asyncio.create_task(_warm_up())
+    else:
+        warmup_state["status"] = "ready"
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await job_queue.stop()
+    shutdown_extraction_pool()
+    await close_async_client()
+
+# RATE_LIMIT_ENABLED=false turns limiting off, e.g. for load tests
+limiter = Limiter(key_func=get_remote_address, enabled=env_flag("RATE_LIMIT_ENABLED", "true"))
+app = FastAPI(title="AI Legal Assistant", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,122 +99,430 @@ app.add_middleware(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+@app.middleware("http")
+async def record_stage_timings(request: Request, call_next):
+    """
+    Report the stage timings of each request in a Server-Timing header.
+
+    Streaming responses send their headers before the LLM runs, so their
+    header only covers retrieval and prompt building; the LLM stages still
+    reach /metrics.
+    """
+    timings = start_request_timings()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    response.headers["Server-Timing"] = server_timing(timings, elapsed)
+    route = request.scope.get("route")
+    request_seconds.labels(endpoint=getattr(route, "path", "unmatched"), status=str(response.status_code)).observe(elapsed)
+    return response
+
 # Initialize services
-query_service = QueryProcessingService()
+query_service = create_query_service()
+analysis_service = create_document_analysis_service()
+session_service = create_document_session_service()
+job_queue = create_job_queue()
 
 class QuestionRequest(BaseModel):
     question: str
+    # Search only these source corpora (see GET /sources); all when omitted
+    sources: Optional[List[str]] = None
+
+class FollowUpRequest(BaseModel):
+    question: str
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str]
+    sources: Optional[List[str]] = None
+
+# Largest list of questions one /ask/batch request may carry
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "100"))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Stop nginx-style proxies from buffering the stream
+}
+
+def _sse_event(event: str, data: Any) -> str:
+    """Format a single Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/health")
+async def health():
+    """Liveness check: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness check: 200 once the model and indexes are loaded and warm, 503 before."""
+    status_code = 200 if warmup_state["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=warmup_state)
+
+@app.get("/sources")
+async def sources():
+    """Source corpora /ask can be restricted to, with their chunk counts."""
+    try:
+        return {"sources": await run_in_threadpool(available_sources)}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 @app.post("/ask")
 @limiter.limit("5/minute")
 async def ask_question(request: Request, question_request: QuestionRequest):
     try:
-        response = await query_service.process_query(question_request.question)
+        response = await query_service.process_query(question_request.question, question_request.sources)
         return response
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except UnknownSourceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+
+@app.post("/ask/stream")
+@limiter.limit("5/minute")
+async def ask_question_stream(request: Request, question_request: QuestionRequest):
+    """
+    Streaming variant of /ask over Server-Sent Events.
+
+    Emits a `sources` event once retrieval finishes, then one `token` event
+    per generated chunk of the answer, and a final `done` event.
+    """
+    try:
+        prepared = await query_service.prepare_query(question_request.question, question_request.sources)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UnknownSourceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+
+    async def event_stream() -> AsyncIterator[str]:
+        yield _sse_event("sources", {
+            "question": prepared["question"],
+            "sources": prepared["sources"],
+            "cached": prepared["cached"],
+            "fast_path": prepared["fast_path"],
+            "match": prepared.get("match"),
+            "tokens": prepared["tokens"]
+        })
+        try:
+            async for token in query_service.stream_answer(prepared):
+                yield _sse_event("token", {"content": token})
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Error processing request: {str(e)}"})
+            return
+        yield _sse_event("done", {})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+def _validate_batch(batch_request: BatchQuestionRequest) -> List[str]:
+    questions = batch_request.questions
+    if not questions:
+        raise HTTPException(status_code=400, detail="questions must contain at least one question.")
+    if len(questions) > ASK_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {ASK_BATCH_MAX_QUESTIONS} questions can be sent in one batch; got {len(questions)}."
+        )
+    return questions
+
+@app.post("/ask/batch")
+@limiter.limit("5/minute")
+async def ask_questions_batch(request: Request, batch_request: BatchQuestionRequest):
+    """
+    Answer a list of questions in one request.
+
+    Retrieval runs once for the whole list and the answers are generated
+    concurrently. Responses are returned in the order of the questions, each
+    shaped like an /ask response; a question whose answer failed carries an
+    "error" instead.
+    """
+    questions = _validate_batch(batch_request)
+    try:
+        results = await query_service.process_batch(questions, batch_request.sources)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UnknownSourceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+    return {"results": results}
+
+@app.post("/ask/batch/stream")
+@limiter.limit("5/minute")
+async def ask_questions_batch_stream(request: Request, batch_request: BatchQuestionRequest):
+    """
+    Streaming variant of /ask/batch over Server-Sent Events.
+
+    Emits one `result` event per question as soon as its answer is ready,
+    carrying its position in the list under "index", then a final `done`
+    event.
+    """
+    questions = _validate_batch(batch_request)
+    results = query_service.answer_batch(questions, batch_request.sources)
+    try:
+        # Retrieval errors surface before the stream starts, as for /ask
+        first = await results.__anext__()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UnknownSourceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            index, result = first
+            yield _sse_event("result", {"index": index, **result})
+            async for index, result in results:
+                yield _sse_event("result", {"index": index, **result})
+        finally:
+            await results.aclose()
+        yield _sse_event("done", {"count": len(questions)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latency histograms and LLM token and cache counters in the Prometheus text format."""
+    return Response(content=render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/cache/stats")
+async def answer_cache_stats():
+    """Report answer cache size and hit/miss counters."""
+    return query_service.cache_stats()
+
+
+@app.get("/analyze/cache/stats")
+async def document_cache_stats():
+    """Report /analyze result cache size and hit/miss counters."""
+    return analysis_service.cache_stats()
+
+
+async def _load_document(file: UploadFile) -> Dict[str, Any]:
+    """
+    Validate an uploaded PDF and extract its text, or reuse an earlier upload of the same file.
+
+    Returns a document dict for DocumentAnalysisService.analyze. Raises
+    HTTPException with a user-facing explanation when the file is not a PDF
+    or no text can be extracted from it.
+    """
+    return await _load_document_content(await _read_pdf(file))
+
+
+async def _read_pdf(file: UploadFile) -> bytes:
+    """Read an upload after checking that it is a PDF."""
+    # Validate file type
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(
+            status_code=400, 
+            detail="Only PDF files are supported. Please upload a PDF file."
+        )
+    
+    # Read file content
+    return await file.read()
+
+
+async def _load_document_content(file_content: bytes, in_process_pool: bool = False) -> Dict[str, Any]:
+    """The document dict of an uploaded PDF's content, extracted in the job process pool or a thread."""
+    # Identical uploads are recognized by their content hash
+    digest = document_digest(file_content)
+    document = analysis_service.cached_document(digest)
+    if document is not None:
+        return document
+
+    extraction_result = await _extract_pdf_content(file_content, in_process_pool)
+    return new_document(digest, extraction_result, _document_summary(extraction_result))
+
+
+async def _extract_pdf_content(file_content: bytes, in_process_pool: bool = False) -> Dict[str, Any]:
+    """Extract the text of a PDF, raising HTTPException when there is none."""
+    # Extract text from PDF
+    if not in_process_pool:
+        extraction_result = await run_in_threadpool(extract_text_from_pdf, file_content)
+    else:
+        # The pool's processes time their extraction in their own metrics, so time it here
+        with span("pdf_extract"):
+            extraction_result = await run_in_extraction_pool(extract_text_from_pdf, file_content)
+    
+    if not extraction_result["success"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to extract text from PDF: {extraction_result.get('error', 'Unknown error')}"
+        )
+    
+    if not extraction_result["full_text"]:
+        # Provide detailed error message
+        total_pages = extraction_result.get("total_pages", 0)
+        is_image_based = extraction_result.get("is_image_based", False)
+        
+        if is_image_based and total_pages > 0:
+            detail = (
+                f"No text could be extracted from the PDF. The PDF appears to be image-based (scanned document) "
+                f"with {total_pages} page(s). "
+                f"This API currently supports text-based PDFs only. "
+                f"Please use a PDF with selectable text, or convert your scanned PDF to text using OCR software first."
+            )
+        elif total_pages == 0:
+            detail = (
+                "The PDF file appears to be empty or corrupted. "
+                "Please verify the file is a valid PDF document."
+            )
+        else:
+            detail = (
+                f"No text could be extracted from the PDF ({total_pages} page(s) processed). "
+                f"Possible reasons: "
+                f"1) The PDF contains only images/scans (needs OCR), "
+                f"2) The PDF is password-protected, "
+                f"3) The PDF is corrupted, or "
+                f"4) The PDF has no text content. "
+                f"Please use a PDF with selectable text."
+            )
+        
+        raise HTTPException(
+            status_code=400,
+            detail=detail
+        )
+
+    return extraction_result
+
+
+def _rounded_timings(timings: Dict[str, float]) -> Dict[str, float]:
+    return {stage: round(seconds, 3) for stage, seconds in timings.items()}
+
+
+def _document_summary(extraction_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the document_stats and extraction_summary fields of an /analyze response."""
+    # Analyze document structure
+    document_stats = analyze_document_structure(extraction_result["full_text"])
+
+    return {
+        "document_stats": {
+            "total_pages": extraction_result["total_pages"],
+            "total_characters": document_stats["total_characters"],
+            "total_words": document_stats["total_words"],
+            "total_sentences": document_stats["total_sentences"],
+            "total_paragraphs": document_stats["total_paragraphs"],
+            "estimated_reading_time_minutes": document_stats["estimated_reading_time_minutes"]
+        },
+        "extraction_summary": {
+            "text_chunks_extracted": extraction_result["chunks_count"],
+            "text_length": extraction_result["text_length"]
+        }
+    }
+
+
+def _analysis_response(
+    filename: str,
+    question: Optional[str],
+    summary: Dict[str, Any],
+    result: Dict[str, Any],
+    extraction_seconds: float,
+    request_start: float,
+    session: Optional[Dict[str, Any]] = None,
+    create_session: bool = False
+) -> Dict[str, Any]:
+    """The /analyze response body for the result of DocumentAnalysisService.analyze."""
+    timings = {
+        "extraction_seconds": extraction_seconds,
+        **result["timings"],
+        "total_seconds": time.perf_counter() - request_start
+    }
+    response = {
+        "filename": filename,
+        "document_stats": summary["document_stats"],
+        "key_points": result["key_points"],
+        "question": question,
+        "analysis": result["analysis"],
+        "extraction_summary": {**summary["extraction_summary"], "analysis_sections": result["sections"]},
+        "timings": _rounded_timings(timings),
+        "cached": result["cached"]
+    }
+    if create_session:
+        # None when the document is too large for the session memory cap
+        response["session"] = session
+    return response
+
+
+def _check_sessions(create_session: bool) -> None:
+    if create_session and not session_service.enabled:
+        raise HTTPException(
+            status_code=400,
+            detail="Document sessions are disabled (ANALYZE_SESSIONS_ENABLED=false, or several app.serve workers)."
+        )
+
+
+async def _analyze(
+    document: Dict[str, Any],
+    filename: str,
+    question: Optional[str],
+    create_session: bool,
+    on_key_points=None
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Analyze a document and, when asked to, index it for follow-up questions.
+
+    Indexing encodes the chunks while the analysis waits on the LLM, so it
+    adds little to the response time.
+    """
+    if not create_session:
+        return await analysis_service.analyze(document, question, on_key_points), None
+    session_task = asyncio.ensure_future(session_service.create(document, filename))
+    try:
+        result = await analysis_service.analyze(document, question, on_key_points)
+    except BaseException:
+        _discard_session(session_task)
+        raise
+    session = await session_task
+    session_service.set_key_points(session, result["key_points"])
+    return result, session
+
+
+def _discard_session(session_task: asyncio.Task) -> None:
+    """
+    Drop the session of an analysis that failed, whose id the client never
+    gets: stop its indexing, or delete it when it is already built.
+    """
+    if not session_task.done():
+        # Cancelled before it is stored; storing does not await
+        session_task.cancel()
+    elif not session_task.cancelled() and session_task.exception() is None and session_task.result() is not None:
+        session_service.delete(session_task.result()["session_id"])
+
 
 @app.post("/analyze")
 @limiter.limit("5/minute")
 async def analyze_document(
     request: Request,
     file: UploadFile = File(..., description="PDF document to analyze"),
-    question: Optional[str] = Form(None, description="Optional question about the document")
+    question: Optional[str] = Form(None, description="Optional question about the document"),
+    create_session: bool = Form(False, description="Index the document for follow-up questions")
 ):
     """
     Analyze a PDF document and provide analysis or answer questions about it.
     
     - **file**: PDF file to upload and analyze
     - **question**: (Optional) Specific question about the document
+    - **create_session**: (Optional) Return a session id for follow-up questions
+      (POST /analyze/sessions/{session_id}/ask)
     """
+    _check_sessions(create_session)
     try:
-        # Validate file type
-        if not file.filename.endswith('.pdf'):
-            raise HTTPException(
-                status_code=400, 
-                detail="Only PDF files are supported. Please upload a PDF file."
-            )
-        
-        # Read file content
-        file_content = await file.read()
-        
-        # Extract text from PDF
-        extraction_result = extract_text_from_pdf(file_content)
-        
-        if not extraction_result["success"]:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Failed to extract text from PDF: {extraction_result.get('error', 'Unknown error')}"
-            )
-        
-        if not extraction_result["full_text"]:
-            # Provide detailed error message
-            total_pages = extraction_result.get("total_pages", 0)
-            is_image_based = extraction_result.get("is_image_based", False)
-            
-            if is_image_based and total_pages > 0:
-                detail = (
-                    f"No text could be extracted from the PDF. The PDF appears to be image-based (scanned document) "
-                    f"with {total_pages} page(s). "
-                    f"This API currently supports text-based PDFs only. "
-                    f"Please use a PDF with selectable text, or convert your scanned PDF to text using OCR software first."
-                )
-            elif total_pages == 0:
-                detail = (
-                    "The PDF file appears to be empty or corrupted. "
-                    "Please verify the file is a valid PDF document."
-                )
-            else:
-                detail = (
-                    f"No text could be extracted from the PDF ({total_pages} page(s) processed). "
-                    f"Possible reasons: "
-                    f"1) The PDF contains only images/scans (needs OCR), "
-                    f"2) The PDF is password-protected, "
-                    f"3) The PDF is corrupted, or "
-                    f"4) The PDF has no text content. "
-                    f"Please use a PDF with selectable text."
-                )
-            
-            raise HTTPException(
-                status_code=400,
-                detail=detail
-            )
+        request_start = time.perf_counter()
+        document = await _load_document(file)
+        summary = document["summary"]
+        extraction_seconds = time.perf_counter() - request_start
         
-        # Analyze document structure
-        document_stats = analyze_document_structure(extraction_result["full_text"])
-        
-        # Step 1: Extract key points from the document using Groq API
-        key_points_prompt = extract_key_points_prompt(extraction_result["full_text"])
-        key_points = generate_response(key_points_prompt)
-        
-        # Step 2: Analyze the extracted key points using Groq API
-        analysis_prompt = analyze_key_points_prompt(key_points, question)
-        ai_analysis = generate_response(analysis_prompt)
-        
-        # Prepare response
-        response = {
-            "filename": file.filename,
-            "document_stats": {
-                "total_pages": extraction_result["total_pages"],
-                "total_characters": document_stats["total_characters"],
-                "total_words": document_stats["total_words"],
-                "total_sentences": document_stats["total_sentences"],
-                "total_paragraphs": document_stats["total_paragraphs"],
-                "estimated_reading_time_minutes": document_stats["estimated_reading_time_minutes"]
-            },
-            "key_points": key_points,
-            "question": question,
-            "analysis": ai_analysis,
-            "extraction_summary": {
-                "text_chunks_extracted": extraction_result["chunks_count"],
-                "text_length": extraction_result["text_length"]
-            }
-        }
-        
-        return JSONResponse(content=response)
+        # Steps 1 and 2: Extract key points (per section for long documents) and analyze them,
+        # skipping whatever is cached for this file
+        result, session = await _analyze(document, file.filename, question, create_session)
+        return JSONResponse(content=_analysis_response(
+            file.filename, question, summary, result, extraction_seconds, request_start, session, create_session
+        ))
         
     except HTTPException:
         raise
@@ -151,3 +531,232 @@ async def analyze_document(
             status_code=500, 
             detail=f"Error processing document: {str(e)}"
         )
+
+
+@app.post("/analyze/stream")
+@limiter.limit("5/minute")
+async def analyze_document_stream(
+    request: Request,
+    file: UploadFile = File(..., description="PDF document to analyze"),
+    question: Optional[str] = Form(None, description="Optional question about the document"),
+    create_session: bool = Form(False, description="Index the document for follow-up questions")
+):
+    """
+    Streaming variant of /analyze over Server-Sent Events.
+
+    Emits a `document` event with the document statistics, then `key_points`
+    events while key points are extracted, `analysis` events while they are
+    analyzed, and a final `done` event carrying per-stage timings. For long
+    documents the key points stream starts once every section has been
+    summarized, with the merge step. With create_session, a `session` event
+    with the follow-up session id comes before `done`.
+    """
+    _check_sessions(create_session)
+    try:
+        request_start = time.perf_counter()
+        document = await _load_document(file)
+        extraction_seconds = time.perf_counter() - request_start
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Error processing document: {str(e)}"
+        )
+
+    async def event_stream() -> AsyncIterator[str]:
+        yield _sse_event("document", {
+            "filename": file.filename,
+            "question": question,
+            "cached": document["cached"],
+            **document["summary"]
+        })
+        timings = new_analysis_timings()
+        # The document is indexed while the LLM streams
+        session_task = asyncio.create_task(session_service.create(document, file.filename)) if create_session else None
+        session_sent = False
+        try:
+            # Step 1: Extract key points, forwarding the final (or merge) call as it is generated
+            if document["key_points"] is not None:
+                yield _sse_event("key_points", {"content": document["key_points"]})
+            else:
+                key_points_parts = []
+                key_points_prompt, stage, sections = await analysis_service.prepare_key_points(
+                    document["extraction_result"], timings
+                )
+                start = time.perf_counter()
+                async for token in generate_response_stream(key_points_prompt):
+                    key_points_parts.append(token)
+                    yield _sse_event("key_points", {"content": token})
+                timings[stage] += time.perf_counter() - start
+                analysis_service.remember_key_points(document, "".join(key_points_parts), sections)
+
+            # Step 2: Analyze the complete key points
+            analysis = analysis_service.cached_analysis(document, question)
+            if analysis is not None:
+                yield _sse_event("analysis", {"content": analysis})
+            else:
+                analysis_parts = []
+                start = time.perf_counter()
+                analysis_prompt = analyze_key_points_prompt(document["key_points"], question)
+                async for token in generate_response_stream(analysis_prompt):
+                    analysis_parts.append(token)
+                    yield _sse_event("analysis", {"content": token})
+                timings["analysis_seconds"] = time.perf_counter() - start
+                analysis_service.remember_analysis(document, question, "".join(analysis_parts))
+
+            if session_task is not None:
+                session = await session_task
+                session_service.set_key_points(session, document["key_points"])
+                session_sent = True
+                yield _sse_event("session", {"session": session})
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Error processing document: {str(e)}"})
+            return
+        finally:
+            if session_task is not None and not session_sent:
+                _discard_session(session_task)
+        record_analysis_timings(timings)
+        yield _sse_event("done", {"timings": _rounded_timings({
+            "extraction_seconds": extraction_seconds,
+            **timings,
+            "total_seconds": time.perf_counter() - request_start
+        })})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+# Seconds a client is asked to wait before resubmitting when the job queue is full
+JOB_RETRY_AFTER_SECONDS = 30
+
+
+def _job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The public view of a job: its status, stage, partial results and, once done, its result or error."""
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "filename": job["filename"],
+        "question": job["question"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "expires_at": job["expires_at"],
+        "partial": job["partial"],
+        "result": job["result"],
+        "error": job["error"],
+        "result_url": f"/analyze/jobs/{job['job_id']}/result"
+    }
+
+
+@app.post("/analyze/jobs", status_code=202)
+@limiter.limit("5/minute")
+async def submit_analysis_job(
+    request: Request,
+    file: UploadFile = File(..., description="PDF document to analyze"),
+    question: Optional[str] = Form(None, description="Optional question about the document"),
+    create_session: bool = Form(False, description="Index the document for follow-up questions")
+):
+    """
+    Queue a PDF for analysis and return its job id at once.
+
+    The job runs the same steps as /analyze in the background. Poll
+    GET /analyze/jobs/{job_id} for its stage and partial results (document
+    stats, then key points); GET /analyze/jobs/{job_id}/result returns the
+    /analyze response once it is done. A full queue is answered with 503 and
+    Retry-After.
+    """
+    _check_sessions(create_session)
+    file_content = await _read_pdf(file)
+    filename = file.filename
+
+    async def run(report) -> Dict[str, Any]:
+        job_start = time.perf_counter()
+        await report("extracting")
+        document = await _load_document_content(file_content, in_process_pool=True)
+        extraction_seconds = time.perf_counter() - job_start
+        await report("key_points", **document["summary"])
+
+        async def on_key_points(key_points: str) -> None:
+            await report("analysis", key_points=key_points)
+
+        result, session = await _analyze(document, filename, question, create_session, on_key_points)
+        return _analysis_response(
+            filename, question, document["summary"], result, extraction_seconds, job_start, session, create_session
+        )
+
+    try:
+        job = await job_queue.submit(run, filename, question)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(JOB_RETRY_AFTER_SECONDS)})
+    return JSONResponse(
+        status_code=202,
+        content=_job_status(job),
+        headers={"Location": f"/analyze/jobs/{job['job_id']}"}
+    )
+
+
+@app.get("/analyze/jobs/stats")
+async def analysis_job_stats():
+    """Report job queue depth and how many jobs completed, failed or were rejected."""
+    return await job_queue.stats()
+
+
+@app.get("/analyze/jobs/{job_id}")
+async def analysis_job_status(job_id: str):
+    """Status, stage and partial results of an /analyze job."""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found; it may have expired.")
+    return _job_status(job)
+
+
+@app.get("/analyze/jobs/{job_id}/result")
+async def analysis_job_result(job_id: str):
+    """
+    The /analyze response of a finished job.
+
+    Returns 202 with the job status while it is still queued or running,
+    and the error /analyze would have returned when it failed.
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found; it may have expired.")
+    if job["status"] == "completed":
+        return job["result"]
+    if job["status"] == "failed":
+        raise HTTPException(status_code=job["status_code"] or 500, detail=job["error"])
+    return JSONResponse(status_code=202, content=_job_status(job))
+
+
+@app.get("/analyze/sessions/stats")
+async def document_session_stats():
+    """Report document session count, memory and hit/miss counters."""
+    return session_service.stats()
+
+
+@app.post("/analyze/sessions/{session_id}/ask")
+@limiter.limit("5/minute")
+async def ask_document_session(request: Request, session_id: str, follow_up: FollowUpRequest):
+    """
+    Answer a follow-up question about a document analyzed with create_session.
+
+    Only the document's most relevant chunks (hybrid dense + BM25 search,
+    as for /ask) and its key points go into the prompt. Unknown or expired
+    sessions get 404.
+    """
+    _check_sessions(True)
+    try:
+        return await session_service.ask(session_id, follow_up.question)
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+
+
+@app.delete("/analyze/sessions/{session_id}", status_code=204)
+async def delete_document_session(session_id: str):
+    """Drop a document session and free its memory."""
+    _check_sessions(True)
+    if not session_service.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found; it may have expired.")
+    return Response(status_code=204)
@@ -0,0 +1,129 @@
+import functools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# Seconds; covers sub-millisecond BM25 lookups up to minute-long /analyze calls
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PROMETHEUS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+def render() -> bytes:
+    """
+    All metrics in the Prometheus text exposition format.
+
+    With PROMETHEUS_MULTIPROC_DIR set (app.serve sets it for its workers),
+    every process writes its samples to files there and the scrape sums
+    them over all workers, whichever worker serves it.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+stage_seconds = Histogram(
+    "legal_assistant_stage_duration_seconds",
+    "Time spent in each request processing stage.",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+request_seconds = Histogram(
+    "legal_assistant_request_duration_seconds",
+    "Time to produce the response of an HTTP request (headers, for streaming responses).",
+    ["endpoint", "status"],
+    buckets=STAGE_BUCKETS
+)
+llm_tokens = Counter(
+    "legal_assistant_llm_tokens_total",
+    "Tokens reported by the LLM API, by kind (prompt or completion).",
+    ["kind"]
+)
+llm_requests = Counter(
+    "legal_assistant_llm_requests_total",
+    "LLM API calls, by mode (complete or stream).",
+    ["mode"]
+)
+llm_coalesced = Counter(
+    "legal_assistant_llm_coalesced_total",
+    "Completions served by an identical call already in flight instead of a new one."
+)
+llm_retries = Counter(
+    "legal_assistant_llm_retries_total",
+    "Retried LLM API calls, by reason (HTTP status or connection).",
+    ["reason"]
+)
+fast_path_lookups = Counter(
+    "legal_assistant_fast_path_total",
+    "/ask questions checked against the curated questions, by result (hit or miss).",
+    ["result"]
+)
+answer_seconds = Histogram(
+    "legal_assistant_answer_duration_seconds",
+    "Time to a complete /ask answer, by how it was produced (cache, fast_path or generated).",
+    ["path"],
+    buckets=STAGE_BUCKETS
+)
+cache_lookups = Counter(
+    "legal_assistant_cache_lookups_total",
+    "Cache lookups by cache and result (hit, semantic_hit or miss).",
+    ["cache", "result"]
+)
+analysis_jobs = Counter(
+    "legal_assistant_analysis_jobs_total",
+    "/analyze jobs by outcome (completed, failed, or rejected because the queue was full).",
+    ["status"]
+)
+
+# Stage timings of the current request, collected for its Server-Timing header
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+def start_request_timings() -> List[Tuple[str, float]]:
+    """Start collecting the stage timings of the request handled in this context."""
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Observe a stage duration and add it to the current request's timings, if any."""
+    stage_seconds.labels(stage=stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block as `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+def timed(stage: str):
+    """Decorator timing every call of a function as `stage`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def server_timing(timings: List[Tuple[str, float]], total_seconds: Optional[float] = None) -> str:
+    """
+    Format timings as a Server-Timing header value, e.g. "bm25;dur=1.2, llm;dur=840.3".
+
+    Stages that ran several times (one LLM call per /analyze section) are summed.
+    """
+    durations: Dict[str, float] = {}
+    for stage, seconds in timings:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    if total_seconds is not None:
+        durations["total"] = total_seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items())
@@ -0,0 +1,239 @@
+import json
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import faiss
+import numpy as np
+from app.chunk_store import save_array
+from app.sparse import SparseBM25Index
+from app.vector_index import create_index, add_vectors, needs_training, save_index, load_index
+
+MANIFEST_FILENAME = "partitions.json"
+
+class UnknownSourceError(ValueError):
+    """A source filter names a partition the index does not have."""
+
+def partition_name(source: str) -> str:
+    """
+    Partition of a source file: its name up to the first underscore or dot, lowercased.
+
+    ipc_qa.json and ipc_1860.pdf both belong to "ipc", so a new corpus only
+    needs files with a new prefix. Partition names given as filters
+    ("IPC", "ipc") are normalized the same way.
+    """
+    return re.split(r"[_.]", Path(source.strip()).name, maxsplit=1)[0].lower()
+
+def partition_index_type(index_type: str) -> str:
+    """
+    FAISS layout of the partition indexes for a given main index type.
+
+    Partitions are built incrementally, often from few vectors, so IVF types
+    (which must be trained first) fall back to exact flat search.
+    """
+    return "flat" if needs_training(index_type) else index_type
+
+def stored_vectors(index: faiss.Index, ids: np.ndarray) -> Optional[np.ndarray]:
+    """The vectors of the given ids when the index can return them exactly, else None."""
+    if not isinstance(index, faiss.IndexIDMap2) or not len(ids):
+        return None
+    return index.reconstruct_batch(np.ascontiguousarray(ids, dtype=np.int64))
+
+class Partition:
+    """
+    Dense and BM25 indexes over the chunks of one partition.
+
+    Chunk texts stay in the shared chunk store; the partition maps its BM25
+    documents to chunk ids, and its FAISS index returns chunk ids directly.
+
+    Files in the directory:
+        index.faiss / index_meta.json   FAISS index over chunk ids
+        ids.npy                         chunk id per BM25 document
+        bm25/                           SparseBM25Index over the partition
+    """
+
+    def __init__(
+        self,
+        index: Optional[faiss.Index] = None,
+        index_meta: Optional[Dict[str, Any]] = None,
+        ids: Optional[np.ndarray] = None,
+        bm25: Optional[SparseBM25Index] = None
+    ):
+        self.index = index
+        self.index_meta = index_meta
+        self.ids = ids if ids is not None else np.empty(0, dtype=np.int64)
+        self.bm25 = bm25
+        # Tokens of chunks added since the BM25 index was last built
+        self._pending_tokens: List[List[str]] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(
+        self,
+        ids: np.ndarray,
+        embeddings: np.ndarray,
+        tokens: List[List[str]],
+        index_type: str = "flat",
+        index_params: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Add chunks by id, with their embeddings and BM25 tokens."""
+        if self.index is None:
+            self.index, self.index_meta = create_index(
+                embeddings.shape[1], partition_index_type(index_type), with_ids=True, **(index_params or {})
+            )
+        add_vectors(self.index, embeddings, ids)
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self._pending_tokens.extend(tokens)
+
+    def _flush_bm25(self) -> None:
+        if not self._pending_tokens:
+            return
+        if self.bm25 is None:
+            self.bm25 = SparseBM25Index.build(self._pending_tokens)
+        else:
+            self.bm25.add_documents(self._pending_tokens)
+        self._pending_tokens = []
+
+    def remove(self, chunk_ids: np.ndarray) -> None:
+        """Drop the given chunks, ignoring ids of other partitions."""
+        removed = np.isin(self.ids, chunk_ids)
+        if not removed.any():
+            return
+        self._flush_bm25()
+        self.index.remove_ids(np.ascontiguousarray(self.ids[removed]))
+        self.bm25.remove_documents(np.nonzero(removed)[0])
+        self.ids = self.ids[~removed]
+
+    def dense_search(self, query_embeddings: np.ndarray, top_k: int) -> List[np.ndarray]:
+        """Chunk ids of the top_k nearest chunks for each query embedding."""
+        _, found = self.index.search(np.ascontiguousarray(query_embeddings, dtype=np.float32), top_k)
+        return [ids[ids >= 0] for ids in found]
+
+    def sparse_search(self, query_tokens: List[List[str]], top_k: int) -> List[np.ndarray]:
+        """Chunk ids of the top_k BM25 matches for each tokenized query."""
+        self._flush_bm25()
+        return [self.ids[doc_ids] for doc_ids, _ in self.bm25.top_k_batch(query_tokens, top_k)]
+
+    def save(self, directory: Path) -> None:
+        directory = Path(directory)
+        self._flush_bm25()
+        directory.mkdir(parents=True, exist_ok=True)
+        save_array(directory / "ids.npy", self.ids)
+        self.bm25.save(directory / "bm25")
+        self.index_meta["ntotal"] = int(self.index.ntotal)
+        save_index(self.index, self.index_meta, directory / "index.faiss")
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = False) -> "Partition":
+        directory = Path(directory)
+        index, index_meta = load_index(directory / "index.faiss", mmap)
+        ids = np.load(directory / "ids.npy", mmap_mode="r" if mmap else None)
+        return cls(index, index_meta, ids, SparseBM25Index.load(directory / "bm25"))
+
+class PartitionedIndex:
+    """
+    The corpus split into one Partition per source corpus (see partition_name).
+
+    Searching a few partitions costs time in proportion to their size rather
+    than the corpus. Opening reads only the partition list; each partition is
+    loaded on first use.
+
+    Files in the directory:
+        partitions.json   partition names and chunk counts
+        <name>/           one Partition
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        sizes: Optional[Dict[str, int]] = None,
+        index_type: str = "flat",
+        index_params: Optional[Dict[str, Any]] = None,
+        mmap: bool = False
+    ):
+        self.directory = Path(directory) if directory is not None else None
+        self.sizes = dict(sizes or {})
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        # Partitions are loaded read-only and memory-mapped (see read_index_file)
+        self.mmap = mmap
+        self._partitions: Dict[str, Partition] = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        return sorted(self.sizes)
+
+    def get(self, name: str) -> Partition:
+        """A partition by name, loaded from disk on first use."""
+        partition = self._partitions.get(name)
+        if partition is None:
+            with self._lock:
+                partition = self._partitions.get(name)
+                if partition is None:
+                    partition = Partition.load(self.directory / name, self.mmap)
+                    self._partitions[name] = partition
+        return partition
+
+    def add_chunks(self, chunks: Sequence[Dict[str, Any]], embeddings: np.ndarray, tokens: List[List[str]]) -> None:
+        """
+        Add chunks to the partitions of their sources.
+
+        Args:
+            chunks: {"id", "metadata"} dicts
+            embeddings: (len(chunks), dim) chunk embeddings
+            tokens: BM25 tokens of each chunk
+        """
+        groups: Dict[str, List[int]] = {}
+        for position, chunk in enumerate(chunks):
+            groups.setdefault(partition_name(chunk["metadata"]["source"]), []).append(position)
+        for name, positions in groups.items():
+            if name not in self._partitions:
+                self._partitions[name] = Partition.load(self.directory / name) if name in self.sizes else Partition()
+            self._partitions[name].add(
+                np.array([chunks[i]["id"] for i in positions], dtype=np.int64),
+                embeddings[positions],
+                [tokens[i] for i in positions],
+                self.index_type,
+                self.index_params
+            )
+            self.sizes[name] = len(self._partitions[name])
+
+    def remove_chunks(self, chunk_ids: Sequence[int]) -> None:
+        """Drop chunks from whichever partitions hold them; emptied partitions are deleted."""
+        chunk_ids = np.asarray(list(chunk_ids), dtype=np.int64)
+        if not len(chunk_ids):
+            return
+        for name in self.names():
+            partition = self.get(name)
+            partition.remove(chunk_ids)
+            self.sizes[name] = len(partition)
+            if not len(partition):
+                del self.sizes[name]
+                del self._partitions[name]
+
+    def save(self, directory: Path) -> None:
+        """Write the partitions changed or loaded since opening, then the partition list."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, partition in self._partitions.items():
+            partition.save(directory / name)
+        for path in directory.iterdir():
+            if path.is_dir() and path.name not in self.sizes:
+                shutil.rmtree(path, ignore_errors=True)
+        with open(directory / MANIFEST_FILENAME, "w", encoding="utf-8") as f:
+            json.dump({"index_type": self.index_type, "index_params": self.index_params, "partitions": self.sizes}, f, indent=2)
+        self.directory = directory
+
+    @staticmethod
+    def exists(directory: Path) -> bool:
+        return (Path(directory) / MANIFEST_FILENAME).exists()
+
+    @classmethod
+    def open(cls, directory: Path, mmap: bool = False) -> "PartitionedIndex":
+        """Read the partition list; `mmap` loads partitions read-only for serving."""
+        directory = Path(directory)
+        with open(directory / MANIFEST_FILENAME, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return cls(directory, manifest["partitions"], manifest["index_type"], manifest["index_params"], mmap)
@@ -44,6 +44,51 @@ INSTRUCTIONS:
 Return ONLY the key points extracted from the document, formatted clearly.
 """
 
+def extract_section_key_points_prompt(section_text: str, first_page: int, last_page: int, total_pages: int) -> str:
+    """
+    Generate a prompt to extract key points from one section of a long document.
+    """
+    pages = f"page {first_page}" if first_page == last_page else f"pages {first_page}-{last_page}"
+    return f"""
+You are an AI document analysis assistant. The following text is {pages} of a {total_pages}-page document.
+Extract and list the key points from this section.
+
+SECTION CONTENT:
+{section_text}
+
+INSTRUCTIONS:
+- Identify and extract the key points, main ideas, and important information in this section
+- Use bullet points
+- Be concise; other sections of the document are summarized separately
+- Include any critical facts, figures, dates, names, or concepts mentioned
+- Do not add an introduction or conclusion
+
+Return ONLY the key points extracted from this section.
+"""
+
+def merge_key_points_prompt(section_key_points: list) -> str:
+    """
+    Generate a prompt to merge key points extracted from consecutive document sections.
+    """
+    sections = "\n\n".join(
+        f"SECTION {i}:\n{key_points}" for i, key_points in enumerate(section_key_points, 1)
+    )
+    return f"""
+You are an AI document analysis assistant. The key points below were extracted from consecutive sections of one document.
+Merge them into a single list of key points for the whole document.
+
+KEY POINTS BY SECTION:
+{sections}
+
+INSTRUCTIONS:
+- Combine the points into one clear, structured list, in document order
+- Remove duplicates and merge points that describe the same thing
+- Keep all critical facts, figures, dates, names, and concepts
+- Use bullet points or numbered list
+
+Return ONLY the merged key points, formatted clearly.
+"""
+
 def analyze_key_points_prompt(key_points: str, question: str = None) -> str:
     """
     Generate a prompt to analyze extracted key points.
@@ -81,4 +126,55 @@ INSTRUCTIONS:
 - Provide context and interpretation of the key points
 - Structure your analysis clearly with sections or bullet points
 - Be thorough and analytical in your response
-"""
\ No newline at end of file
+"""
+def document_question_prompt(excerpts: str, question: str, key_points: str = None) -> str:
+    """
+    Generate a prompt to answer a follow-up question about an uploaded document
+    from its most relevant excerpts (and its key points, when known).
+    """
+    overview = f"""
+KEY POINTS OF THE DOCUMENT:
+{key_points}
+""" if key_points else ""
+    return f"""
+You are an AI document analysis assistant. Answer the question about an uploaded document using the excerpts provided.
+{overview}
+DOCUMENT EXCERPTS:
+{excerpts}
+
+QUESTION:
+{question}
+
+INSTRUCTIONS:
+- Answer using ONLY the document excerpts and key points provided
+- Refer to page numbers where the excerpts give them
+- Be specific and detailed in your answer
+- If the answer cannot be found in the excerpts, state that clearly
+"""
+
+def rewrite_answer_prompt(question: str, matched_question: str, answer: str) -> str:
+    """
+    Generate a prompt adapting a curated answer to the user's wording.
+    Used by the /ask fast path when the question matched a stored one.
+    """
+    return f"""
+You are an AI legal assistant. The user's question matches a question from a curated legal Q&A collection.
+
+USER QUESTION:
+{question}
+
+MATCHED QUESTION:
+{matched_question}
+
+CURATED ANSWER:
+{answer}
+
+INSTRUCTIONS:
+- Rewrite the curated answer so it directly addresses the user's question
+- Keep every legal section, punishment, and fact exactly as stated
+- Do NOT add information that is not in the curated answer
+- Keep it short
+
+NOTE:
+This is not legal advice.
+"""
@@ -0,0 +1,206 @@
+import hashlib
+import shutil
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import faiss
+import numpy as np
+from app.chunk_store import save_array
+from app.sparse import SparseBM25Index, tokenize
+from app.vector_index import read_index_file, write_index_file
+
+QUESTION_PREFIX = "Question: "
+ANSWER_SEPARATOR = "\nAnswer: "
+
+def split_qa(content: str) -> Optional[Tuple[str, str]]:
+    """Split a "Question: ...\\nAnswer: ..." chunk into its question and answer."""
+    if not content.startswith(QUESTION_PREFIX) or ANSWER_SEPARATOR not in content:
+        return None
+    question, answer = content[len(QUESTION_PREFIX):].split(ANSWER_SEPARATOR, 1)
+    return question.strip(), answer.strip()
+
+def chunk_questions(chunk: Dict[str, Any]) -> List[str]:
+    """
+    The stored questions of a QA chunk: its own, then its alternate questions.
+
+    A question's position in this list is its "variant". Chunks that are not
+    JSON QA pairs have none.
+    """
+    if chunk["metadata"].get("type") != "json_qa":
+        return []
+    parsed = split_qa(chunk["content"])
+    if parsed is None:
+        return []
+    return [parsed[0], *chunk["metadata"].get("alternate_questions", [])]
+
+def question_id(chunk_id: int, variant: int) -> int:
+    """Stable 63-bit id of one stored question of a chunk."""
+    digest = hashlib.blake2b(f"{chunk_id}\0{variant}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFFFFFFFFFFFFFF
+
+def _unit_rows(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings.reshape(1, -1)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return np.ascontiguousarray(embeddings / np.where(norms > 0, norms, 1))
+
+class QuestionIndex:
+    """
+    Dense and BM25 indexes over the question text of the QA chunks alone.
+
+    Questions are matched without their answers, so a user question that is
+    (nearly) one of the curated ones scores close to 1. Each stored question
+    of a QA chunk (its own and its alternate questions) is one row:
+    a normalized embedding in an exact inner-product FAISS index, so search
+    scores are cosine similarities, and a BM25 document.
+
+    Files in the directory:
+        index.faiss      IDMap2 over question ids
+        ids.npy          question id per row
+        chunk_ids.npy    chunk id per row
+        variants.npy     position of the question in chunk_questions per row
+        bm25/            SparseBM25Index over the questions, one document per row
+    """
+
+    def __init__(
+        self,
+        index: Optional[faiss.Index] = None,
+        ids: Optional[np.ndarray] = None,
+        chunk_ids: Optional[np.ndarray] = None,
+        variants: Optional[np.ndarray] = None,
+        bm25: Optional[SparseBM25Index] = None
+    ):
+        self.index = index
+        self.ids = ids if ids is not None else np.empty(0, dtype=np.int64)
+        self.chunk_ids = chunk_ids if chunk_ids is not None else np.empty(0, dtype=np.int64)
+        self.variants = variants if variants is not None else np.empty(0, dtype=np.int32)
+        self.bm25 = bm25
+        # Tokens of rows added since the BM25 index was last built
+        self._pending_tokens: List[List[str]] = []
+        self._id_order = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add_chunks(self, chunks: Sequence[Dict[str, Any]], encode: Callable[[List[str]], np.ndarray]) -> int:
+        """
+        Index the questions of the QA chunks among `chunks`.
+
+        Args:
+            chunks: {"id", "content", "metadata"} dicts; non-QA chunks are skipped
+            encode: Embeds a list of texts into a (n, dim) array
+
+        Returns:
+            The number of questions added
+        """
+        questions = []
+        chunk_ids = []
+        variants = []
+        for chunk in chunks:
+            for variant, question in enumerate(chunk_questions(chunk)):
+                questions.append(question)
+                chunk_ids.append(chunk["id"])
+                variants.append(variant)
+        if not questions:
+            return 0
+
+        embeddings = _unit_rows(encode(questions))
+        if self.index is None:
+            self.index = faiss.index_factory(embeddings.shape[1], "IDMap2,Flat", faiss.METRIC_INNER_PRODUCT)
+        ids = np.array([question_id(c, v) for c, v in zip(chunk_ids, variants)], dtype=np.int64)
+        self.index.add_with_ids(embeddings, ids)
+        self.ids = np.concatenate([self.ids, ids])
+        self.chunk_ids = np.concatenate([self.chunk_ids, np.array(chunk_ids, dtype=np.int64)])
+        self.variants = np.concatenate([self.variants, np.array(variants, dtype=np.int32)])
+        self._pending_tokens.extend(tokenize(question) for question in questions)
+        self._id_order = None
+        return len(questions)
+
+    def _flush_bm25(self) -> None:
+        if not self._pending_tokens:
+            return
+        if self.bm25 is None:
+            self.bm25 = SparseBM25Index.build(self._pending_tokens)
+        else:
+            self.bm25.add_documents(self._pending_tokens)
+        self._pending_tokens = []
+
+    def remove_chunks(self, chunk_ids: Sequence[int]) -> None:
+        """Drop every question of the given chunks."""
+        removed = np.isin(self.chunk_ids, np.asarray(list(chunk_ids), dtype=np.int64))
+        if not removed.any():
+            return
+        self._flush_bm25()
+        self.index.remove_ids(np.ascontiguousarray(self.ids[removed]))
+        self.bm25.remove_documents(np.nonzero(removed)[0])
+        self.ids = self.ids[~removed]
+        self.chunk_ids = self.chunk_ids[~removed]
+        self.variants = self.variants[~removed]
+        self._id_order = None
+
+    def _rows_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids)
+        positions = np.clip(np.searchsorted(self.ids[self._id_order], ids), 0, len(self.ids) - 1)
+        return self._id_order[positions]
+
+    def match_batch(self, query_embeddings: np.ndarray, queries: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Find the closest stored question for each query.
+
+        Returns, per query, None when the index is empty, or
+        {"chunk_id", "variant", "similarity", "sparse_agrees"}: the chunk and
+        question of the best dense match, its cosine similarity, and whether
+        the best BM25 match over the questions belongs to the same chunk.
+        """
+        if self.index is None or not len(self):
+            return [None for _ in queries]
+        self._flush_bm25()
+        similarities, found = self.index.search(_unit_rows(query_embeddings), 1)
+        sparse = self.bm25.top_k_batch([tokenize(query) for query in queries], 1)
+        rows = self._rows_for_ids(found[:, 0])
+
+        matches = []
+        for similarity, found_id, row, (doc_ids, _) in zip(similarities[:, 0], found[:, 0], rows, sparse):
+            if found_id < 0:
+                matches.append(None)
+                continue
+            chunk_id = int(self.chunk_ids[row])
+            matches.append({
+                "chunk_id": chunk_id,
+                "variant": int(self.variants[row]),
+                "similarity": float(similarity),
+                "sparse_agrees": bool(len(doc_ids)) and int(self.chunk_ids[doc_ids[0]]) == chunk_id
+            })
+        return matches
+
+    def save(self, directory: Path) -> None:
+        """Write the index, or remove the directory when it holds no questions."""
+        directory = Path(directory)
+        self._flush_bm25()
+        if self.index is None or not len(self):
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        save_array(directory / "ids.npy", self.ids)
+        save_array(directory / "chunk_ids.npy", self.chunk_ids)
+        save_array(directory / "variants.npy", self.variants)
+        self.bm25.save(directory / "bm25")
+        write_index_file(self.index, directory / "index.faiss")
+
+    @staticmethod
+    def exists(directory: Path) -> bool:
+        return (Path(directory) / "index.faiss").exists()
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = False) -> "QuestionIndex":
+        """Load a saved index; `mmap` maps its vectors and arrays read-only (see read_index_file)."""
+        directory = Path(directory)
+        mmap_mode = "r" if mmap else None
+        return cls(
+            read_index_file(directory / "index.faiss", mmap),
+            np.load(directory / "ids.npy", mmap_mode=mmap_mode),
+            np.load(directory / "chunk_ids.npy", mmap_mode=mmap_mode),
+            np.load(directory / "variants.npy", mmap_mode=mmap_mode),
+            SparseBM25Index.load(directory / "bm25")
+        )
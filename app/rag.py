@@ -1,71 +1,628 @@
-import faiss
-import pickle
 import os
+import asyncio
+import contextvars
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
+from app.sparse import SparseBM25Index, tokenize
+from app.chunk_store import ChunkStore
+from app.question_index import QuestionIndex, chunk_questions, split_qa
+from app.partitions import PartitionedIndex, UnknownSourceError, partition_name
+from app.vector_index import load_index
+from app.embeddings import LEGACY_EMBEDDING, configured_embedding
+from app.embedding_server import index_embedding, query_model
+from app.config import env_flag
+from app.metrics import span
+import numpy as np
 
 # Get the project root directory (parent of 'app' directory)
 BASE_DIR = Path(__file__).resolve().parent.parent
 INDEX_PATH = BASE_DIR / "faiss_index" / "index.faiss"
-TEXT_PATH = BASE_DIR / "faiss_index" / "texts.pkl"
-BM25_PATH = BASE_DIR / "faiss_index" / "bm25_index.pkl"
+CHUNK_STORE_DIR = BASE_DIR / "faiss_index" / "chunks"
+BM25_DIR = BASE_DIR / "faiss_index" / "bm25"
+QUESTION_INDEX_DIR = BASE_DIR / "faiss_index" / "questions"
+PARTITIONS_DIR = BASE_DIR / "faiss_index" / "partitions"
+
+RRF_K = 60  # Constant for RRF
+
+# Encoding, FAISS search and BM25 scoring are CPU-bound; they run on this
+# bounded pool so the event loop stays free while a query is being retrieved.
+RETRIEVAL_WORKERS = int(os.getenv("RAG_RETRIEVAL_WORKERS", "4"))
+_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="rag-retrieval")
+_load_lock = threading.Lock()
+
+# Concurrent queries are encoded and searched in batches; see QueryBatcher
+BATCHING_ENABLED = env_flag("RAG_BATCHING", "true")
+BATCH_MAX_SIZE = int(os.getenv("RAG_BATCH_MAX_SIZE", "32"))
+BATCH_WINDOW_SECONDS = float(os.getenv("RAG_BATCH_WINDOW_MS", "2")) / 1000
+
+# Serve the FAISS indexes from memory-mapped files, so every worker process
+# shares one copy through the OS page cache
+MMAP_INDEX = env_flag("RAG_MMAP_INDEX", "true")
 
 model = None
-index = None
-bm25 = None
-texts = None
-
-def _load_index():
-    global model, index, bm25, texts
-    if model is None:
-        model = SentenceTransformer("all-MiniLM-L6-v2")
-    
-    if index is None or texts is None or bm25 is None:
-        if not INDEX_PATH.exists() or not TEXT_PATH.exists() or not BM25_PATH.exists():
-            raise FileNotFoundError(
-                f"Index files not found. Please run 'python app/ingest.py' first to create the index."
-            )
-        index = faiss.read_index(str(INDEX_PATH))
-        with open(TEXT_PATH, "rb") as f:
-            texts = pickle.load(f)
-        with open(BM25_PATH, "rb") as f:
-            bm25 = pickle.load(f)
+# Embedding spec the loaded model was created with; follows the index metadata
+model_embedding = None
 
-def retrieve_legal_context(query, top_k=5):
+class CorpusIndex(namedtuple("CorpusIndex", "version index meta bm25 chunk_store question_index partition_index")):
     """
-    Hybrid retrieval using Dense (FAISS) and Sparse (BM25) search
-    with Reciprocal Rank Fusion (RRF).
+    One build of the corpus indexes: FAISS index and its metadata, BM25
+    index, chunk store, question index and partitions.
+
+    A reload builds a new one and replaces `corpus` in a single assignment.
+    Each search reads `corpus` once and uses that snapshot throughout, so a
+    reload cannot pair the FAISS row ids of one build with the chunks or
+    BM25 matrix of another. question_index is None when the corpus has no
+    QA pairs, partition_index when it was indexed before partitions existed.
     """
+    __slots__ = ()
+
+corpus = None
+
+def index_version():
+    """
+    Identify the index build currently on disk.
+
+    Changes whenever ingestion rewrites the index, so callers can drop state
+    derived from an older build. Returns None when no index exists.
+    """
+    try:
+        return INDEX_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _open_corpus(version):
+    """Open every index of the build on disk, without touching the loaded one."""
+    if not INDEX_PATH.exists() or not ChunkStore.exists(CHUNK_STORE_DIR) or not BM25_DIR.exists():
+        raise FileNotFoundError(
+            f"Index files not found. Please run 'python app/ingest.py' first to create the index."
+        )
+    # Search parameters (nprobe, efSearch) recorded at ingest time are applied here
+    index, meta = load_index(INDEX_PATH, MMAP_INDEX)
+    return CorpusIndex(
+        version=version,
+        index=index,
+        meta=meta,
+        # Chunks and BM25 arrays are memory-mapped; only returned chunks get decoded
+        chunk_store=ChunkStore.open(CHUNK_STORE_DIR),
+        bm25=SparseBM25Index.load(BM25_DIR),
+        question_index=QuestionIndex.load(QUESTION_INDEX_DIR, MMAP_INDEX) if QuestionIndex.exists(QUESTION_INDEX_DIR) else None,
+        # Only the partition list is read; partitions load on their first filtered query
+        partition_index=PartitionedIndex.open(PARTITIONS_DIR, MMAP_INDEX) if PartitionedIndex.exists(PARTITIONS_DIR) else None
+    )
+
+def _load_index(load_model=True):
+    """Load the corpus indexes (and the model) if needed and return the current CorpusIndex."""
+    global model, model_embedding, corpus
+    loaded = corpus
+    if (model is not None or not load_model) and loaded is not None and loaded.version == index_version():
+        return loaded
+
+    with _load_lock:
+        # (Re)load when nothing is loaded yet or ingestion rebuilt the index
+        version = index_version()
+        if corpus is None or corpus.version != version:
+            corpus = _open_corpus(version)
+        loaded = corpus
+
+        if not load_model:
+            return loaded
+        # Queries must be encoded exactly like the indexed chunks, so the
+        # index metadata decides the backend rather than EMBEDDING_BACKEND
+        embedding = loaded.meta.get("embedding", LEGACY_EMBEDDING)
+        if model is None or model_embedding != embedding:
+            if embedding != configured_embedding():
+                print(f"Index was built with embedding {embedding}; using it instead of the configured one")
+            # With EMBEDDING_SERVER set this is a client of the shared embedding server
+            model = query_model(embedding)
+            model_embedding = embedding
+        return loaded
+
+def _load_model():
+    """Load the embedding model on its own, also when no index exists yet."""
+    global model, model_embedding
+    if model is not None:
+        return
+    with _load_lock:
+        if model is None:
+            # The index's embedding when there is one, so _load_index keeps this model
+            model_embedding = index_embedding()
+            model = query_model(model_embedding)
+
+def preload(load_model=True):
+    """
+    Load the indexes, and the embedding model unless load_model is False, without running a query.
+
+    For launchers that load once and then fork the workers (app.serve).
+    Nothing here runs inference or starts threads, which would not survive
+    the fork; each worker warms up on its own (see warm_up).
+    """
+    _load_index(load_model)
+
+def warm_up():
+    """
+    Load the model and indexes and run one query through every retrieval stage.
+
+    The first encode and search pay one-off costs (thread pools, lazy weight
+    initialisation, paging in the memory-mapped files), which this moves out
+    of the first user request. Returns the elapsed seconds.
+    """
+    started = time.perf_counter()
+    retrieve_legal_context("What is the punishment for theft?")
+    return time.perf_counter() - started
+
+def _in_executor(function, *args):
+    """Run a function on the retrieval executor, keeping the caller's request timings."""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_executor, contextvars.copy_context().run, function, *args)
+
+async def warm_up_async():
+    """Non-blocking variant of warm_up."""
+    return await _in_executor(warm_up)
+
+def _encode(queries):
+    with span("embed"):
+        return model.encode(queries)
+
+def embed_query(query):
+    """Encode a query with the retrieval model, returning a (1, dim) array."""
     _load_index()
-    
-    # 1. Dense Retrieval (FAISS)
-    query_embedding = model.encode([query])
-    distances, dense_indices = index.search(query_embedding, top_k)
-    dense_results = dense_indices[0]
-    
-    # 2. Sparse Retrieval (BM25)
-    tokenized_query = query.split()
-    sparse_scores = bm25.get_scores(tokenized_query)
-    # Get indices of top_k scores
-    sparse_results = sorted(range(len(sparse_scores)), key=lambda i: sparse_scores[i], reverse=True)[:top_k]
-    
-    # 3. Reciprocal Rank Fusion (RRF)
-    k = 60 # Constant for RRF
+    return _encode([query])
+
+def _dense_search(corpus, query_embedding, top_k):
+    """Return the row ids of the top_k nearest chunks in the FAISS index."""
+    return _dense_search_batch(corpus, query_embedding, top_k)[0]
+
+def _dense_search_batch(corpus, query_embeddings, top_k):
+    """Return the row ids of the top_k nearest chunks for each of several query embeddings."""
+    with span("faiss"):
+        distances, dense_indices = corpus.index.search(np.ascontiguousarray(query_embeddings, dtype=np.float32), top_k)
+    results = []
+    for ids in dense_indices:
+        # FAISS pads with -1 when the index holds fewer than top_k vectors
+        found = ids[ids >= 0]
+        results.append([int(row) for row in corpus.chunk_store.rows_for_ids(found) if row >= 0])
+    return results
+
+def _sparse_search(corpus, query, top_k):
+    """Return the row ids of the top_k BM25 matches."""
+    with span("bm25"):
+        doc_ids, scores = corpus.bm25.top_k(tokenize(query), top_k)
+    return doc_ids.tolist()
+
+def _sparse_search_batch(corpus, queries, top_k):
+    """Return the row ids of the top_k BM25 matches of each of several queries."""
+    with span("bm25"):
+        results = corpus.bm25.top_k_batch([tokenize(query) for query in queries], top_k)
+    return [doc_ids.tolist() for doc_ids, _ in results]
+
+def _reciprocal_rank_fusion(result_lists, top_k):
+    """Fuse several ranked lists of row ids with Reciprocal Rank Fusion."""
     rrf_scores = {}
-    
+
     # Rank from 0 to top_k-1 (so rank 0 is best)
-    for rank, idx in enumerate(dense_results):
-        if idx not in rrf_scores: rrf_scores[idx] = 0
-        rrf_scores[idx] += 1 / (k + rank + 1)
-        
-    for rank, idx in enumerate(sparse_results):
-        if idx not in rrf_scores: rrf_scores[idx] = 0
-        rrf_scores[idx] += 1 / (k + rank + 1)
-    
+    for results in result_lists:
+        for rank, idx in enumerate(results):
+            if idx not in rrf_scores: rrf_scores[idx] = 0
+            rrf_scores[idx] += 1 / (RRF_K + rank + 1)
+
     # Sort by RRF score
     sorted_indices = sorted(rrf_scores.keys(), key=lambda x: rrf_scores[x], reverse=True)
-    
+
     # Return top_k unique results
-    final_indices = sorted_indices[:top_k]
-    
-    return [texts[i] for i in final_indices]
+    return sorted_indices[:top_k]
+
+def hybrid_search(index, bm25_index, query, query_embedding, top_k):
+    """
+    Rank the rows of any FAISS + BM25 index pair for a query, fused with RRF.
+
+    The hybrid retrieval of retrieve_legal_context for indexes other than
+    the corpus, such as the per-session document indexes (app.sessions).
+    Returns row positions, best first.
+    """
+    with span("faiss"):
+        _, found = index.search(np.ascontiguousarray(query_embedding, dtype=np.float32).reshape(1, -1), top_k)
+    dense_results = [int(row) for row in found[0] if row >= 0]
+    with span("bm25"):
+        doc_ids, _ = bm25_index.top_k(tokenize(query), top_k)
+    with span("rrf"):
+        return _reciprocal_rank_fusion([dense_results, doc_ids.tolist()], top_k)
+
+def _available_sources(corpus):
+    partitions = corpus.partition_index
+    return dict(sorted(partitions.sizes.items())) if partitions is not None else {}
+
+def available_sources():
+    """Partition names a source filter can select, with their chunk counts."""
+    return _available_sources(_load_index())
+
+def resolve_sources(sources, corpus=None):
+    """
+    Partition names to search for a source filter.
+
+    Filters are matched by partition name ("ipc", "IPC") or by a source file
+    name ("ipc_qa.json"). Returns None, meaning the whole corpus, when there
+    is no filter or it selects every partition. `corpus` is the snapshot the
+    search will use (default: the current one).
+
+    Raises:
+        UnknownSourceError: When a filter matches no partition
+    """
+    if not sources:
+        return None
+    available = _available_sources(corpus or _load_index())
+    names = sorted({partition_name(source) for source in sources})
+    unknown = [source for source in sources if partition_name(source) not in available]
+    if unknown:
+        raise UnknownSourceError(
+            f"Unknown source(s): {', '.join(unknown)}. "
+            f"Available sources: {', '.join(available) or 'none (re-run ingestion to build partitions)'}"
+        )
+    return None if len(names) == len(available) else names
+
+def _search_partition(corpus, name, queries, query_embeddings, top_k):
+    """
+    Search one partition for several queries.
+
+    Returns, per query, its dense and its BM25 ranking as chunk store rows.
+    """
+    chunk_store = corpus.chunk_store
+    partition = corpus.partition_index.get(name)
+    with span("faiss"):
+        dense = partition.dense_search(query_embeddings, top_k)
+    with span("bm25"):
+        sparse = partition.sparse_search([tokenize(query) for query in queries], top_k)
+    return [
+        [[int(row) for row in chunk_store.rows_for_ids(ids) if row >= 0] for ids in (dense_ids, sparse_ids)]
+        for dense_ids, sparse_ids in zip(dense, sparse)
+    ]
+
+def _fuse_partitions(corpus, partition_results, n_queries, top_k):
+    """
+    Fuse the rankings of every searched partition per query with RRF and fetch the chunks.
+
+    Each partition contributes its dense and its BM25 ranking, so the best
+    matches of every selected source compete on rank.
+    """
+    with span("rrf"):
+        final_indices = [
+            _reciprocal_rank_fusion([ranking for result in partition_results for ranking in result[i]], top_k)
+            for i in range(n_queries)
+        ]
+    with span("fetch"):
+        return [corpus.chunk_store.get_many(indices) for indices in final_indices]
+
+def _retrieve_partitions(corpus, queries, top_k, query_embeddings, names):
+    if query_embeddings is None:
+        query_embeddings = _encode(queries)
+    query_embeddings = np.asarray(query_embeddings, dtype=np.float32).reshape(len(queries), -1)
+    partition_results = [_search_partition(corpus, name, queries, query_embeddings, top_k) for name in names]
+    return _fuse_partitions(corpus, partition_results, len(queries), top_k)
+
+def retrieve_legal_context(query, top_k=5, query_embedding=None, sources=None):
+    """
+    Hybrid retrieval using Dense (FAISS) and Sparse (BM25) search
+    with Reciprocal Rank Fusion (RRF).
+
+    A query_embedding from embed_query may be passed to skip re-encoding.
+    With `sources` (see resolve_sources), only the partitions of those
+    source corpora are searched, and their rankings are fused together.
+    """
+    corpus = _load_index()
+    names = resolve_sources(sources, corpus)
+    if names is not None:
+        return _retrieve_partitions(corpus, [query], top_k, query_embedding, names)[0]
+
+    # 1. Dense Retrieval (FAISS)
+    if query_embedding is None:
+        query_embedding = _encode([query])
+    dense_results = _dense_search(corpus, query_embedding, top_k)
+
+    # 2. Sparse Retrieval (BM25)
+    sparse_results = _sparse_search(corpus, query, top_k)
+
+    # 3. Reciprocal Rank Fusion (RRF)
+    with span("rrf"):
+        final_indices = _reciprocal_rank_fusion([dense_results, sparse_results], top_k)
+
+    with span("fetch"):
+        return corpus.chunk_store.get_many(final_indices)
+
+def embed_queries(queries):
+    """Encode several queries in one model.encode call, returning a (n, dim) array."""
+    _load_index()
+    return np.asarray(_encode(queries), dtype=np.float32)
+
+def embed_texts(texts):
+    """
+    Encode texts that are searched outside the corpus index (document
+    sessions), returning a (n, dim) array. Needs only the model, not the index.
+    """
+    _load_model()
+    return np.asarray(_encode(texts), dtype=np.float32)
+
+def _dense_search_queries(corpus, queries, query_embeddings, top_k):
+    if query_embeddings is None:
+        query_embeddings = _encode(queries)
+    return _dense_search_batch(corpus, query_embeddings, top_k)
+
+def _fuse_and_fetch_batch(corpus, dense_results, sparse_results, top_k):
+    with span("rrf"):
+        final_indices = [
+            _reciprocal_rank_fusion([dense, sparse], top_k)
+            for dense, sparse in zip(dense_results, sparse_results)
+        ]
+    with span("fetch"):
+        return [corpus.chunk_store.get_many(indices) for indices in final_indices]
+
+def retrieve_legal_context_batch(queries, top_k=5, query_embeddings=None, sources=None):
+    """
+    retrieve_legal_context for a list of queries.
+
+    The queries are encoded in one model.encode call (unless a (n, dim)
+    query_embeddings array from embed_queries is given), searched with one
+    index.search call and scored by BM25 as one matrix; only the fusion is
+    done per query. A source filter applies to every query. Returns one list
+    of chunks per query, in order.
+    """
+    corpus = _load_index()
+    if not queries:
+        return []
+    names = resolve_sources(sources, corpus)
+    if names is not None:
+        return _retrieve_partitions(corpus, queries, top_k, query_embeddings, names)
+    dense_results = _dense_search_queries(corpus, queries, query_embeddings, top_k)
+    sparse_results = _sparse_search_batch(corpus, queries, top_k)
+    return _fuse_and_fetch_batch(corpus, dense_results, sparse_results, top_k)
+
+def match_questions(queries, query_embeddings):
+    """
+    Match queries against the stored questions of the QA corpus.
+
+    Args:
+        queries: Query texts
+        query_embeddings: (n, dim) embeddings of the queries
+
+    Returns:
+        Per query, None when there is no question index, or the best match:
+        {"question": the stored question, "answer": its curated answer,
+        "chunk": the QA chunk, "similarity": cosine similarity of the
+        questions, "sparse_agrees": whether BM25 over the questions ranks
+        the same chunk first}
+    """
+    corpus = _load_index()
+    question_index, chunk_store = corpus.question_index, corpus.chunk_store
+    if question_index is None:
+        return [None for _ in queries]
+    with span("fast_path"):
+        found = question_index.match_batch(np.asarray(query_embeddings, dtype=np.float32).reshape(len(queries), -1), queries)
+        rows = chunk_store.rows_for_ids([match["chunk_id"] if match else -1 for match in found])
+        matches = []
+        for match, row in zip(found, rows):
+            if match is None or row < 0:
+                matches.append(None)
+                continue
+            chunk = chunk_store[row]
+            matches.append({
+                "question": chunk_questions(chunk)[match["variant"]],
+                "answer": split_qa(chunk["content"])[1],
+                "chunk": chunk,
+                "similarity": match["similarity"],
+                "sparse_agrees": match["sparse_agrees"]
+            })
+    return matches
+
+class QueryBatcher:
+    """
+    Coalesces query encodes and dense searches from concurrent requests.
+
+    The first request to arrive opens a window of `window_seconds`; every
+    request submitted until it closes (or until `max_batch_size` are waiting)
+    is served by one model.encode call over the queries that still need an
+    embedding and one index.search call over those that need neighbours,
+    run on the retrieval executor. Each caller then receives its own slice.
+    Batch-of-one forward passes from many requests otherwise compete for the
+    same CPU cores.
+    """
+
+    def __init__(self, max_batch_size=32, window_seconds=0.002):
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_seconds
+        self._pending = []
+        self._timer = None
+
+        self.batches = 0
+        self.queries = 0
+
+    async def submit(self, query, query_embedding=None, top_k=0, corpus=None):
+        """
+        Queue one query and wait for its batch.
+
+        Args:
+            query: Query text, encoded unless query_embedding is given
+            query_embedding: Precomputed (1, dim) embedding
+            top_k: Nearest chunks to search for; 0 only encodes
+            corpus: CorpusIndex to search (default: the current one), so the
+                rows match the caller's other searches
+
+        Returns:
+            The query embedding as a (1, dim) array and the dense row ids
+            (empty when top_k is 0)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, query_embedding, top_k, corpus, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                _executor, _encode_and_search_batch, [item[:-1] for item in batch]
+            )
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.queries += len(batch)
+        for (*_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": self.queries / self.batches if self.batches else 0.0
+        }
+
+def _encode_and_search_batch(items):
+    """
+    Serve a batch of (query, query_embedding, top_k, corpus) items for QueryBatcher.
+
+    Returns one (embedding, dense_row_ids) pair per item.
+    """
+    current = _load_index()
+    embeddings = [embedding for _, embedding, _, _ in items]
+    to_encode = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if to_encode:
+        encoded = _encode([items[i][0] for i in to_encode])
+        for i, embedding in zip(to_encode, encoded):
+            embeddings[i] = embedding.reshape(1, -1)
+
+    dense_results = [[] for _ in items]
+    # One search per snapshot; only items submitted around a reload differ
+    by_corpus = {}
+    for i, (_, _, top_k, corpus) in enumerate(items):
+        if top_k > 0:
+            by_corpus.setdefault(id(corpus or current), (corpus or current, []))[1].append(i)
+    for corpus, to_search in by_corpus.values():
+        max_top_k = max(items[i][2] for i in to_search)
+        searched = _dense_search_batch(corpus, np.vstack([embeddings[i] for i in to_search]), max_top_k)
+        for i, rows in zip(to_search, searched):
+            # Rows are ordered by distance, so a shorter top_k is a prefix of the longest one
+            dense_results[i] = rows[:items[i][2]]
+
+    return list(zip(embeddings, dense_results))
+
+query_batcher = QueryBatcher(BATCH_MAX_SIZE, BATCH_WINDOW_SECONDS) if BATCHING_ENABLED else None
+
+async def embed_query_async(query):
+    """Non-blocking variant of embed_query."""
+    if query_batcher is not None:
+        with span("embed_batch"):
+            embedding, _ = await query_batcher.submit(query)
+        return embedding
+    return await _in_executor(embed_query, query)
+
+def _encode_and_search(corpus, query, top_k):
+    return _dense_search(corpus, _encode([query]), top_k)
+
+async def _batched_dense_search(corpus, query, query_embedding, top_k):
+    # The batch's own embed and faiss stages are recorded without a request;
+    # this is the request's wait for its batch, window included
+    with span("dense_batch"):
+        _, dense_results = await query_batcher.submit(query, query_embedding, top_k, corpus)
+    return dense_results
+
+async def resolve_sources_async(sources, corpus=None):
+    """Non-blocking variant of resolve_sources."""
+    if not sources:
+        return None
+    return await _in_executor(resolve_sources, sources, corpus)
+
+async def _retrieve_partitions_async(corpus, queries, top_k, query_embeddings, names):
+    # The selected partitions are searched concurrently on the retrieval executor
+    if query_embeddings is None:
+        query_embeddings = await embed_queries_async(queries)
+    query_embeddings = np.asarray(query_embeddings, dtype=np.float32).reshape(len(queries), -1)
+    partition_results = await asyncio.gather(*(
+        _in_executor(_search_partition, corpus, name, queries, query_embeddings, top_k) for name in names
+    ))
+    return _fuse_partitions(corpus, partition_results, len(queries), top_k)
+
+async def retrieve_legal_context_async(query, top_k=5, query_embedding=None, sources=None):
+    """
+    Non-blocking variant of retrieve_legal_context.
+
+    Index loading and both retrievers run on the retrieval executor, with the
+    dense and sparse searches executing concurrently. With a source filter,
+    every selected partition is searched concurrently.
+    """
+    corpus = await _in_executor(_load_index)
+    names = await resolve_sources_async(sources, corpus)
+    if names is not None:
+        if query_embedding is None:
+            query_embedding = await embed_query_async(query)
+        return (await _retrieve_partitions_async(corpus, [query], top_k, query_embedding, names))[0]
+
+    if query_batcher is not None:
+        dense_search = _batched_dense_search(corpus, query, query_embedding, top_k)
+    elif query_embedding is None:
+        dense_search = _in_executor(_encode_and_search, corpus, query, top_k)
+    else:
+        dense_search = _in_executor(_dense_search, corpus, query_embedding, top_k)
+
+    dense_results, sparse_results = await asyncio.gather(
+        dense_search,
+        _in_executor(_sparse_search, corpus, query, top_k),
+    )
+
+    with span("rrf"):
+        final_indices = _reciprocal_rank_fusion([dense_results, sparse_results], top_k)
+
+    with span("fetch"):
+        return corpus.chunk_store.get_many(final_indices)
+
+async def hybrid_search_async(index, bm25_index, query, query_embedding, top_k):
+    """Non-blocking variant of hybrid_search."""
+    return await _in_executor(hybrid_search, index, bm25_index, query, query_embedding, top_k)
+
+async def embed_queries_async(queries):
+    """Non-blocking variant of embed_queries."""
+    return await _in_executor(embed_queries, queries)
+
+async def embed_texts_async(texts):
+    """Non-blocking variant of embed_texts."""
+    return await _in_executor(embed_texts, texts)
+
+async def retrieve_legal_context_batch_async(queries, top_k=5, query_embeddings=None, sources=None):
+    """
+    Non-blocking variant of retrieve_legal_context_batch.
+
+    The batch is already one encode and one search, so it bypasses the
+    QueryBatcher; the dense and sparse searches (or the selected partitions)
+    run concurrently.
+    """
+    corpus = await _in_executor(_load_index)
+    if not queries:
+        return []
+    names = await resolve_sources_async(sources, corpus)
+    if names is not None:
+        return await _retrieve_partitions_async(corpus, queries, top_k, query_embeddings, names)
+    dense_results, sparse_results = await asyncio.gather(
+        _in_executor(_dense_search_queries, corpus, queries, query_embeddings, top_k),
+        _in_executor(_sparse_search_batch, corpus, queries, top_k),
+    )
+    return _fuse_and_fetch_batch(corpus, dense_results, sparse_results, top_k)
+
+async def match_questions_async(queries, query_embeddings):
+    """Non-blocking variant of match_questions."""
+    return await _in_executor(match_questions, queries, query_embeddings)
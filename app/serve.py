@@ -0,0 +1,222 @@
+"""
+Serve the API from several worker processes that share the model and indexes.
+
+`uvicorn app.main:app --workers N` starts every worker as a fresh
+interpreter, so each one loads its own copy of the embedding model and the
+indexes. This launcher loads them once and then forks the workers, which
+share those pages copy-on-write:
+
+    python -m app.serve --workers 4 --port 8000
+
+With --embedding-server the model lives in one separate process instead
+(see app.embedding_server) and the workers only hold the indexes:
+
+    python -m app.serve --workers 8 --embedding-server
+
+Document sessions (/analyze/sessions) are kept in the memory of one
+process, so they are turned off when there is more than one worker.
+
+Prometheus metrics are kept in PROMETHEUS_MULTIPROC_DIR (a temporary
+directory unless it is set), so /metrics reports all workers together.
+"""
+import argparse
+import gc
+import os
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from typing import Optional, Set
+
+from app.config import env_flag
+
+# Seconds to wait for the embedding server to load its model and listen
+EMBEDDING_SERVER_START_TIMEOUT = 300
+# Seconds between restarts of a worker that exited unexpectedly
+RESTART_DELAY = 1.0
+
+def start_embedding_server() -> subprocess.Popen:
+    """
+    Start app.embedding_server on a private Unix socket and wait until it listens.
+
+    EMBEDDING_SERVER and EMBEDDING_SERVER_AUTHKEY are set in this process, so
+    they must be in place before app.rag is imported.
+    """
+    address = os.path.join(tempfile.mkdtemp(prefix="legal-embedding-"), "embedding.sock")
+    os.environ["EMBEDDING_SERVER"] = address
+    os.environ.setdefault("EMBEDDING_SERVER_AUTHKEY", secrets.token_hex(16))
+    process = subprocess.Popen([sys.executable, "-m", "app.embedding_server", "--socket", address])
+
+    deadline = time.monotonic() + EMBEDDING_SERVER_START_TIMEOUT
+    while not os.path.exists(address):
+        if process.poll() is not None:
+            raise RuntimeError(f"Embedding server exited with code {process.returncode}")
+        if time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError("Embedding server did not start in time")
+        time.sleep(0.1)
+    return process
+
+def prepare_metrics_dir() -> bool:
+    """
+    Point PROMETHEUS_MULTIPROC_DIR at an empty directory for the workers' metrics.
+
+    prometheus_client reads it when app.metrics is imported, so this runs
+    before app.main is. Returns whether the directory is a temporary one
+    that is removed on exit.
+    """
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="legal-metrics-")
+        return True
+    # Samples left by a previous run would otherwise be added to this one's
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    return False
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """The listening socket all workers accept connections on."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+def run_worker(app, sock: socket.socket, log_level: str) -> None:
+    import uvicorn
+
+    # uvicorn installs its own handlers for these
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    workers: int = 2,
+    embedding_server: bool = False,
+    log_level: str = "info"
+) -> None:
+    """
+    Load the model and indexes, fork the workers and restart any that exit.
+
+    SIGTERM or SIGINT stops the workers (each finishes its open requests,
+    as with plain uvicorn) and then the embedding server.
+    """
+    server_process: Optional[subprocess.Popen] = None
+    if embedding_server:
+        server_process = start_embedding_server()
+
+    temporary_metrics_dir = prepare_metrics_dir()
+    if workers > 1 and env_flag("ANALYZE_SESSIONS_ENABLED", "true"):
+        # Sessions live in the memory of one worker, but every worker accepts
+        # on the same socket, so a follow-up would rarely reach it
+        print("Document sessions are disabled: they cannot be shared between workers")
+        os.environ["ANALYZE_SESSIONS_ENABLED"] = "false"
+
+    # Imported only now: app.rag reads EMBEDDING_SERVER at import time
+    from app.main import app
+    from app.rag import preload
+    from prometheus_client import multiprocess
+
+    started = time.perf_counter()
+    try:
+        preload()
+        print(f"Loaded model and indexes in {time.perf_counter() - started:.2f}s")
+    except FileNotFoundError as e:
+        # Workers load lazily once an index exists, as with plain uvicorn
+        print(f"Starting without a preloaded index: {e}")
+    # Everything loaded so far is excluded from garbage collection, so the
+    # collector does not write to (and thereby copy) the shared pages
+    gc.freeze()
+
+    sock = bind_socket(host, port)
+    # The port the OS picked when 0 was given
+    port = sock.getsockname()[1]
+    print(f"Serving on http://{host}:{port} with {workers} workers")
+    children: Set[int] = set()
+    stopping = False
+
+    def spawn() -> None:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(app, sock, log_level)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if server_process is not None and pid == server_process.pid:
+            server_process.returncode = status
+            if not stopping:
+                # Workers cannot encode queries without it; leave the restart to the supervisor
+                print(f"Embedding server exited with status {status}; stopping")
+                stop(signal.SIGTERM, None)
+            continue
+        if pid not in children:
+            continue
+        children.discard(pid)
+        multiprocess.mark_process_dead(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}; starting a new one")
+            time.sleep(RESTART_DELAY)
+            if not stopping:
+                spawn()
+
+    sock.close()
+    if temporary_metrics_dir:
+        shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    if server_process is not None:
+        if server_process.returncode is None:
+            server_process.terminate()
+            server_process.wait()
+        shutil.rmtree(os.path.dirname(os.environ["EMBEDDING_SERVER"]), ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument("--embedding-server", action="store_true",
+                        help="Encode queries in one shared embedding process instead of in every worker")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.embedding_server, args.log_level)
@@ -1,41 +1,1065 @@
-from app.rag import retrieve_legal_context
-from app.llm import generate_response
-from app.prompts import legal_prompt
-from typing import List, Dict, Any
+from app.rag import (
+    retrieve_legal_context_async,
+    retrieve_legal_context_batch_async,
+    embed_query_async,
+    embed_queries_async,
+    embed_texts_async,
+    hybrid_search_async,
+    match_questions_async,
+    resolve_sources_async,
+    index_version
+)
+from app.partitions import partition_name
+from app.llm import generate_response_async, generate_response_stream
+from app.prompts import (
+    legal_prompt,
+    extract_key_points_prompt,
+    extract_section_key_points_prompt,
+    merge_key_points_prompt,
+    analyze_key_points_prompt,
+    rewrite_answer_prompt,
+    document_question_prompt
+)
+from app.document_processor import split_text_chunks
+from app.chunking import estimate_tokens, split_to_budget
+from app.context import DEFAULT_CONTEXT_TOKENS, pack_context
+from app.dedup import numbers
+from app.sessions import DocumentIndex, DocumentSessionStore, create_session_store, document_chunks
+from app.config import env_flag
+from app.metrics import answer_seconds, cache_lookups, fast_path_lookups, record_stage, span
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, FrozenSet, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import re
+import sys
+import time
+import numpy as np
+
+def normalize_query(query: str) -> str:
+    """Lowercase a query and strip punctuation and repeated whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of generated answers keyed by query.
+
+    Exact repeats are found by their normalized text; reworded questions are
+    matched by cosine similarity of their query embeddings, but only when they
+    mention the same numbers (sections, articles, years), which embeddings
+    barely tell apart. Entries are evicted least-recently-used once either the
+    entry or memory limit is reached, expire after a TTL, and are dropped
+    together whenever the index version changes.
+
+    Answers retrieved from a subset of the sources are stored under a scope
+    naming those sources and only returned for queries with the same scope.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.95,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        max_bytes: int = 64 * 1024 * 1024
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        # Stacked unit embeddings of all entries, rebuilt lazily after changes
+        self._matrix = None
+        self._matrix_keys: List[str] = []
+        self._matrix_scopes = np.empty(0, dtype=object)
+        self._matrix_numbers: List[FrozenSet[str]] = []
+
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, version) -> None:
+        if version != self._version:
+            if self._entries:
+                self.invalidate()
+            self._version = version
+
+    def invalidate(self) -> None:
+        """Drop every cached answer."""
+        self._entries.clear()
+        self._bytes = 0
+        self._matrix = None
+        self._matrix_keys = []
+        self.invalidations += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+        self._matrix = None
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["created_at"] > self.ttl_seconds
+
+    def _get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._is_expired(entry):
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_exact(self, query: str, version, scope: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Look up a query by its normalized text.
+
+        Does not count a miss, since a semantic lookup usually follows.
+        """
+        self._check_version(version)
+        entry = self._get_entry(_cache_key(query, scope))
+        if entry is not None:
+            self.hits_exact += 1
+            cache_lookups.labels(cache="answer", result="hit").inc()
+        return entry
+
+    def get_similar(self, query: str, embedding: np.ndarray, version, scope: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Look up the most similar cached query of the same scope above the
+        similarity threshold that mentions the same numbers as `query`.
+        """
+        self._check_version(version)
+        if self._entries:
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[k]["embedding"] for k in self._matrix_keys])
+                self._matrix_scopes = np.array([self._entries[k]["scope"] for k in self._matrix_keys], dtype=object)
+                self._matrix_numbers = [self._entries[k]["numbers"] for k in self._matrix_keys]
+            query_numbers = numbers(query)
+            # "Section 302" and "section 304" embed almost alike but have different answers
+            candidates = (self._matrix_scopes == scope) & np.array(
+                [entry_numbers == query_numbers for entry_numbers in self._matrix_numbers]
+            )
+            similarities = np.where(candidates, self._matrix @ _unit_vector(embedding), -np.inf)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                entry = self._get_entry(self._matrix_keys[best])
+                if entry is not None:
+                    self.hits_semantic += 1
+                    cache_lookups.labels(cache="answer", result="semantic_hit").inc()
+                    return entry
+        self.misses += 1
+        cache_lookups.labels(cache="answer", result="miss").inc()
+        return None
+
+    def put(
+        self,
+        query: str,
+        embedding: np.ndarray,
+        answer: str,
+        sources: List[Dict[str, Any]],
+        version,
+        scope: str = ""
+    ) -> None:
+        """Store an answer, evicting least-recently-used entries to stay within limits."""
+        self._check_version(version)
+        key = _cache_key(query, scope)
+        if key in self._entries:
+            self._remove(key)
+
+        unit_embedding = _unit_vector(embedding)
+        size = (
+            sys.getsizeof(key)
+            + sys.getsizeof(answer)
+            + sum(sys.getsizeof(str(source)) for source in sources)
+            + unit_embedding.nbytes
+        )
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = {
+            "answer": answer,
+            "sources": sources,
+            "embedding": unit_embedding,
+            "scope": scope,
+            "question": query,
+            "numbers": numbers(query),
+            "created_at": time.monotonic(),
+            "size": size
+        }
+        self._bytes += size
+        self._matrix = None
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits_exact + self.hits_semantic + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_rate": (self.hits_exact + self.hits_semantic) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+def _cache_key(query: str, scope: str) -> str:
+    return f"{scope}\0{normalize_query(query)}" if scope else normalize_query(query)
+
+def source_scope(names: Optional[List[str]]) -> str:
+    """Answer cache scope of the partitions a query searches ("" for the whole corpus)."""
+    return ",".join(names) if names else ""
+
+def _unit_vector(embedding: np.ndarray) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+def create_answer_cache() -> Optional[SemanticAnswerCache]:
+    """Build the answer cache from ANSWER_CACHE_* environment settings."""
+    if not env_flag("ANSWER_CACHE_ENABLED", "true"):
+        return None
+    return SemanticAnswerCache(
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95")),
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+        max_bytes=int(float(os.getenv("ANSWER_CACHE_MAX_MB", "64")) * 1024 * 1024)
+    )
 
 class QueryProcessingService:
-    async def process_query(self, query: str) -> Dict[str, Any]:
+    def __init__(
+        self,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+        top_k: int = 5,
+        batch_concurrency: int = 8,
+        fast_path_threshold: Optional[float] = None,
+        fast_path_rewrite: bool = False
+    ):
+        self.answer_cache = answer_cache
+        self.context_tokens = context_tokens
+        self.top_k = top_k
+        self.batch_concurrency = batch_concurrency
+        # Questions this similar to a curated question get its answer (None disables)
+        self.fast_path_threshold = fast_path_threshold
+        self.fast_path_rewrite = fast_path_rewrite
+
+    def _no_tokens(self) -> Dict[str, Any]:
+        return {"prompt": 0, "context": 0, "context_budget": self.context_tokens}
+
+    async def prepare_query(self, query: str, sources: Optional[List[str]] = None) -> Dict[str, Any]:
         """
-        Orchestrates the retrieval and generation process for a user query.
+        Runs retrieval and context building for a user query.
+
+        Returns the LLM prompt together with the sources it was built from.
+        When the answer cache holds an answer for the query, or the query is
+        confidently one of the curated questions (the fast path), the answer
+        is returned under "answer" instead and retrieval is skipped. With
+        fast_path_rewrite, the fast path returns a short rewrite prompt
+        instead of the answer.
+
+        `sources` restricts retrieval to the partitions of those source
+        corpora (see app.rag.resolve_sources); unknown names raise
+        UnknownSourceError.
         """
+        started = time.perf_counter()
+        version = index_version()
+        names = await resolve_sources_async(sources)
+        scope = source_scope(names)
+        query_embedding = None
+
+        # 0. Answer cache: exact repeat first, then a reworded question
+        if self.answer_cache is not None:
+            cached = self.answer_cache.get_exact(query, version, scope)
+            if cached is None:
+                query_embedding = await embed_query_async(query)
+                cached = self.answer_cache.get_similar(query, query_embedding, version, scope)
+            if cached is not None:
+                return self._cached_answer(query, cached, started)
+
+        # Fast path: the question is (nearly) one of the curated QA questions
+        if self.fast_path_threshold is not None:
+            if query_embedding is None:
+                query_embedding = await embed_query_async(query)
+            match = (await match_questions_async([query], query_embedding))[0]
+            fast = self._fast_path(query, match, names, query_embedding, version, started)
+            if fast is not None:
+                return fast
+
         # 1. Retrieval
         try:
-            context_chunks = retrieve_legal_context(query)
+            with span("retrieval"):
+                context_chunks = await retrieve_legal_context_async(
+                    query, top_k=self.top_k, query_embedding=query_embedding, sources=names
+                )
         except FileNotFoundError as e:
             # Re-raise or handle specific errors
             raise e
 
-        context_texts = []
-        sources = []
+        return self._build_prompt(query, context_chunks, names, query_embedding, version, started)
 
+    def _cached_answer(self, query: str, cached: Dict[str, Any], started: float) -> Dict[str, Any]:
+        return {
+            "question": query,
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "cached": True,
+            "fast_path": False,
+            "tokens": self._no_tokens(),
+            "started": started
+        }
+
+    def _is_confident(self, query: str, match: Optional[Dict[str, Any]], names: Optional[List[str]]) -> bool:
+        """
+        Whether a question index match is safe to answer from directly.
+
+        The dense similarity must clear the threshold, BM25 over the
+        questions must agree on the chunk, and both questions must mention
+        the same numbers: "section 302" must not be answered as "section 304".
+        With a source filter, the matched question must come from one of the
+        selected sources.
+        """
+        return (
+            match is not None
+            and match["similarity"] >= self.fast_path_threshold
+            and match["sparse_agrees"]
+            and numbers(query) == numbers(match["question"])
+            and (names is None or partition_name(match["chunk"]["metadata"]["source"]) in names)
+        )
+
+    def _fast_path(
+        self,
+        query: str,
+        match: Optional[Dict[str, Any]],
+        names: Optional[List[str]],
+        query_embedding: np.ndarray,
+        version,
+        started: float
+    ) -> Optional[Dict[str, Any]]:
+        if not self._is_confident(query, match, names):
+            fast_path_lookups.labels(result="miss").inc()
+            return None
+        fast_path_lookups.labels(result="hit").inc()
+        prepared = {
+            "question": query,
+            "sources": [match["chunk"]["metadata"]],
+            "cached": False,
+            "fast_path": True,
+            "match": {"question": match["question"], "similarity": round(match["similarity"], 4)},
+            "query_embedding": query_embedding,
+            "index_version": version,
+            "scope": source_scope(names),
+            "started": started
+        }
+        if self.fast_path_rewrite:
+            prompt = rewrite_answer_prompt(query, match["question"], match["answer"])
+            prepared["prompt"] = prompt
+            prepared["tokens"] = {**self._no_tokens(), "prompt": estimate_tokens(prompt)}
+        else:
+            prepared["answer"] = match["answer"]
+            prepared["tokens"] = self._no_tokens()
+        return prepared
+
+    def _build_prompt(
+        self,
+        query: str,
+        context_chunks: List[Any],
+        names: Optional[List[str]],
+        query_embedding: Optional[np.ndarray],
+        version,
+        started: float
+    ) -> Dict[str, Any]:
         # 2. Preprocessing / Formatting
-        for chunk in context_chunks:
-            if isinstance(chunk, dict) and "content" in chunk:
-                context_texts.append(chunk["content"])
-                sources.append(chunk["metadata"])
-            else:
-                context_texts.append(str(chunk))
+        context_chunks = [
+            chunk if isinstance(chunk, dict) and "content" in chunk else {"content": str(chunk), "metadata": None}
+            for chunk in context_chunks
+        ]
+        with span("prompt"):
+            packed = pack_context(context_chunks, self.context_tokens)
+            sources = [chunk["metadata"] for chunk in packed["chunks"] if chunk["metadata"] is not None]
+
+            # 3. Augmentation (Context Building)
+            prompt = legal_prompt(packed["context"], query)
+
+        return {
+            "question": query,
+            "prompt": prompt,
+            "sources": sources,
+            "cached": False,
+            "fast_path": False,
+            "tokens": {
+                "prompt": estimate_tokens(prompt),
+                "context": packed["tokens"],
+                "context_budget": self.context_tokens,
+                "chunks_retrieved": len(context_chunks),
+                "chunks_used": len(packed["chunks"]),
+                "deduplicated": packed["deduplicated"],
+                "truncated": packed["truncated"]
+            },
+            "query_embedding": query_embedding,
+            "index_version": version,
+            "scope": source_scope(names),
+            "started": started
+        }
 
-        combined_context = "\n".join(context_texts)
+    def _store_answer(self, prepared: Dict[str, Any], answer: str) -> None:
+        if self.answer_cache is None or prepared["query_embedding"] is None or not answer:
+            return
+        self.answer_cache.put(
+            prepared["question"],
+            prepared["query_embedding"],
+            answer,
+            prepared["sources"],
+            prepared["index_version"],
+            prepared["scope"]
+        )
 
-        # 3. Augmentation (Context Building)
-        prompt = legal_prompt(combined_context, query)
+    async def process_query(self, query: str, sources: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Orchestrates the retrieval and generation process for a user query.
+        """
+        prepared = await self.prepare_query(query, sources)
 
         # 4. Generation
-        answer = generate_response(prompt)
+        if "answer" in prepared:
+            answer = prepared["answer"]
+        else:
+            answer = await generate_response_async(prepared["prompt"])
+            self._store_answer(prepared, answer)
+
+        self._record_answer(prepared)
+        return self._response(prepared, answer)
+
+    def _record_answer(self, prepared: Dict[str, Any]) -> None:
+        path = "cache" if prepared["cached"] else "fast_path" if prepared["fast_path"] else "generated"
+        answer_seconds.labels(path=path).observe(time.perf_counter() - prepared["started"])
+
+    def _response(self, prepared: Dict[str, Any], answer: str) -> Dict[str, Any]:
+        response = {
+            "question": prepared["question"],
+            "answer": answer,
+            "sources": prepared["sources"],
+            "cached": prepared["cached"],
+            "fast_path": prepared["fast_path"],
+            "tokens": prepared["tokens"]
+        }
+        if prepared["fast_path"]:
+            response["match"] = prepared["match"]
+        return response
+
+    async def prepare_batch(self, queries: List[str], sources: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        prepare_query for a list of queries, in order.
+
+        Cache misses are encoded in one model.encode call, matched against
+        the curated questions together, and retrieved together (see
+        retrieve_legal_context_batch) instead of one by one. A source filter
+        applies to every query.
+        """
+        started = time.perf_counter()
+        version = index_version()
+        names = await resolve_sources_async(sources)
+        scope = source_scope(names)
+        prepared: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        pending = list(range(len(queries)))
+        query_embeddings = None
+
+        def drop_prepared():
+            # Keep the queries (and their embeddings) that still need an answer
+            nonlocal pending, query_embeddings
+            still_pending = [n for n, i in enumerate(pending) if prepared[i] is None]
+            if query_embeddings is not None:
+                query_embeddings = query_embeddings[still_pending]
+            pending = [pending[n] for n in still_pending]
+
+        # 0. Answer cache: exact repeats, then reworded questions
+        if self.answer_cache is not None:
+            for i, query in enumerate(queries):
+                cached = self.answer_cache.get_exact(query, version, scope)
+                if cached is not None:
+                    prepared[i] = self._cached_answer(query, cached, started)
+            drop_prepared()
+            if pending:
+                query_embeddings = await embed_queries_async([queries[i] for i in pending])
+                for i, query_embedding in zip(pending, query_embeddings):
+                    cached = self.answer_cache.get_similar(queries[i], query_embedding, version, scope)
+                    if cached is not None:
+                        prepared[i] = self._cached_answer(queries[i], cached, started)
+                drop_prepared()
+
+        # Fast path, matched for the whole batch at once
+        if self.fast_path_threshold is not None and pending:
+            if query_embeddings is None:
+                query_embeddings = await embed_queries_async([queries[i] for i in pending])
+            matches = await match_questions_async([queries[i] for i in pending], query_embeddings)
+            for i, query_embedding, match in zip(pending, query_embeddings, matches):
+                prepared[i] = self._fast_path(queries[i], match, names, query_embedding, version, started)
+            drop_prepared()
+
+        # 1. Retrieval, batched
+        if pending:
+            with span("retrieval"):
+                chunk_lists = await retrieve_legal_context_batch_async(
+                    [queries[i] for i in pending], top_k=self.top_k, query_embeddings=query_embeddings, sources=names
+                )
+            for n, (i, context_chunks) in enumerate(zip(pending, chunk_lists)):
+                query_embedding = query_embeddings[n] if query_embeddings is not None else None
+                prepared[i] = self._build_prompt(queries[i], context_chunks, names, query_embedding, version, started)
+        return prepared
+
+    async def answer_batch(
+        self,
+        queries: List[str],
+        sources: Optional[List[str]] = None
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Answer a list of queries, yielding (position, response) as each completes.
+
+        Retrieval runs once for the whole batch; the LLM calls then run
+        concurrently, at most `batch_concurrency` at a time. A failed
+        generation is reported under "error" in its own response rather
+        than failing the batch.
+        """
+        prepared = await self.prepare_batch(queries, sources)
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def answer(i: int, item: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+            if "answer" in item:
+                self._record_answer(item)
+                return i, self._response(item, item["answer"])
+            try:
+                async with semaphore:
+                    generated = await generate_response_async(item["prompt"])
+            except Exception as e:
+                return i, {**self._response(item, None), "error": f"Error processing request: {str(e)}"}
+            self._store_answer(item, generated)
+            self._record_answer(item)
+            return i, self._response(item, generated)
+
+        tasks = [asyncio.ensure_future(answer(i, item)) for i, item in enumerate(prepared)]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield await completed
+        finally:
+            # The client went away mid-stream; don't keep generating for it
+            for task in tasks:
+                task.cancel()
+
+    async def process_batch(self, queries: List[str], sources: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Answer a list of queries, returning the responses in input order."""
+        responses: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        async for i, response in self.answer_batch(queries, sources):
+            responses[i] = response
+        return responses
 
+    async def stream_answer(self, prepared: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Streams the generated answer for a query returned by prepare_query.
+        """
+        if "answer" in prepared:
+            self._record_answer(prepared)
+            yield prepared["answer"]
+            return
+
+        tokens = []
+        async for token in generate_response_stream(prepared["prompt"]):
+            tokens.append(token)
+            yield token
+        self._store_answer(prepared, "".join(tokens))
+        self._record_answer(prepared)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        if self.answer_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.answer_cache.stats()}
+
+def create_query_service() -> QueryProcessingService:
+    """Build the /ask service from RAG_*, ASK_BATCH_* and ANSWER_CACHE_* environment settings."""
+    fast_path = env_flag("RAG_FAST_PATH_ENABLED", "true")
+    return QueryProcessingService(
+        answer_cache=create_answer_cache(),
+        context_tokens=int(os.getenv("RAG_CONTEXT_TOKENS", str(DEFAULT_CONTEXT_TOKENS))),
+        top_k=int(os.getenv("RAG_TOP_K", "5")),
+        batch_concurrency=int(os.getenv("ASK_BATCH_CONCURRENCY", "8")),
+        fast_path_threshold=float(os.getenv("RAG_FAST_PATH_THRESHOLD", "0.92")) if fast_path else None,
+        fast_path_rewrite=env_flag("RAG_FAST_PATH_REWRITE", "false")
+    )
+
+def document_digest(content: bytes) -> str:
+    """Content address of an uploaded file."""
+    return hashlib.sha256(content).hexdigest()
+
+class DocumentResultCache:
+    """
+    In-memory cache of /analyze results keyed by the SHA-256 of the uploaded file.
+
+    An entry holds the extraction result, document summary and key points of
+    one document, plus the analyses of up to `max_questions` questions asked
+    about it. Entries are evicted least-recently-used once either the entry or
+    memory limit is reached, and expire after a TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        ttl_seconds: float = 86400,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_questions: int = 16
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_questions = max_questions
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.analysis_hits = 0
+        self.analysis_misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, digest: str) -> None:
+        entry = self._entries.pop(digest)
+        self._bytes -= entry["size"]
+
+    def _get_entry(self, digest: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["created_at"] > self.ttl_seconds:
+            self._remove(digest)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(digest)
+        return entry
+
+    def _resize(self, entry: Dict[str, Any], size: int) -> None:
+        self._bytes += size - entry["size"]
+        entry["size"] = size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """Return the cached extraction result, summary, key points and section count of a document."""
+        entry = self._get_entry(digest)
+        if entry is None:
+            self.misses += 1
+            cache_lookups.labels(cache="document", result="miss").inc()
+            return None
+        self.hits += 1
+        cache_lookups.labels(cache="document", result="hit").inc()
+        return entry
+
+    def put(
+        self,
+        digest: str,
+        extraction_result: Dict[str, Any],
+        summary: Dict[str, Any],
+        key_points: str,
+        sections: int
+    ) -> None:
+        if digest in self._entries:
+            self._remove(digest)
+        size = (
+            sys.getsizeof(extraction_result["full_text"])
+            + sum(sys.getsizeof(chunk["text"]) for chunk in extraction_result["text_chunks"])
+            + sys.getsizeof(key_points)
+        )
+        if size > self.max_bytes:
+            return
+        self._entries[digest] = {
+            "extraction_result": extraction_result,
+            "summary": summary,
+            "key_points": key_points,
+            "sections": sections,
+            "analyses": OrderedDict(),
+            "created_at": time.monotonic(),
+            "size": 0
+        }
+        self._resize(self._entries[digest], size)
+
+    def get_analysis(self, digest: str, question: Optional[str]) -> Optional[str]:
+        """Return the cached analysis of a document for a question (None for the general analysis)."""
+        entry = self._entries.get(digest)
+        analysis = None if entry is None else entry["analyses"].get(normalize_query(question or ""))
+        if analysis is None:
+            self.analysis_misses += 1
+            cache_lookups.labels(cache="analysis", result="miss").inc()
+            return None
+        entry["analyses"].move_to_end(normalize_query(question or ""))
+        self.analysis_hits += 1
+        cache_lookups.labels(cache="analysis", result="hit").inc()
+        return analysis
+
+    def put_analysis(self, digest: str, question: Optional[str], analysis: str) -> None:
+        entry = self._entries.get(digest)
+        if entry is None:
+            return
+        analyses = entry["analyses"]
+        size = entry["size"]
+        key = normalize_query(question or "")
+        if key in analyses:
+            size -= sys.getsizeof(analyses.pop(key))
+        analyses[key] = analysis
+        size += sys.getsizeof(analysis)
+        while len(analyses) > self.max_questions:
+            size -= sys.getsizeof(analyses.pop(next(iter(analyses))))
+        self._resize(entry, size)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
         return {
-            "question": query,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "analysis_hits": self.analysis_hits,
+            "analysis_misses": self.analysis_misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+def create_document_cache() -> Optional[DocumentResultCache]:
+    """Build the /analyze result cache from ANALYZE_CACHE_* environment settings."""
+    if not env_flag("ANALYZE_CACHE_ENABLED", "true"):
+        return None
+    return DocumentResultCache(
+        max_entries=int(os.getenv("ANALYZE_CACHE_MAX_ENTRIES", "128")),
+        ttl_seconds=float(os.getenv("ANALYZE_CACHE_TTL_SECONDS", "86400")),
+        max_bytes=int(float(os.getenv("ANALYZE_CACHE_MAX_MB", "256")) * 1024 * 1024),
+        max_questions=int(os.getenv("ANALYZE_CACHE_MAX_QUESTIONS", "16"))
+    )
+
+class DocumentAnalysisService:
+    """
+    Map-reduce key point extraction for uploaded documents.
+
+    Extracted pages are grouped into sections of at most `section_tokens`.
+    Key points are extracted from every section concurrently, with at most
+    `concurrency` LLM calls in flight per document, then merged into one list
+    (in several rounds when they do not fit in `merge_tokens`). Documents
+    that fit in a single section keep the original single-call path.
+
+    With a result cache, re-uploads of the same file reuse its extraction and
+    key points, and only questions not asked before are analyzed again.
+    """
+
+    def __init__(
+        self,
+        section_tokens: int = 3000,
+        merge_tokens: int = 6000,
+        concurrency: int = 4,
+        result_cache: Optional[DocumentResultCache] = None
+    ):
+        self.section_tokens = section_tokens
+        self.merge_tokens = merge_tokens
+        self.concurrency = concurrency
+        self.result_cache = result_cache
+
+    def cached_document(self, digest: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up an earlier upload of the same file.
+
+        Returns a document dict (see new_document) with its key points filled
+        in, or None.
+        """
+        if self.result_cache is None:
+            return None
+        entry = self.result_cache.get(digest)
+        if entry is None:
+            return None
+        return {
+            "digest": digest,
+            "extraction_result": entry["extraction_result"],
+            "summary": entry["summary"],
+            "key_points": entry["key_points"],
+            "sections": entry["sections"],
+            "cached": True
+        }
+
+    def remember_key_points(self, document: Dict[str, Any], key_points: str, sections: int) -> None:
+        document["key_points"] = key_points
+        document["sections"] = sections
+        if self.result_cache is not None and key_points:
+            self.result_cache.put(document["digest"], document["extraction_result"], document["summary"], key_points, sections)
+
+    def cached_analysis(self, document: Dict[str, Any], question: Optional[str]) -> Optional[str]:
+        if self.result_cache is None or not document["cached"]:
+            return None
+        return self.result_cache.get_analysis(document["digest"], question)
+
+    def remember_analysis(self, document: Dict[str, Any], question: Optional[str], analysis: str) -> None:
+        if self.result_cache is not None and analysis:
+            self.result_cache.put_analysis(document["digest"], question, analysis)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        if self.result_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.result_cache.stats()}
+
+    def split(self, extraction_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return split_text_chunks(extraction_result["text_chunks"], self.section_tokens)
+
+    async def prepare_key_points(self, extraction_result: Dict[str, Any], timings: Dict[str, float]) -> Tuple[str, str, int]:
+        """
+        Run the map stage (and any intermediate merge rounds) for a document.
+
+        Returns the prompt of the final key points call, which the caller
+        either awaits or streams, the timings key that call belongs to, and
+        the number of sections the document was split into.
+        """
+        sections = self.split(extraction_result)
+        if len(sections) <= 1:
+            return extract_key_points_prompt(extraction_result["full_text"]), "key_points_map_seconds", len(sections)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def generate(prompt: str) -> str:
+            async with semaphore:
+                return await generate_response_async(prompt)
+
+        start = time.perf_counter()
+        section_key_points = await asyncio.gather(*(
+            generate(extract_section_key_points_prompt(
+                section["text"], section["first_page"], section["last_page"], extraction_result["total_pages"]
+            ))
+            for section in sections
+        ))
+        timings["key_points_map_seconds"] = time.perf_counter() - start
+
+        # Merge neighbouring sections until everything fits in one merge prompt
+        start = time.perf_counter()
+        while len(section_key_points) > 1 and estimate_tokens("".join(section_key_points)) > self.merge_tokens:
+            groups = _group_by_tokens(section_key_points, self.merge_tokens)
+            if len(groups) == len(section_key_points):
+                # No two neighbours fit together: cut every entry to half the
+                # budget, so that the next round merges them in pairs
+                trimmed = [_trim_to_tokens(points, self.merge_tokens // 2) for points in section_key_points]
+                if trimmed == section_key_points:
+                    break
+                section_key_points = trimmed
+                continue
+            section_key_points = await asyncio.gather(*(
+                generate(merge_key_points_prompt(group)) if len(group) > 1 else _completed(group[0])
+                for group in groups
+            ))
+        # A single merge output may still exceed the budget
+        section_key_points = [_trim_to_tokens(points, self.merge_tokens) for points in section_key_points]
+        timings["key_points_reduce_seconds"] = time.perf_counter() - start
+        return merge_key_points_prompt(section_key_points), "key_points_reduce_seconds", len(sections)
+
+    async def analyze(
+        self,
+        document: Dict[str, Any],
+        question: Optional[str] = None,
+        on_key_points: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Extract key points from a document and analyze them.
+
+        Steps whose results are already cached for the document are skipped.
+        `on_key_points` is awaited with the key points before the analysis
+        starts, so background jobs can report them early.
+
+        Returns the key points, the analysis, the number of sections,
+        per-stage timings in seconds and which results came from the cache.
+        """
+        timings = new_analysis_timings()
+        if document["key_points"] is None:
+            prompt, stage, sections = await self.prepare_key_points(document["extraction_result"], timings)
+            start = time.perf_counter()
+            key_points = await generate_response_async(prompt)
+            timings[stage] += time.perf_counter() - start
+            self.remember_key_points(document, key_points, sections)
+        if on_key_points is not None:
+            await on_key_points(document["key_points"])
+
+        analysis = self.cached_analysis(document, question)
+        analysis_cached = analysis is not None
+        if not analysis_cached:
+            start = time.perf_counter()
+            analysis = await generate_response_async(analyze_key_points_prompt(document["key_points"], question))
+            timings["analysis_seconds"] = time.perf_counter() - start
+            self.remember_analysis(document, question, analysis)
+        record_analysis_timings(timings)
+
+        return {
+            "key_points": document["key_points"],
+            "analysis": analysis,
+            "sections": document["sections"],
+            "timings": timings,
+            "cached": {"document": document["cached"], "analysis": analysis_cached}
+        }
+
+def new_document(digest: str, extraction_result: Dict[str, Any], summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Document dict for a freshly extracted upload, as consumed by DocumentAnalysisService.analyze."""
+    return {
+        "digest": digest,
+        "extraction_result": extraction_result,
+        "summary": summary,
+        "key_points": None,
+        "sections": None,
+        "cached": False
+    }
+
+def new_analysis_timings() -> Dict[str, float]:
+    return {"key_points_map_seconds": 0.0, "key_points_reduce_seconds": 0.0, "analysis_seconds": 0.0}
+
+def record_analysis_timings(timings: Dict[str, float]) -> None:
+    """Record the /analyze stages that ran (cached ones took 0s) as metric stages."""
+    for key, seconds in timings.items():
+        if seconds:
+            record_stage(key[:-len("_seconds")], seconds)
+
+def _group_by_tokens(texts: List[str], max_tokens: int) -> List[List[str]]:
+    """Group consecutive texts so each group stays within max_tokens where possible."""
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def _trim_to_tokens(text: str, max_tokens: int) -> str:
+    """The leading part of text within max_tokens, cut between points (lines) where possible."""
+    return split_to_budget(text, max(1, max_tokens))[0]
+
+async def _completed(value: str) -> str:
+    return value
+
+def create_document_analysis_service() -> DocumentAnalysisService:
+    """Build the document analysis service from ANALYZE_* environment settings."""
+    return DocumentAnalysisService(
+        section_tokens=int(os.getenv("ANALYZE_SECTION_TOKENS", "3000")),
+        merge_tokens=int(os.getenv("ANALYZE_MERGE_TOKENS", "6000")),
+        concurrency=int(os.getenv("ANALYZE_CONCURRENCY", "4")),
+        result_cache=create_document_cache()
+    )
+
+class DocumentSessionService:
+    """
+    Follow-up questions about an analyzed document, answered from its own index.
+
+    A session indexes the document's chunks (see app.sessions); each
+    question retrieves its `top_k` best chunks with hybrid RRF search and
+    packs them into at most `context_tokens`, next to the document's key
+    points.
+    """
+
+    def __init__(
+        self,
+        store: Optional[DocumentSessionStore] = None,
+        top_k: int = 5,
+        context_tokens: int = DEFAULT_CONTEXT_TOKENS
+    ):
+        self.store = store
+        self.top_k = top_k
+        self.context_tokens = context_tokens
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    async def create(self, document: Dict[str, Any], filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Index a document for follow-up questions.
+
+        The chunks are encoded in one model.encode call on the retrieval
+        executor, so this can run while the document is being analyzed. Only
+        the embedding model is needed, not the corpus index. Returns the
+        session id, chunk count and idle expiry, or None when the document is
+        too large for the session memory cap or could not be indexed; the
+        analysis does not fail with it.
+        """
+        chunks = document_chunks(document["extraction_result"], filename)
+        try:
+            with span("session_index"):
+                embeddings = await embed_texts_async([chunk["content"] for chunk in chunks])
+                index = await asyncio.to_thread(DocumentIndex, chunks, embeddings)
+        except Exception as e:
+            print(f"Could not create a session for {filename}: {e}")
+            return None
+        session_id = self.store.put(index, filename, document["key_points"])
+        if session_id is None:
+            return None
+        return {"session_id": session_id, "chunks": len(index), "expires_after_idle_seconds": self.store.ttl_seconds}
+
+    def set_key_points(self, session: Optional[Dict[str, Any]], key_points: str) -> None:
+        """Add key points that became known after the session was created."""
+        if session is not None:
+            self.store.set_key_points(session["session_id"], key_points)
+
+    async def ask(self, session_id: str, question: str) -> Dict[str, Any]:
+        """
+        Answer a question about the document of a session.
+
+        Raises:
+            SessionNotFoundError: When the session does not exist or expired
+        """
+        session = self.store.get(session_id)
+        index = session["index"]
+        # Encoded like the document's chunks, outside the corpus query batcher
+        query_embedding = await embed_texts_async([question])
+        rows = await hybrid_search_async(index.index, index.bm25, question, query_embedding, self.top_k)
+        chunks = [index.chunks[row] for row in rows]
+        with span("prompt"):
+            packed = pack_context(chunks, self.context_tokens)
+            prompt = document_question_prompt(packed["context"], question, session["key_points"])
+        answer = await generate_response_async(prompt)
+        return {
+            "session_id": session_id,
+            "filename": session["filename"],
+            "question": question,
             "answer": answer,
-            "sources": sources
+            "sources": [chunk["metadata"] for chunk in packed["chunks"]],
+            "tokens": {
+                "prompt": estimate_tokens(prompt),
+                "context": packed["tokens"],
+                "context_budget": self.context_tokens,
+                "chunks_retrieved": len(chunks),
+                "chunks_used": len(packed["chunks"]),
+                "deduplicated": packed["deduplicated"],
+                "truncated": packed["truncated"]
+            }
         }
+
+    def delete(self, session_id: str) -> bool:
+        return self.store.delete(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        if self.store is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.store.stats()}
+
+def create_document_session_service() -> DocumentSessionService:
+    """Build the document session service from ANALYZE_SESSION_* environment settings."""
+    return DocumentSessionService(
+        store=create_session_store(),
+        top_k=int(os.getenv("ANALYZE_SESSION_TOP_K", "5")),
+        context_tokens=int(os.getenv("RAG_CONTEXT_TOKENS", str(DEFAULT_CONTEXT_TOKENS)))
+    )
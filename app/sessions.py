@@ -0,0 +1,193 @@
+"""
+Per-session indexes over analyzed documents, for follow-up questions.
+
+/analyze with create_session=true chunks the extracted pages the way
+ingestion chunks PDFs, embeds the chunks with the retrieval model and keeps
+an exact FAISS index and a BM25 index over them in memory, under a random
+session id. Follow-up questions are answered from the best chunks of that
+document alone, found with the same hybrid RRF retrieval as /ask, so the PDF
+is neither uploaded nor read in full again.
+"""
+import os
+import secrets
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_TOKENS, chunk_pages
+from app.config import env_flag
+from app.metrics import cache_lookups
+from app.sparse import SparseBM25Index, tokenize
+from app.vector_index import add_vectors, create_index
+
+class SessionNotFoundError(LookupError):
+    """No session has the given id, or it expired or was evicted."""
+
+def document_chunks(extraction_result: Dict[str, Any], filename: str) -> List[Dict[str, Any]]:
+    """
+    Chunk the extracted pages of an uploaded PDF.
+
+    Returns {"content", "metadata"} dicts like the corpus chunks, with the
+    file name as source and the page (range) and section when known.
+    """
+    pages = [(chunk["page"], chunk["text"]) for chunk in extraction_result["text_chunks"]]
+    max_tokens = int(os.getenv("INGEST_CHUNK_TOKENS", str(DEFAULT_CHUNK_TOKENS)))
+    overlap_tokens = int(os.getenv("INGEST_CHUNK_OVERLAP", str(DEFAULT_CHUNK_OVERLAP)))
+    chunks = []
+    for chunk in chunk_pages(pages, max_tokens, overlap_tokens):
+        metadata = {"source": filename, "type": "pdf"}
+        if chunk["page"] is not None:
+            metadata["page"] = chunk["page"]
+            if chunk["page_end"] != chunk["page"]:
+                metadata["page_end"] = chunk["page_end"]
+        if chunk["section"]:
+            metadata["section"] = chunk["section"]
+        chunks.append({"content": chunk["content"], "metadata": metadata})
+    return chunks
+
+class DocumentIndex:
+    """Exact dense (FAISS flat) and BM25 indexes over the chunks of one document."""
+
+    def __init__(self, chunks: List[Dict[str, Any]], embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.chunks = chunks
+        self.index, _ = create_index(embeddings.shape[1], "flat")
+        add_vectors(self.index, embeddings)
+        self.bm25 = SparseBM25Index.build(tokenize(chunk["content"]) for chunk in chunks)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the chunks and both indexes."""
+        vectors = self.index.ntotal * self.index.d * 4
+        texts = sum(sys.getsizeof(chunk["content"]) for chunk in self.chunks)
+        postings = sum(
+            array.nbytes
+            for array in (self.bm25.doc_len, self.bm25.indptr, self.bm25.doc_ids, self.bm25.tfs, self.bm25.idf, self.bm25.weights)
+        )
+        return vectors + texts + postings + sys.getsizeof(self.bm25.vocabulary)
+
+class DocumentSessionStore:
+    """
+    In-memory document sessions keyed by a random id.
+
+    Sessions are evicted least-recently-used once either `max_sessions` or
+    `max_bytes` is exceeded, and expire `ttl_seconds` after their last
+    question.
+    """
+
+    def __init__(self, max_sessions: int = 64, ttl_seconds: float = 1800, max_bytes: int = 256 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+
+        self.created = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    def _remove(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        self._bytes -= session["size"]
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        # Least recently used first, so expired sessions are all at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session["used_at"] <= self.ttl_seconds:
+                break
+            self._remove(session_id)
+            self.expirations += 1
+
+    def put(self, index: DocumentIndex, filename: str, key_points: Optional[str] = None) -> Optional[str]:
+        """Store a document index; returns its session id, or None when it alone exceeds the memory cap."""
+        self._expire()
+        size = index.nbytes + sys.getsizeof(key_points or "")
+        if size > self.max_bytes:
+            self.rejected += 1
+            return None
+        session_id = secrets.token_urlsafe(16)
+        self._sessions[session_id] = {
+            "index": index,
+            "filename": filename,
+            "key_points": key_points,
+            "used_at": time.monotonic(),
+            "size": size
+        }
+        self._bytes += size
+        self.created += 1
+        while len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._sessions)))
+            self.evictions += 1
+        return session_id
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        """
+        A session by id, marked as used.
+
+        Raises:
+            SessionNotFoundError: When there is no such session (any more)
+        """
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            self.misses += 1
+            cache_lookups.labels(cache="session", result="miss").inc()
+            raise SessionNotFoundError(
+                "Session not found; it may have expired. Analyze the document again to start a new one. "
+                "Sessions are kept by the server process that created them, so with several worker "
+                "processes every follow-up must be routed to that process."
+            )
+        self.hits += 1
+        cache_lookups.labels(cache="session", result="hit").inc()
+        session["used_at"] = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def set_key_points(self, session_id: str, key_points: str) -> None:
+        session = self._sessions.get(session_id)
+        if session is None or not key_points:
+            return
+        size = sys.getsizeof(key_points) - sys.getsizeof(session["key_points"] or "")
+        session["key_points"] = key_points
+        session["size"] += size
+        self._bytes += size
+
+    def delete(self, session_id: str) -> bool:
+        if session_id not in self._sessions:
+            return False
+        self._remove(session_id)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "created": self.created,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rejected": self.rejected
+        }
+
+def create_session_store() -> Optional[DocumentSessionStore]:
+    """Build the document session store from ANALYZE_SESSION_* environment settings."""
+    if not env_flag("ANALYZE_SESSIONS_ENABLED", "true"):
+        return None
+    return DocumentSessionStore(
+        max_sessions=int(os.getenv("ANALYZE_SESSION_MAX_SESSIONS", "64")),
+        ttl_seconds=float(os.getenv("ANALYZE_SESSION_TTL_SECONDS", "1800")),
+        max_bytes=int(float(os.getenv("ANALYZE_SESSION_MAX_MB", "256")) * 1024 * 1024)
+    )
@@ -0,0 +1,317 @@
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from app.chunk_store import save_array
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Largest (queries x documents) score matrix top_k_batch builds at once (32 MB of float64)
+MAX_BATCH_SCORE_CELLS = 4 * 1024 * 1024
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase word tokens for BM25.
+
+    Punctuation is dropped, so "Section 379," and "section 379" produce the
+    same tokens.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+class SparseBM25Index:
+    """
+    BM25 (Okapi) retriever backed by an inverted index.
+
+    Postings are stored term-major in CSR layout (`indptr`, `doc_ids`, `tfs`),
+    so a query only touches the documents that contain its terms instead of
+    scoring the whole corpus. Scores are identical to `rank_bm25.BM25Okapi`
+    built over the same tokens, including its epsilon floor for negative IDFs.
+
+    Saved as a directory of .npy arrays, including the derived IDFs and
+    per-posting weights, so a loaded index can be memory-mapped as-is.
+    """
+
+    def __init__(
+        self,
+        vocabulary: Dict[str, int],
+        doc_len: np.ndarray,
+        indptr: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+        idf: Optional[np.ndarray] = None,
+        weights: Optional[np.ndarray] = None
+    ):
+        self.vocabulary = vocabulary
+        self.doc_len = doc_len
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        if idf is None or weights is None:
+            self._compute_weights()
+        else:
+            self.avgdl = float(doc_len.sum()) / len(doc_len) if len(doc_len) else 0.0
+            self.idf = idf
+            self.weights = weights
+
+    @property
+    def corpus_size(self) -> int:
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, tokenized_corpus: Iterable[List[str]], **params) -> "SparseBM25Index":
+        """Build the index from already tokenized documents."""
+        builder = BM25Builder()
+        for tokens in tokenized_corpus:
+            builder.add_document(tokens)
+        return builder.build(**params)
+
+    def remove_documents(self, doc_ids: List[int]) -> None:
+        """
+        Drop documents in place.
+
+        Remaining documents keep their relative order and are renumbered to
+        close the gaps, matching a list with the same rows deleted.
+        """
+        if not len(doc_ids):
+            return
+        keep = np.ones(self.corpus_size, dtype=bool)
+        keep[np.asarray(doc_ids, dtype=np.int64)] = False
+        new_position = np.cumsum(keep) - 1
+
+        term_ids = np.repeat(np.arange(len(self.vocabulary)), np.diff(self.indptr))
+        kept_postings = keep[self.doc_ids]
+        self.doc_len = self.doc_len[keep]
+        self.indptr, self.doc_ids, self.tfs = _to_term_major(
+            term_ids[kept_postings],
+            new_position[self.doc_ids[kept_postings]].astype(np.int32),
+            self.tfs[kept_postings],
+            len(self.vocabulary)
+        )
+        self._compute_weights()
+
+    def add_documents(self, tokenized_docs: List[List[str]]) -> None:
+        """Append tokenized documents in place, after the existing ones."""
+        if not tokenized_docs:
+            return
+        # New postings share the vocabulary, so existing term ids stay valid
+        builder = BM25Builder(self.vocabulary, first_doc_id=self.corpus_size)
+        for tokens in tokenized_docs:
+            builder.add_document(tokens)
+        new_terms, new_docs, new_tfs, new_doc_len = builder.arrays()
+
+        term_ids = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        self.doc_len = np.concatenate([self.doc_len, new_doc_len])
+        self.indptr, self.doc_ids, self.tfs = _to_term_major(
+            np.concatenate([term_ids, new_terms]),
+            np.concatenate([self.doc_ids, new_docs]),
+            np.concatenate([self.tfs, new_tfs]),
+            len(self.vocabulary)
+        )
+        self._compute_weights()
+
+    def _compute_weights(self) -> None:
+        """Derive IDFs and per-posting BM25 term weights from the raw statistics."""
+        n_docs = self.corpus_size
+        self.avgdl = float(self.doc_len.sum()) / n_docs if n_docs else 0.0
+
+        doc_freq = np.diff(self.indptr)
+        present = doc_freq > 0
+        idf = np.log(n_docs - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        idf[~present] = 0.0
+        if present.any():
+            # Same epsilon floor as rank_bm25 for terms in more than half the corpus
+            average_idf = idf[present].mean()
+            idf[present & (idf < 0)] = self.epsilon * average_idf
+        self.idf = idf
+
+        tf = self.tfs.astype(np.float64)
+        if len(tf):
+            length_norm = 1 - self.b + self.b * self.doc_len[self.doc_ids] / self.avgdl
+            self.weights = tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        else:
+            self.weights = tf
+
+    def _gather(self, query_tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Collect (doc_id, contribution) pairs for every posting of the query terms."""
+        docs = []
+        contributions = []
+        # Repeated query terms are counted once per occurrence, as in rank_bm25
+        for token in query_tokens:
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs.append(self.doc_ids[start:end])
+            contributions.append(self.idf[term_id] * self.weights[start:end])
+        if not docs:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+        return np.concatenate(docs), np.concatenate(contributions)
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """BM25 score of every document, matching BM25Okapi.get_scores."""
+        docs, contributions = self._gather(query_tokens)
+        return np.bincount(docs, weights=contributions, minlength=self.corpus_size)
+
+    def top_k(self, query_tokens: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the ids and scores of the k best matching documents.
+
+        Only documents sharing at least one term with the query are candidates,
+        so fewer than k results are returned when few documents match.
+        """
+        docs, contributions = self._gather(query_tokens)
+        if not len(docs):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        candidates, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions)
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return candidates[best].astype(np.int64), scores[best]
+
+    def top_k_batch(self, queries: List[List[str]], k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        top_k for several tokenized queries at once.
+
+        The postings of the queries are summed into a dense (queries x
+        documents) score matrix with one bincount, and each row's best k are
+        picked with one argpartition over the matrix. This skips the per-query
+        sort of candidate ids top_k needs. Queries are scored in groups whose
+        matrix stays within MAX_BATCH_SCORE_CELLS. Scores are the same as
+        top_k's.
+        """
+        rows_per_group = max(1, MAX_BATCH_SCORE_CELLS // max(self.corpus_size, 1))
+        results = []
+        for start in range(0, len(queries), rows_per_group):
+            results.extend(self._top_k_group(queries[start:start + rows_per_group], k))
+        return results
+
+    def _top_k_group(self, queries: List[List[str]], k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        n_queries, n_docs = len(queries), self.corpus_size
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        cells = []
+        contributions = []
+        for row, tokens in enumerate(queries):
+            docs, row_contributions = self._gather(tokens)
+            cells.append(docs + np.int64(row) * n_docs)
+            contributions.append(row_contributions)
+        cells = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+        k = min(k, n_docs)
+        if not len(cells) or k <= 0:
+            return [empty for _ in queries]
+
+        scores = np.bincount(cells, weights=np.concatenate(contributions), minlength=n_queries * n_docs)
+        # Only documents sharing a term with the query are candidates, as in top_k
+        matched = np.zeros(n_queries * n_docs, dtype=bool)
+        matched[cells] = True
+        scores = scores.reshape(n_queries, n_docs)
+        matched = matched.reshape(n_queries, n_docs)
+
+        ranked = np.where(matched, scores, -np.inf)
+        if n_docs > k:
+            best = np.argpartition(-ranked, k - 1, axis=1)[:, :k]
+        else:
+            best = np.tile(np.arange(n_docs), (n_queries, 1))
+        results = []
+        for row, row_best in enumerate(best):
+            row_best = row_best[matched[row, row_best]]
+            row_best = row_best[np.argsort(-scores[row, row_best], kind="stable")]
+            results.append((row_best.astype(np.int64), scores[row, row_best]))
+        return results
+
+    def save(self, directory) -> None:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        save_array(directory / "vocabulary.npy", np.array(terms, dtype=str))
+        save_array(directory / "doc_len.npy", self.doc_len)
+        save_array(directory / "indptr.npy", self.indptr)
+        save_array(directory / "doc_ids.npy", self.doc_ids)
+        save_array(directory / "tfs.npy", self.tfs)
+        save_array(directory / "idf.npy", self.idf)
+        save_array(directory / "weights.npy", self.weights)
+        save_array(directory / "params.npy", np.array([self.k1, self.b, self.epsilon]))
+
+    @classmethod
+    def load(cls, directory, mmap_mode: Optional[str] = "r") -> "SparseBM25Index":
+        """Load a saved index, memory-mapping its arrays unless mmap_mode is None."""
+        directory = Path(directory)
+
+        def array(name):
+            return np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+
+        k1, b, epsilon = np.load(directory / "params.npy").tolist()
+        vocabulary = {term: term_id for term_id, term in enumerate(np.load(directory / "vocabulary.npy").tolist())}
+        return cls(
+            vocabulary,
+            array("doc_len"),
+            array("indptr"),
+            array("doc_ids"),
+            array("tfs"),
+            k1=k1,
+            b=b,
+            epsilon=epsilon,
+            idf=array("idf"),
+            weights=array("weights")
+        )
+
+class BM25Builder:
+    """
+    Accumulates postings one document at a time.
+
+    Lets ingestion stream documents into the index without keeping their
+    token lists around; postings are held in compact typed arrays.
+    """
+
+    def __init__(self, vocabulary: Optional[Dict[str, int]] = None, first_doc_id: int = 0):
+        self.vocabulary = vocabulary if vocabulary is not None else {}
+        self._next_doc_id = first_doc_id
+        self._terms = array("q")
+        self._docs = array("i")
+        self._tfs = array("i")
+        self._doc_len = array("i")
+
+    def add_document(self, tokens: List[str]) -> None:
+        doc_id = self._next_doc_id
+        self._next_doc_id += 1
+        self._doc_len.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self._terms.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+            self._docs.append(doc_id)
+            self._tfs.append(tf)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return (term_ids, doc_ids, tfs, doc_len) of the documents added so far."""
+        return (
+            np.frombuffer(self._terms, dtype=np.int64).copy(),
+            np.frombuffer(self._docs, dtype=np.int32).copy(),
+            np.frombuffer(self._tfs, dtype=np.int32).copy(),
+            np.frombuffer(self._doc_len, dtype=np.int32).copy()
+        )
+
+    def build(self, **params) -> SparseBM25Index:
+        term_ids, doc_ids, tfs, doc_len = self.arrays()
+        return SparseBM25Index(
+            self.vocabulary,
+            doc_len,
+            *_to_term_major(term_ids, doc_ids, tfs, len(self.vocabulary)),
+            **params
+        )
+
+def _to_term_major(term_ids: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray, vocab_size: int):
+    """Sort postings by term and build the CSR row pointer over terms."""
+    order = np.argsort(term_ids, kind="stable")
+    indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=vocab_size), out=indptr[1:])
+    return indptr, doc_ids[order], tfs[order]
@@ -0,0 +1,222 @@
+import json
+import math
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import faiss
+import numpy as np
+
+# Supported FAISS index layouts, selected at ingest time
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "ivf_sq8")
+
+DEFAULT_HNSW_M = 32
+DEFAULT_EF_CONSTRUCTION = 200
+DEFAULT_EF_SEARCH = 64
+DEFAULT_NPROBE = 16
+
+META_FILENAME = "index_meta.json"
+
+def default_nlist(n_vectors: int) -> int:
+    """
+    Number of IVF cells for a corpus of n_vectors.
+
+    Follows the usual 4*sqrt(N) rule, capped so every cell gets the ~39
+    training points FAISS asks for.
+    """
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+def needs_training(index_type: str) -> bool:
+    """Whether the index type must be trained on sample vectors before adding any."""
+    return index_type.startswith("ivf")
+
+def create_index(
+    dimension: int,
+    index_type: str = "flat",
+    n_vectors: Optional[int] = None,
+    with_ids: bool = False,
+    hnsw_m: int = DEFAULT_HNSW_M,
+    ef_construction: int = DEFAULT_EF_CONSTRUCTION,
+    ef_search: int = DEFAULT_EF_SEARCH,
+    nlist: Optional[int] = None,
+    nprobe: int = DEFAULT_NPROBE,
+    pq_m: Optional[int] = None
+) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Create an empty FAISS index of the requested type.
+
+    Args:
+        dimension: Embedding dimension
+        index_type: One of INDEX_TYPES
+        n_vectors: Expected number of vectors; required for IVF types to size nlist
+        with_ids: Store caller-supplied int64 chunk ids instead of row positions
+        hnsw_m: Graph degree for HNSW
+        ef_construction: HNSW build-time search depth
+        ef_search: HNSW query-time search depth
+        nlist: Number of IVF cells (defaults to default_nlist)
+        nprobe: IVF cells visited per query
+        pq_m: Sub-quantizers for IVF-PQ (must divide the dimension)
+
+    Returns:
+        The empty (untrained, for IVF types) index and the metadata to store next to it
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Choose one of: {', '.join(INDEX_TYPES)}")
+
+    build_params: Dict[str, Any] = {}
+    search_params: Dict[str, Any] = {}
+
+    if index_type == "flat":
+        description = "Flat"
+    elif index_type == "hnsw":
+        description = f"HNSW{hnsw_m}"
+        build_params = {"M": hnsw_m, "efConstruction": ef_construction}
+        search_params = {"efSearch": ef_search}
+    else:
+        if n_vectors is None and nlist is None:
+            raise ValueError(f"'{index_type}' needs n_vectors or nlist to size its cells")
+        nlist = nlist or default_nlist(n_vectors)
+        build_params = {"nlist": nlist}
+        search_params = {"nprobe": min(nprobe, nlist)}
+        if index_type == "ivf_flat":
+            description = f"IVF{nlist},Flat"
+        elif index_type == "ivf_sq8":
+            description = f"IVF{nlist},SQ8"
+        else:
+            pq_m = pq_m or _default_pq_m(dimension)
+            if dimension % pq_m:
+                raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dimension}")
+            # 8-bit codes need 256 centroids per sub-quantizer to train
+            if n_vectors is not None and n_vectors < 256:
+                raise ValueError(f"IVF-PQ needs at least 256 vectors to train, got {n_vectors}. Use 'flat' instead.")
+            description = f"IVF{nlist},PQ{pq_m}"
+            build_params["pq_m"] = pq_m
+
+    # IVF indexes store ids natively; flat and HNSW need an IDMap2 wrapper
+    if with_ids and not description.startswith("IVF"):
+        description = f"IDMap2,{description}"
+
+    index = faiss.index_factory(dimension, description, faiss.METRIC_L2)
+    if index_type == "hnsw":
+        _base_index(index).hnsw.efConstruction = ef_construction
+    apply_search_params(index, search_params)
+
+    meta = {
+        "index_type": index_type,
+        "factory": description,
+        "dimension": dimension,
+        "ntotal": 0,
+        "build_params": build_params,
+        "search_params": search_params
+    }
+    return index, meta
+
+def add_vectors(index: faiss.Index, embeddings: np.ndarray, ids: Optional[np.ndarray] = None) -> None:
+    """Add a batch of vectors, with their chunk ids when the index stores ids."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if ids is None:
+        index.add(embeddings)
+    else:
+        index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype=np.int64))
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str = "flat",
+    ids: Optional[np.ndarray] = None,
+    **params
+) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Build (and train, where needed) a FAISS index over the given embeddings.
+
+    Args:
+        embeddings: float32 array of shape (n_vectors, dimension)
+        index_type: One of INDEX_TYPES
+        ids: Optional int64 chunk ids to store instead of row positions
+        **params: Build and search parameters accepted by create_index
+
+    Returns:
+        The populated index and the metadata to store next to it
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n_vectors, dimension = embeddings.shape
+    index, meta = create_index(dimension, index_type, n_vectors=n_vectors, with_ids=ids is not None, **params)
+    if not index.is_trained:
+        index.train(embeddings)
+    add_vectors(index, embeddings, ids)
+    meta["ntotal"] = int(index.ntotal)
+    return index, meta
+
+def _base_index(index: faiss.Index) -> faiss.Index:
+    """Unwrap an IDMap wrapper to the index that does the searching."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+def supports_removal(index_type: str) -> bool:
+    """Whether vectors can be removed by id, which incremental ingestion relies on."""
+    # HNSW graphs cannot drop nodes, so they are always rebuilt
+    return index_type != "hnsw"
+
+def _default_pq_m(dimension: int) -> int:
+    # Aim for 8 dimensions per sub-quantizer, falling back to any divisor
+    for m in (dimension // 8, 48, 32, 16, 8, 4, 2, 1):
+        if m and dimension % m == 0:
+            return m
+    return 1
+
+def apply_search_params(index: faiss.Index, search_params: Dict[str, Any]) -> None:
+    """Set query-time parameters such as nprobe or efSearch on a loaded index."""
+    parameter_space = faiss.ParameterSpace()
+    for name, value in search_params.items():
+        parameter_space.set_index_parameter(_base_index(index), name, value)
+
+def meta_path(index_path: Path) -> Path:
+    return Path(index_path).with_name(META_FILENAME)
+
+def write_index_file(index: faiss.Index, index_path: Path) -> None:
+    """
+    Write a FAISS index via a temporary file.
+
+    The old file is replaced rather than overwritten, so processes that
+    memory-mapped it keep reading the old build until they reload.
+    """
+    tmp_path = Path(index_path).with_name(Path(index_path).name + ".tmp")
+    faiss.write_index(index, str(tmp_path))
+    os.replace(tmp_path, index_path)
+
+def read_index_file(index_path: Path, mmap: bool = False) -> faiss.Index:
+    """
+    Read a FAISS index, memory-mapping its vectors (read-only) when `mmap` is set.
+
+    Mapped vectors live in the OS page cache, so every process serving the
+    same file shares one copy instead of holding a private one.
+    """
+    if mmap:
+        return faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(str(index_path))
+
+def save_index(index: faiss.Index, meta: Dict[str, Any], index_path: Path) -> None:
+    """Write the index and its metadata file side by side."""
+    # Metadata goes first: readers detect a rebuild by the index file changing
+    with open(meta_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    write_index_file(index, index_path)
+
+def load_meta(index_path: Path) -> Dict[str, Any]:
+    """Read the metadata stored with an index; indexes built before it existed are flat."""
+    path = meta_path(index_path)
+    if not path.exists():
+        return {"index_type": "flat", "search_params": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_index(index_path: Path, mmap: bool = False) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Read an index and apply the search parameters recorded at build time.
+
+    A memory-mapped index (see read_index_file) is read-only; indexes that
+    will be modified must be loaded without `mmap`.
+    """
+    index = read_index_file(index_path, mmap)
+    meta = load_meta(index_path)
+    apply_search_params(index, meta.get("search_params", {}))
+    return index, meta
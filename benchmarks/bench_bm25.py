@@ -0,0 +1,89 @@
+"""
+Per-query BM25 latency against corpus size.
+
+Compares the full-corpus `rank_bm25.BM25Okapi` scan used previously with the
+inverted-index `SparseBM25Index`, and checks that both produce the same scores:
+
+    python -m benchmarks.bench_bm25 --sizes 1000 10000 50000
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from app.sparse import SparseBM25Index, tokenize
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "legal_docs"
+
+QUERIES = [
+    "What is the punishment for theft?",
+    "Punishment for murder under section 302",
+    "Can the police arrest without a warrant?",
+    "What are the fundamental rights in the Constitution?",
+    "Bail in non-bailable offences",
+]
+
+
+def load_corpus(size, seed=0):
+    """
+    Build a tokenized corpus of `size` documents.
+
+    Uses the QA pairs in data/legal_docs when available, resampling them to
+    reach `size`, and falls back to a synthetic Zipf-distributed vocabulary.
+    """
+    rng = random.Random(seed)
+    base = []
+    for path in sorted(DATA_DIR.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            base.extend(
+                tokenize(f"Question: {item['question']}\nAnswer: {item['answer']}")
+                for item in json.load(f) if "question" in item and "answer" in item
+            )
+    if base:
+        return [base[rng.randrange(len(base))] for _ in range(size)]
+
+    vocabulary = [f"term{i}" for i in range(50000)] + [w for q in QUERIES for w in tokenize(q)]
+    weights = 1 / np.arange(1, len(vocabulary) + 1)
+    return [rng.choices(vocabulary, weights=weights, k=rng.randint(10, 60)) for _ in range(size)]
+
+
+def _time_per_query(search, queries, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for query in queries:
+            search(query)
+    return (time.perf_counter() - started) * 1000 / (repeats * len(queries))
+
+
+def run(sizes, repeats, top_k):
+    queries = [tokenize(q) for q in QUERIES]
+    print(f"{'docs':>8} {'rank_bm25 ms':>13} {'inverted ms':>12} {'speedup':>8} {'max |diff|':>11}")
+    for size in sizes:
+        corpus = load_corpus(size)
+        reference = BM25Okapi(corpus)
+        index = SparseBM25Index.build(corpus)
+
+        max_diff = max(
+            float(np.abs(reference.get_scores(q) - index.get_scores(q)).max()) for q in queries
+        )
+
+        def full_scan(query):
+            scores = reference.get_scores(query)
+            return sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
+
+        baseline_ms = _time_per_query(full_scan, queries, max(1, repeats // 10))
+        inverted_ms = _time_per_query(lambda q: index.top_k(q, top_k), queries, repeats)
+        print(f"{size:>8} {baseline_ms:>13.3f} {inverted_ms:>12.3f} {baseline_ms / inverted_ms:>7.1f}x {max_diff:>11.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 15000, 50000])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeats, args.top_k)
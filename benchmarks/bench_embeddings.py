@@ -0,0 +1,98 @@
+"""
+Encode throughput, query latency and retrieval recall of each embedding backend.
+
+Every backend from app.embeddings encodes the same corpus and queries. Recall@k
+is measured against the neighbours found with the PyTorch embeddings, which
+is what a switched backend has to reproduce:
+
+    python -m benchmarks.bench_embeddings --size 2000 --queries 200 --k 5
+
+The corpus is the JSON QA files in data/legal_docs, formatted as ingestion
+formats them. The ONNX backends need `pip install "sentence-transformers[onnx]"`;
+backends that fail to load are reported and skipped.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app.embeddings import EMBEDDING_BACKENDS, embedding_spec, load_embedding_model
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "legal_docs"
+
+
+def load_corpus(size, n_queries):
+    items = []
+    for path in sorted(DATA_DIR.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            items.extend(item for item in json.load(f) if "question" in item and "answer" in item)
+    texts = [f"Question: {item['question']}\nAnswer: {item['answer']}" for item in items[:size]]
+    queries = [item["question"] for item in items[:n_queries]]
+    return texts, queries
+
+
+def neighbours(corpus_embeddings, query_embeddings, k):
+    index = faiss.IndexFlatL2(corpus_embeddings.shape[1])
+    index.add(corpus_embeddings)
+    return index.search(query_embeddings, k)[1]
+
+
+def _cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return float(np.mean(np.sum(a * b, axis=1)))
+
+
+def run(backends, size, n_queries, k, batch_size):
+    texts, queries = load_corpus(size, n_queries)
+    print(f"{len(texts)} chunks, {len(queries)} queries, k={k}, batch size {batch_size}")
+    print(f"{'backend':>10} {'load s':>7} {'chunks/s':>9} {'q p50 ms':>9} {'q p99 ms':>9} {'recall':>7} {'cosine':>7}")
+
+    reference = None
+    for backend in backends:
+        try:
+            started = time.perf_counter()
+            model = load_embedding_model(embedding_spec(backend))
+            load_seconds = time.perf_counter() - started
+        except Exception as e:
+            print(f"{backend:>10} skipped: {e}")
+            continue
+
+        model.encode(texts[:batch_size], batch_size=batch_size)
+        started = time.perf_counter()
+        corpus_embeddings = np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+        throughput = len(texts) / (time.perf_counter() - started)
+
+        latencies = []
+        query_embeddings = []
+        for query in queries:
+            started = time.perf_counter()
+            query_embeddings.append(model.encode([query]))
+            latencies.append(time.perf_counter() - started)
+        query_embeddings = np.vstack(query_embeddings).astype(np.float32)
+
+        found = neighbours(corpus_embeddings, query_embeddings, k)
+        if reference is None:
+            # The first backend (torch unless excluded) is the baseline
+            reference = (found, corpus_embeddings)
+        recall = np.mean([len(set(found[i]) & set(reference[0][i])) / k for i in range(len(queries))])
+        cosine = _cosine(corpus_embeddings, reference[1])
+
+        print(
+            f"{backend:>10} {load_seconds:>7.2f} {throughput:>9.1f} {np.percentile(latencies, 50) * 1000:>9.2f} "
+            f"{np.percentile(latencies, 99) * 1000:>9.2f} {recall:>7.3f} {cosine:>7.4f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=list(EMBEDDING_BACKENDS))
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+    run(args.backends, args.size, args.queries, args.k, args.batch_size)
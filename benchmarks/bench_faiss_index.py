@@ -0,0 +1,88 @@
+"""
+Recall, latency and size of each FAISS index type.
+
+Every index type from app.vector_index is built over the same vectors and
+compared against exact (flat) search:
+
+    python -m benchmarks.bench_faiss_index --size 50000 --k 5
+
+Vectors come from the ingested flat index when one exists, otherwise from a
+synthetic clustered distribution with the all-MiniLM-L6-v2 dimension.
+"""
+import argparse
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app.vector_index import INDEX_TYPES, build_index
+
+INDEX_PATH = Path(__file__).resolve().parent.parent / "faiss_index" / "index.faiss"
+DIMENSION = 384
+
+
+def load_vectors(size, seed=0):
+    rng = np.random.default_rng(seed)
+    if INDEX_PATH.exists():
+        stored = faiss.read_index(str(INDEX_PATH))
+        if isinstance(stored, faiss.IndexFlat):
+            base = stored.reconstruct_n(0, stored.ntotal)
+            picks = rng.integers(0, len(base), size)
+            # Jitter resampled copies so duplicates don't make recall trivial
+            return (base[picks] + rng.normal(0, 0.01, (size, base.shape[1]))).astype(np.float32)
+
+    centers = rng.normal(0, 1, (max(size // 100, 1), DIMENSION))
+    assignments = rng.integers(0, len(centers), size)
+    return (centers[assignments] + rng.normal(0, 0.5, (size, DIMENSION))).astype(np.float32)
+
+
+def _percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000)
+
+
+def run(size, n_queries, k, index_types, nprobe, ef_search):
+    vectors = load_vectors(size)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, size, n_queries)] + rng.normal(0, 0.05, (n_queries, vectors.shape[1])).astype(np.float32)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+
+    print(f"{size} vectors, {n_queries} queries, k={k}")
+    print(f"{'index':>10} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'size MB':>8}  params")
+    for index_type in index_types:
+        started = time.perf_counter()
+        try:
+            index, meta = build_index(vectors, index_type, nprobe=nprobe, ef_search=ef_search)
+        except ValueError as e:
+            print(f"{index_type:>10} skipped: {e}")
+            continue
+        build_seconds = time.perf_counter() - started
+
+        latencies = []
+        found = np.empty_like(ground_truth)
+        for i, query in enumerate(queries):
+            started = time.perf_counter()
+            _, found[i:i + 1] = index.search(query.reshape(1, -1), k)
+            latencies.append(time.perf_counter() - started)
+
+        recall = np.mean([len(set(found[i]) & set(ground_truth[i])) / k for i in range(n_queries)])
+        size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+        print(
+            f"{index_type:>10} {build_seconds:>8.2f} {recall:>9.3f} {_percentile_ms(latencies, 50):>8.3f} "
+            f"{_percentile_ms(latencies, 99):>8.3f} {size_mb:>8.1f}  {meta['search_params']}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    args = parser.parse_args()
+    run(args.size, args.queries, args.k, args.index_types, args.nprobe, args.ef_search)
@@ -0,0 +1,204 @@
+"""
+Throughput and latency of /ask and /analyze under concurrent load.
+
+Starts the API with uvicorn in a subprocess, its LLM calls served by the
+local fake Groq server, and drives each endpoint with `--concurrency`
+simultaneous clients that send their next request as soon as the previous
+one completes. For every endpoint and concurrency level it reports requests
+per second and latency percentiles:
+
+    python -m benchmarks.bench_load --concurrency 1 4 16 --requests 100 --output load.json
+
+No network access or API key is needed. /ask needs the ingested index (run
+`python -m app.ingest` first). /analyze uploads a generated text PDF of
+`--pdf-pages` pages. Rate limiting and the answer and analysis caches are
+turned off in the server, so every request runs the full pipeline; pass
+`--caches` to keep the caches on.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.bench_startup import _wait_for
+from benchmarks.fake_groq_server import FakeGroqServer, _free_port
+from benchmarks.results import latency_summary, write_results
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+QUESTIONS = [
+    "What is the punishment for theft?",
+    "Punishment for murder under section 302",
+    "Can the police arrest without a warrant?",
+    "What are the fundamental rights in the Constitution?",
+    "Bail in non-bailable offences",
+    "Who appoints the Governor of a State?",
+    "What is criminal breach of trust?",
+    "When can a Magistrate take cognizance of an offence?",
+]
+
+PAGE_LINES = [
+    "Section {n}. Notice period.",
+    "Either party may terminate this agreement by giving thirty days written notice.",
+    "The notice shall be delivered to the registered office of the other party.",
+    "Any dispute arising under this clause shall be referred to arbitration.",
+    "The arbitrator shall be appointed by mutual consent of the parties.",
+    "The seat of arbitration shall be New Delhi and the language English.",
+]
+
+
+def synthetic_pdf(n_pages):
+    """A minimal text PDF with `n_pages` pages of contract-like clauses."""
+    return text_pdf([[line.format(n=page) for line in PAGE_LINES] for page in range(1, n_pages + 1)])
+
+
+def text_pdf(pages):
+    """A minimal text PDF with one page per list of lines (without parentheses or backslashes)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page_lines in pages:
+        lines = " ".join(f"({line}) Tj T*" for line in page_lines)
+        stream = f"BT /F1 11 Tf 14 TL 72 720 Td {lines} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode("latin-1") for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF".encode("latin-1")
+    return pdf
+
+
+def _requests(endpoint, pdf):
+    """Keyword arguments of httpx.post for the i-th request to an endpoint."""
+    if endpoint == "/ask":
+        return lambda i: {"json": {"question": QUESTIONS[i % len(QUESTIONS)]}}
+    return lambda i: {
+        "files": {"file": ("contract.pdf", pdf, "application/pdf")},
+        "data": {"question": QUESTIONS[i % len(QUESTIONS)]}
+    }
+
+
+async def run_load(base_url, endpoint, request_for, concurrency, n_requests, timeout):
+    latencies = []
+    errors = 0
+    next_request = 0
+
+    async def client(http):
+        nonlocal next_request, errors
+        while next_request < n_requests:
+            i = next_request
+            next_request += 1
+            started = time.perf_counter()
+            try:
+                response = await http.post(endpoint, **request_for(i))
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, latencies, errors
+
+
+def start_server(groq_base_url, caches, timeout):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        GROQ_BASE_URL=groq_base_url,
+        GROQ_API_KEY="fake-key",
+        RAG_WARMUP="true",
+        RATE_LIMIT_ENABLED="false",
+    )
+    if not caches:
+        env.update(ANSWER_CACHE_ENABLED="false", ANALYZE_CACHE_ENABLED="false")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR,
+        env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_for(f"{base_url}/ready", started, timeout)
+    except BaseException:
+        process.terminate()
+        raise
+    return process, base_url
+
+
+def run(endpoints, concurrency_levels, n_requests, pdf_pages, first_token_latency, token_interval, caches, timeout):
+    pdf = synthetic_pdf(pdf_pages)
+    rows = []
+    with FakeGroqServer(first_token_latency=first_token_latency, token_interval=token_interval) as groq:
+        process, base_url = start_server(groq.base_url, caches, timeout)
+        try:
+            print(f"{'endpoint':>9} {'clients':>7} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'errors':>6}")
+            for endpoint in endpoints:
+                request_for = _requests(endpoint, pdf)
+                # One request first so lazy work (model, prompts, PDF parser) is not in the numbers
+                asyncio.run(run_load(base_url, endpoint, request_for, 1, 1, timeout))
+                for concurrency in concurrency_levels:
+                    qps, latencies, errors = asyncio.run(
+                        run_load(base_url, endpoint, request_for, concurrency, n_requests, timeout)
+                    )
+                    summary = latency_summary(latencies)
+                    rows.append({
+                        "name": f"{endpoint}@{concurrency}",
+                        "endpoint": endpoint,
+                        "concurrency": concurrency,
+                        "qps": round(qps, 3),
+                        "errors": errors,
+                        **summary
+                    })
+                    print(
+                        f"{endpoint:>9} {concurrency:>7} {qps:>8.2f} {summary.get('p50_ms', 0):>9.1f} "
+                        f"{summary.get('p90_ms', 0):>9.1f} {summary.get('p99_ms', 0):>9.1f} {errors:>6}"
+                    )
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", choices=["/ask", "/analyze"], default=["/ask", "/analyze"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--pdf-pages", type=int, default=10)
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="Fake LLM seconds before the first token")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="Fake LLM seconds between tokens")
+    parser.add_argument("--caches", action="store_true", help="Keep the answer and analysis caches on")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    rows = run(
+        args.endpoints, args.concurrency, args.requests, args.pdf_pages,
+        args.first_token_latency, args.token_interval, args.caches, args.timeout
+    )
+    if args.output:
+        config = {name: value for name, value in vars(args).items() if name != "output"}
+        write_results(args.output, "load", config, rows)
@@ -0,0 +1,110 @@
+"""
+Index size and prompt size with and without near-duplicate QA collapsing.
+
+Embeds every QA pair in data/legal_docs once, then builds the hybrid
+(FAISS + BM25) retrieval of app.rag twice: over all pairs and over the
+representatives that ingestion keeps. Sample questions from the corpus are
+run against both. For each, the report shows the vector count, index size,
+average /ask prompt tokens, how many of them repeat a fact already in the
+context, the number of distinct facts in the top-k context (duplicates of
+one pair count once), and how often the fact the question was written for
+is retrieved:
+
+    python -m benchmarks.bench_qa_dedup --queries 500 --k 5 --threshold 0.6
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app.chunking import estimate_tokens
+from app.dedup import DEFAULT_THRESHOLD, near_duplicate_clusters
+from app.embeddings import load_embedding_model
+from app.prompts import legal_prompt
+from app.rag import _reciprocal_rank_fusion
+from app.sparse import SparseBM25Index, tokenize
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "legal_docs"
+
+
+def load_pairs(threshold):
+    """All QA pairs, the cluster of each, and the representative rows kept by ingestion."""
+    questions, texts, cluster_of, representatives = [], [], [], []
+    for path in sorted(DATA_DIR.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            items = [item for item in json.load(f) if "question" in item and "answer" in item]
+        file_texts = [f"Question: {item['question']}\nAnswer: {item['answer']}" for item in items]
+        offset = len(texts)
+        for cluster in near_duplicate_clusters(file_texts, threshold):
+            representatives.append(offset + cluster[0])
+            for i in cluster:
+                cluster_of.append((offset + i, offset + cluster[0]))
+        questions.extend(item["question"] for item in items)
+        texts.extend(file_texts)
+    cluster_of = np.array([rep for _, rep in sorted(cluster_of)])
+    return questions, texts, cluster_of, np.array(representatives)
+
+
+def build(embeddings, sparse_texts):
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    bm25 = SparseBM25Index.build(tokenize(text) for text in sparse_texts)
+    return index, bm25
+
+
+def run(n_queries, k, threshold, batch_size):
+    questions, texts, cluster_of, representatives = load_pairs(threshold)
+    print(f"{len(texts)} QA pairs, {len(representatives)} after collapsing (threshold {threshold})")
+
+    model = load_embedding_model()
+    embeddings = np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+    alternates = {}
+    for row, rep in enumerate(cluster_of):
+        if row != rep:
+            alternates.setdefault(int(rep), []).append(questions[row])
+    collapsed_sparse = ["\n".join([texts[row], *alternates.get(int(row), [])]) for row in representatives]
+
+    variants = {
+        "all pairs": (np.arange(len(texts)), build(embeddings, texts)),
+        "collapsed": (representatives, build(embeddings[representatives], collapsed_sparse)),
+    }
+
+    sample = random.Random(0).sample(range(len(questions)), min(n_queries, len(questions)))
+    query_embeddings = np.asarray(model.encode([questions[i] for i in sample], batch_size=batch_size), dtype=np.float32)
+
+    print(f"{'variant':>10} {'vectors':>8} {'index MB':>9} {'prompt tok':>11} {'dup tok':>8} {'facts':>6} {'hit':>6}")
+    for name, (rows, (index, bm25)) in variants.items():
+        _, dense = index.search(query_embeddings, k)
+        prompt_tokens, duplicate_tokens, facts, hits = [], [], [], []
+        for position, i in enumerate(sample):
+            sparse = bm25.top_k(tokenize(questions[i]), k)[0].tolist()
+            found = rows[_reciprocal_rank_fusion([dense[position].tolist(), sparse], k)]
+            context = "\n".join(texts[row] for row in found)
+            prompt_tokens.append(estimate_tokens(legal_prompt(context, questions[i])))
+            seen = set()
+            wasted = 0
+            for row in found:
+                if cluster_of[row] in seen:
+                    wasted += estimate_tokens(texts[row])
+                seen.add(cluster_of[row])
+            duplicate_tokens.append(wasted)
+            facts.append(len(set(cluster_of[found])))
+            hits.append(cluster_of[i] in set(cluster_of[found]))
+        print(
+            f"{name:>10} {index.ntotal:>8} {index.ntotal * index.d * 4 / 2**20:>9.1f} "
+            f"{np.mean(prompt_tokens):>11.1f} {np.mean(duplicate_tokens):>8.1f} {np.mean(facts):>6.2f} {np.mean(hits):>6.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+    run(args.queries, args.k, args.threshold, args.batch_size)
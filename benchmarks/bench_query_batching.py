@@ -0,0 +1,79 @@
+"""
+Retrieval throughput and tail latency with and without query micro-batching.
+
+Runs the async retrieval path of app.rag under a closed-loop load of
+`--concurrency` simultaneous clients, first with every query encoded and
+searched on its own and then through the QueryBatcher, and reports queries
+per second and p50/p99 latency:
+
+    python -m benchmarks.bench_query_batching --concurrency 1 8 32 --requests 500
+
+Needs the ingested index and the embedding model (run `python -m app.ingest`
+first). Queries are the questions of the JSON QA files in data/legal_docs.
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+import app.rag as rag
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "legal_docs"
+
+
+def load_queries(limit=1000):
+    queries = []
+    for path in sorted(DATA_DIR.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            queries.extend(item["question"] for item in json.load(f) if "question" in item)
+    return queries[:limit] or ["What is the punishment for theft?"]
+
+
+async def run_load(queries, concurrency, n_requests):
+    latencies = []
+    next_request = 0
+
+    async def client():
+        nonlocal next_request
+        while next_request < n_requests:
+            query = queries[next_request % len(queries)]
+            next_request += 1
+            started = time.perf_counter()
+            await rag.retrieve_legal_context_async(query)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return n_requests / (time.perf_counter() - started), latencies
+
+
+def run(concurrency_levels, n_requests, max_batch_size, window_ms):
+    queries = load_queries()
+    rag.warm_up()
+    batcher = rag.QueryBatcher(max_batch_size, window_ms / 1000)
+
+    print(f"{'concurrency':>11} {'mode':>9} {'qps':>8} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for concurrency in concurrency_levels:
+        for mode in ("unbatched", "batched"):
+            rag.query_batcher = batcher if mode == "batched" else None
+            batches_before, queries_before = batcher.batches, batcher.queries
+            qps, latencies = asyncio.run(run_load(queries, concurrency, n_requests))
+            batches = batcher.batches - batches_before
+            mean_batch = (batcher.queries - queries_before) / batches if batches else 1.0
+            print(
+                f"{concurrency:>11} {mode:>9} {qps:>8.1f} {np.percentile(latencies, 50) * 1000:>8.2f} "
+                f"{np.percentile(latencies, 99) * 1000:>8.2f} {mean_batch:>6.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--max-batch-size", type=int, default=rag.BATCH_MAX_SIZE)
+    parser.add_argument("--window-ms", type=float, default=rag.BATCH_WINDOW_SECONDS * 1000)
+    args = parser.parse_args()
+    run(args.concurrency, args.requests, args.max_batch_size, args.window_ms)
@@ -0,0 +1,186 @@
+"""
+Per-stage latency of retrieve_legal_context over synthetic corpora of growing size.
+
+Times the stages of the hybrid retrieval in app.rag separately: query
+encoding, the FAISS search, the BM25 search, Reciprocal Rank Fusion and
+fetching the fused chunks from the chunk store. Each corpus size gets its
+own index, BM25 index and chunk store, built in a temporary directory:
+
+    python -m benchmarks.bench_retrieval_stages --sizes 1000 10000 100000 --output stages.json
+
+Corpus texts are the QA pairs in data/legal_docs, resampled to each size.
+Corpus vectors are synthetic, clustered, with the model's dimension, so large
+corpora don't have to be embedded first; search cost does not depend on
+what the vectors mean. Query encoding needs the embedding model and does not
+depend on the corpus, so it is measured once.
+
+The stages /ask/batch runs once per batch (encode, FAISS and BM25 over all
+queries) are also timed batched, as "<stage>_batch" rows whose latencies are
+per query, for comparison with the one-query-at-a-time rows.
+
+Queries filtered to one source corpus only search that corpus' partition
+(app.partitions). The "faiss_partition" and "bm25_partition" rows time the
+FAISS and BM25 searches of a partition holding `--partition-fraction` of each
+corpus, for comparison with the unfiltered "faiss" and "bm25" rows.
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.chunk_store import ChunkStore
+from app.embeddings import load_embedding_model
+from app.partitions import Partition
+from app.rag import RRF_K, _reciprocal_rank_fusion
+from app.sparse import SparseBM25Index, tokenize
+from app.vector_index import INDEX_TYPES, build_index
+from benchmarks.results import latency_summary, write_results
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "legal_docs"
+
+QUERIES = [
+    "What is the punishment for theft?",
+    "Punishment for murder under section 302",
+    "Can the police arrest without a warrant?",
+    "What are the fundamental rights in the Constitution?",
+    "Bail in non-bailable offences",
+    "Who appoints the Governor of a State?",
+    "What is criminal breach of trust?",
+    "When can a Magistrate take cognizance of an offence?",
+]
+
+
+def load_texts(size, seed=0):
+    """`size` QA texts, resampled from data/legal_docs, or synthetic sentences when it is empty."""
+    rng = random.Random(seed)
+    base = []
+    for path in sorted(DATA_DIR.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            base.extend(
+                f"Question: {item['question']}\nAnswer: {item['answer']}"
+                for item in json.load(f) if "question" in item and "answer" in item
+            )
+    if not base:
+        words = [f"term{i}" for i in range(5000)]
+        return [" ".join(rng.choices(words, k=40)) for _ in range(size)]
+    return [base[i % len(base)] if i < len(base) else rng.choice(base) for i in range(size)]
+
+
+def synthetic_vectors(size, dimension, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 1, (max(size // 100, 1), dimension))
+    assignments = rng.integers(0, len(centers), size)
+    return (centers[assignments] + rng.normal(0, 0.5, (size, dimension))).astype(np.float32)
+
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def run(sizes, n_queries, k, index_type, repeat, partition_fraction=0.1):
+    model = load_embedding_model()
+    queries = (QUERIES * (n_queries // len(QUERIES) + 1))[:n_queries]
+
+    # Warm-up call: the first encode allocates the model's buffers
+    model.encode([queries[0]])
+    encode_latencies = []
+    query_embeddings = []
+    for query in queries:
+        embedding, seconds = _timed(model.encode, [query])
+        encode_latencies.append(seconds)
+        query_embeddings.append(np.asarray(embedding, dtype=np.float32))
+    dimension = query_embeddings[0].shape[1]
+
+    batch_embeddings = np.vstack(query_embeddings)
+    encode_batch_latencies = [
+        seconds / len(queries) for _, seconds in (_timed(model.encode, queries) for _ in range(repeat))
+    ]
+
+    rows = [
+        {"name": "encode", "stage": "encode", "corpus_size": None, **latency_summary(encode_latencies)},
+        {"name": "encode_batch", "stage": "encode_batch", "corpus_size": None, **latency_summary(encode_batch_latencies)},
+    ]
+    print(f"{'stage':>15} {'corpus':>8} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for row in rows:
+        print(f"{row['stage']:>15} {'-':>8} {row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['mean_ms']:>8.3f}")
+
+    for size in sizes:
+        texts = load_texts(size)
+        ids = np.arange(size, dtype=np.int64)
+        vectors = synthetic_vectors(size, dimension)
+        index, _ = build_index(vectors, index_type, ids=ids)
+        bm25 = SparseBM25Index.build(tokenize(text) for text in texts)
+        partition_size = max(1, int(size * partition_fraction))
+        partition = Partition()
+        partition.add(ids[:partition_size], vectors[:partition_size], [tokenize(text) for text in texts[:partition_size]], index_type)
+        # The partition's BM25 index is built on its first search
+        partition.sparse_search([tokenize(queries[0])], k)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = ChunkStore.write(
+                Path(directory),
+                ({"id": int(i), "content": text, "metadata": {"source": "synthetic", "type": "json_qa"}} for i, text in enumerate(texts))
+            )
+            latencies = {
+                "faiss": [], "bm25": [], "rrf": [], "fetch": [], "faiss_batch": [], "bm25_batch": [],
+                "faiss_partition": [], "bm25_partition": []
+            }
+            for _ in range(repeat):
+                for query, query_embedding in zip(queries, query_embeddings):
+                    (_, found_ids), seconds = _timed(index.search, query_embedding, k)
+                    dense = [int(row) for row in store.rows_for_ids(found_ids[0][found_ids[0] >= 0]) if row >= 0]
+                    latencies["faiss"].append(seconds)
+
+                    (doc_ids, _), seconds = _timed(bm25.top_k, tokenize(query), k)
+                    latencies["bm25"].append(seconds)
+
+                    fused, seconds = _timed(_reciprocal_rank_fusion, [dense, doc_ids.tolist()], k)
+                    latencies["rrf"].append(seconds)
+
+                    _, seconds = _timed(store.get_many, fused)
+                    latencies["fetch"].append(seconds)
+
+                    _, seconds = _timed(partition.dense_search, query_embedding, k)
+                    latencies["faiss_partition"].append(seconds)
+                    _, seconds = _timed(partition.sparse_search, [tokenize(query)], k)
+                    latencies["bm25_partition"].append(seconds)
+
+                # Per-query share of one call over all queries
+                _, seconds = _timed(index.search, batch_embeddings, k)
+                latencies["faiss_batch"].append(seconds / len(queries))
+                _, seconds = _timed(bm25.top_k_batch, [tokenize(query) for query in queries], k)
+                latencies["bm25_batch"].append(seconds / len(queries))
+            del store
+
+        for stage, stage_latencies in latencies.items():
+            row = {"name": f"{stage}@{size}", "stage": stage, "corpus_size": size, **latency_summary(stage_latencies)}
+            if stage.endswith("_partition"):
+                row["partition_size"] = partition_size
+            rows.append(row)
+            print(f"{stage:>15} {size:>8} {row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['mean_ms']:>8.3f}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the queries per corpus size")
+    parser.add_argument("--partition-fraction", type=float, default=0.1, help="Share of the corpus in the timed partition")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    rows = run(args.sizes, args.queries, args.k, args.index_type, args.repeat, args.partition_fraction)
+    if args.output:
+        write_results(args.output, "retrieval_stages", {
+            "sizes": args.sizes, "queries": args.queries, "k": args.k,
+            "index_type": args.index_type, "repeat": args.repeat, "partition_fraction": args.partition_fraction,
+            "rrf_k": RRF_K
+        }, rows)
@@ -0,0 +1,103 @@
+"""
+Cold-start time and resident memory of the API process.
+
+Starts `uvicorn app.main:app` in a subprocess, with and without eager warm-up,
+and reports how long it takes to accept connections, to report ready on
+/ready, and to answer the first /ask, plus the process RSS once warm. The LLM
+is served by the local fake Groq server, so no network access is needed:
+
+    python -m benchmarks.bench_startup
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_groq_server import FakeGroqServer, _free_port
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def rss_mb(pid):
+    """Resident set size of a process in MB, read from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def import_seconds(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=BASE_DIR, text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def _wait_for(url, started, timeout, expected_status=200):
+    while time.perf_counter() - started < timeout:
+        try:
+            if httpx.get(url, timeout=1).status_code == expected_status:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{url} did not return {expected_status} within {timeout}s")
+
+
+def measure_server(warmup, groq_base_url, timeout):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, RAG_WARMUP="true" if warmup else "false", GROQ_BASE_URL=groq_base_url, GROQ_API_KEY="fake-key")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR,
+        env=env
+    )
+    try:
+        listening = _wait_for(f"{base_url}/health", started, timeout)
+        ready = _wait_for(f"{base_url}/ready", started, timeout)
+
+        request_started = time.perf_counter()
+        response = httpx.post(f"{base_url}/ask", json={"question": "What is the punishment for theft?"}, timeout=timeout)
+        first_ask = time.perf_counter() - request_started
+
+        return {
+            "listening_s": listening,
+            "ready_s": ready,
+            "first_ask_s": first_ask,
+            "first_ask_status": response.status_code,
+            "rss_mb": rss_mb(process.pid)
+        }
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def run(timeout):
+    for module in ("app.ingest", "app.rag", "app.main"):
+        print(f"import {module}: {import_seconds(module):.2f}s")
+
+    with FakeGroqServer(first_token_latency=0.0, token_interval=0.0) as groq:
+        print(f"{'mode':>10} {'listening s':>12} {'ready s':>8} {'first /ask s':>13} {'status':>7} {'RSS MB':>7}")
+        for warmup in (True, False):
+            result = measure_server(warmup, groq.base_url, timeout)
+            rss = f"{result['rss_mb']:.0f}" if result["rss_mb"] is not None else "n/a"
+            print(
+                f"{'warm-up' if warmup else 'lazy':>10} {result['listening_s']:>12.2f} {result['ready_s']:>8.2f} "
+                f"{result['first_ask_s']:>13.2f} {result['first_ask_status']:>7} {rss:>7}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+    run(args.timeout)
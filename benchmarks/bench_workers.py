@@ -0,0 +1,187 @@
+"""
+Memory of the API served by 1..N worker processes.
+
+For each worker count, starts the API in three ways and reports the memory
+of the whole process tree once every worker is warm and has answered /ask:
+
+    uvicorn            uvicorn app.main:app --workers N (every worker loads everything)
+    preload            python -m app.serve --workers N (loaded once, then forked)
+    embedding_server   python -m app.serve --workers N --embedding-server
+
+Per worker it reports RSS, which counts shared pages in full, and USS
+(private pages only); for the tree it reports PSS, which splits shared pages
+between the processes using them and so adds up to the real footprint. The
+LLM is the local fake Groq server. Linux only (reads /proc):
+
+    python -m benchmarks.bench_workers --workers 1 2 4 8 --output workers.json
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_groq_server import FakeGroqServer, _free_port
+from benchmarks.results import write_results
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MODES = ("uvicorn", "preload", "embedding_server")
+QUESTIONS = [
+    "What is the punishment for theft?",
+    "What is the punishment for murder?",
+    "What does Article 21 of the Constitution guarantee?",
+    "How is an FIR registered?",
+]
+
+
+def memory_mb(pid):
+    """RSS, PSS and USS of a process in MB, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "uss": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+def _children(pid):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The parent pid follows the parenthesized command name
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (FileNotFoundError, ProcessLookupError, IndexError):
+            continue
+        if parent == pid:
+            pids.append(int(entry))
+    return pids
+
+
+def _cmdline(pid):
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        return f.read().replace(b"\0", b" ").decode()
+
+
+def process_tree(root):
+    """
+    Worker and helper (embedding server, resource tracker) pids under a server process.
+
+    `uvicorn --workers 1` serves from the root process itself, which then
+    counts as the worker.
+    """
+    workers, helpers = [], []
+    for pid in _children(root):
+        cmdline = _cmdline(pid)
+        if "app.embedding_server" in cmdline or "resource_tracker" in cmdline:
+            helpers.append(pid)
+        else:
+            workers.append(pid)
+    return workers or [root], helpers
+
+
+def _command(mode, workers, port):
+    if mode == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers), "--port", str(port)]
+    command = [sys.executable, "-m", "app.serve", "--workers", str(workers), "--port", str(port)]
+    if mode == "embedding_server":
+        command.append("--embedding-server")
+    return command
+
+
+def _wait_ready(base_url, process, workers, timeout):
+    """Wait until /ready answers 200 from every worker (the kernel spreads connections between them)."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        if len(process_tree(process.pid)[0]) >= workers:
+            try:
+                statuses = [httpx.get(f"{base_url}/ready", timeout=1).status_code for _ in range(4 * workers)]
+                if all(status == 200 for status in statuses):
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{base_url} did not become ready within {timeout}s")
+
+
+def measure(mode, workers, groq_base_url, n_requests, timeout):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ, GROQ_BASE_URL=groq_base_url, GROQ_API_KEY="fake-key", RATE_LIMIT_ENABLED="false"
+    )
+    process = subprocess.Popen(
+        _command(mode, workers, port) + ["--log-level", "warning"],
+        cwd=BASE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        ready_seconds = _wait_ready(base_url, process, workers, timeout)
+        with httpx.Client(timeout=timeout) as client:
+            for i in range(n_requests):
+                client.post(f"{base_url}/ask", json={"question": f"{QUESTIONS[i % len(QUESTIONS)]} ({i})"})
+
+        worker_pids, helper_pids = process_tree(process.pid)
+        worker_memory = [memory_mb(pid) for pid in worker_pids]
+        other_pids = [pid for pid in [process.pid] if pid not in worker_pids] + helper_pids
+        other_memory = [memory_mb(pid) for pid in other_pids]
+        return {
+            "name": f"{mode}@{workers}",
+            "mode": mode,
+            "workers": workers,
+            "ready_seconds": round(ready_seconds, 3),
+            "rss_per_worker_mb": round(sum(m["rss"] for m in worker_memory) / len(worker_memory), 1),
+            "uss_per_worker_mb": round(sum(m["uss"] for m in worker_memory) / len(worker_memory), 1),
+            "other_pss_mb": round(sum(m["pss"] for m in other_memory), 1),
+            "total_rss_mb": round(sum(m["rss"] for m in worker_memory + other_memory), 1),
+            "total_pss_mb": round(sum(m["pss"] for m in worker_memory + other_memory), 1),
+        }
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def run(worker_counts, modes, n_requests, timeout):
+    rows = []
+    with FakeGroqServer(first_token_latency=0.0, token_interval=0.0) as groq:
+        print(
+            f"{'mode':>16} {'workers':>7} {'RSS/worker':>10} {'USS/worker':>10} "
+            f"{'other PSS':>9} {'total RSS':>9} {'total PSS':>9}"
+        )
+        for workers in worker_counts:
+            for mode in modes:
+                row = measure(mode, workers, groq.base_url, n_requests, timeout)
+                rows.append(row)
+                print(
+                    f"{mode:>16} {workers:>7} {row['rss_per_worker_mb']:>10.1f} {row['uss_per_worker_mb']:>10.1f} "
+                    f"{row['other_pss_mb']:>9.1f} {row['total_rss_mb']:>9.1f} {row['total_pss_mb']:>9.1f}"
+                )
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=list(range(1, 9)))
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--requests", type=int, default=20, help="/ask requests sent before measuring")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    rows = run(args.workers, args.modes, args.requests, args.timeout)
+    if args.output:
+        write_results(args.output, "workers", {
+            "workers": args.workers, "modes": args.modes, "requests": args.requests
+        }, rows)
@@ -0,0 +1,189 @@
+"""
+Local stand-in for the Groq chat completions API.
+
+Serves the OpenAI-compatible `/openai/v1/chat/completions` route that the Groq
+SDK calls, with configurable latency, so the app can be exercised without a
+network connection or an API key:
+
+    python -m benchmarks.fake_groq_server --port 8001
+    GROQ_BASE_URL=http://127.0.0.1:8001 GROQ_API_KEY=fake uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_ANSWER = (
+    "Under Section 379 of the Indian Penal Code, theft is punishable with "
+    "imprisonment of either description for a term which may extend to three "
+    "years, or with fine, or with both. This is not legal advice."
+)
+
+
+def create_app(
+    first_token_latency=0.2,
+    token_interval=0.02,
+    answer=DEFAULT_ANSWER,
+    failures=0,
+    failure_status=429,
+    retry_after=None
+):
+    """
+    Build the fake server application.
+
+    Args:
+        first_token_latency: Seconds to wait before the first token (or the
+            whole response, when not streaming) is sent
+        token_interval: Seconds between streamed tokens
+        answer: Text returned for every completion
+        failures: Number of initial requests answered with an error
+        failure_status: HTTP status of those errors (429 or 5xx)
+        retry_after: Retry-After seconds sent with them, if any
+
+    Returns:
+        FastAPI application emulating the Groq chat completions endpoint.
+        `app.state.requests` counts the completion requests received.
+    """
+    app = FastAPI(title="Fake Groq")
+    app.state.requests = 0
+    # Keep the words' trailing spaces so streamed tokens join back into the answer
+    tokens = [word + " " for word in answer.split(" ")]
+    tokens[-1] = tokens[-1].rstrip()
+
+    def _usage(prompt_text):
+        prompt_tokens = len(prompt_text.split())
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)
+        }
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        if app.state.requests <= failures:
+            headers = {"retry-after": str(retry_after)} if retry_after is not None else None
+            return JSONResponse(
+                status_code=failure_status,
+                content={"error": {"message": "Injected failure", "type": "fake_error"}},
+                headers=headers
+            )
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "fake-model")
+        prompt_text = " ".join(m.get("content", "") for m in body.get("messages", []))
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token_latency + token_interval * len(tokens))
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop"
+                }],
+                "usage": _usage(prompt_text)
+            })
+
+        def _chunk(delta, finish_reason=None, usage=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            if usage is not None:
+                # Groq reports the usage of a stream on its last chunk
+                payload["x_groq"] = {"id": completion_id, "usage": usage}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(first_token_latency)
+            yield _chunk({"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(token_interval)
+                yield _chunk({"content": token})
+            yield _chunk({}, finish_reason="stop", usage=_usage(prompt_text))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+class FakeGroqServer:
+    """
+    Runs the fake server on a background thread.
+
+    Usable as a context manager; `base_url` is suitable for GROQ_BASE_URL.
+    Keyword options are those of create_app.
+    """
+
+    @property
+    def requests(self):
+        """Completion requests received so far."""
+        return self.app.state.requests
+
+    def __init__(self, port=None, **app_options):
+        self.port = port or _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.app = create_app(**app_options)
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local Groq-compatible LLM stand-in.")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="Seconds between streamed tokens")
+    parser.add_argument("--failures", type=int, default=0, help="Initial requests answered with an error")
+    parser.add_argument("--failure-status", type=int, default=429, help="HTTP status of those errors")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(
+            first_token_latency=args.first_token_latency,
+            token_interval=args.token_interval,
+            failures=args.failures,
+            failure_status=args.failure_status
+        ),
+        host="127.0.0.1",
+        port=args.port
+    )
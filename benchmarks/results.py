@@ -0,0 +1,139 @@
+"""
+Machine-readable benchmark results and regression checks.
+
+Benchmarks given `--output results.json` write one JSON document with the
+environment they ran in, their settings and one row per measurement. Rows
+are identified by "name". Two result files are compared with:
+
+    python -m benchmarks.results baseline.json results.json --tolerance 0.2
+
+Numeric fields whose name ends in "_ms" or "_seconds" are treated as lower
+is better, and those ending in "qps" or "per_second" as higher is better. The
+command exits with status 1 when any of them got worse by more than the
+tolerance (a fraction of the baseline value), so it can gate CI.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+LOWER_IS_BETTER = ("_ms", "_seconds")
+HIGHER_IS_BETTER = ("qps", "per_second")
+
+
+def latency_summary(latencies):
+    """Summarize latencies given in seconds as milliseconds."""
+    if not latencies:
+        return {"count": 0}
+    ms = np.asarray(latencies, dtype=np.float64) * 1000
+    return {
+        "count": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Where the numbers were measured, so results from different machines aren't mixed up."""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def result_document(benchmark, config, rows):
+    return {"benchmark": benchmark, "environment": environment(), "config": config, "results": rows}
+
+
+def save_json(path, document):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {path}")
+
+
+def write_results(path, benchmark, config, rows):
+    """Write the rows of one benchmark run as JSON."""
+    document = result_document(benchmark, config, rows)
+    save_json(path, document)
+    return document
+
+
+def read_rows(path):
+    """Rows of a result file by name; suite files hold the rows of several benchmarks."""
+    with open(path, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    documents = document.get("benchmarks", [document])
+    return {f"{doc['benchmark']}:{row['name']}": row for doc in documents for row in doc["results"]}
+
+
+def _direction(field):
+    if field.endswith(LOWER_IS_BETTER):
+        return -1
+    if field.endswith(HIGHER_IS_BETTER):
+        return 1
+    return 0
+
+
+def compare(baseline_rows, current_rows, tolerance):
+    """
+    Return the metrics that regressed by more than `tolerance`.
+
+    Each regression is (row name, field, baseline value, current value).
+    Rows or fields missing from either side are skipped.
+    """
+    regressions = []
+    for name, baseline in baseline_rows.items():
+        current = current_rows.get(name)
+        if current is None:
+            continue
+        for field, old in baseline.items():
+            new = current.get(field)
+            direction = _direction(field)
+            if not direction or not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old <= 0:
+                continue
+            change = (new - old) / old * direction
+            if change < -tolerance:
+                regressions.append((name, field, old, new))
+    return regressions
+
+
+def check_regressions(baseline_path, current_path, tolerance):
+    """Print the regressions of current_path against baseline_path; True when there are none."""
+    regressions = compare(read_rows(baseline_path), read_rows(current_path), tolerance)
+    for name, field, old, new in regressions:
+        print(f"REGRESSION {name} {field}: {old} -> {new}")
+    print(f"{len(regressions)} regression(s) beyond {tolerance:.0%}")
+    return not regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (default: 0.2)")
+    args = parser.parse_args()
+
+    sys.exit(0 if check_regressions(args.baseline, args.current, args.tolerance) else 1)
@@ -0,0 +1,62 @@
+"""
+Offline benchmark suite: retrieval stage microbenchmarks plus the /ask and
+/analyze load test, written to one JSON file.
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --output bench.json --baseline main-bench.json
+
+With `--baseline`, the results are compared against an earlier run (see
+benchmarks.results) and the command exits with status 1 on a regression.
+Nothing calls the network: the LLM is the local fake Groq server. The
+embedding model must be available locally, and /ask needs the ingested
+index. `--quick` uses smaller corpora and fewer requests, for CI.
+"""
+import argparse
+import sys
+
+from benchmarks import bench_load, bench_retrieval_stages
+from benchmarks.results import check_regressions, environment, result_document, save_json
+
+
+def run(quick, timeout):
+    sizes = [1000, 10000] if quick else [1000, 10000, 100000]
+    stage_config = {"sizes": sizes, "queries": 20 if quick else 50, "k": 5, "index_type": "flat", "repeat": 3}
+    stage_rows = bench_retrieval_stages.run(
+        sizes, stage_config["queries"], stage_config["k"], stage_config["index_type"], stage_config["repeat"]
+    )
+
+    load_config = {
+        "endpoints": ["/ask", "/analyze"],
+        "concurrency": [1, 4] if quick else [1, 4, 16],
+        "requests": 20 if quick else 100,
+        "pdf_pages": 10,
+        "first_token_latency": 0.2,
+        "token_interval": 0.01,
+        "caches": False,
+        "timeout": timeout,
+    }
+    load_results = bench_load.run(
+        load_config["endpoints"], load_config["concurrency"], load_config["requests"], load_config["pdf_pages"],
+        load_config["first_token_latency"], load_config["token_interval"], load_config["caches"], timeout
+    )
+    return {
+        "environment": environment(),
+        "benchmarks": [
+            result_document("retrieval_stages", stage_config, stage_rows),
+            result_document("load", load_config, load_results),
+        ]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--baseline", help="Earlier suite output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (default: 0.2)")
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    save_json(args.output, run(args.quick, args.timeout))
+    if args.baseline:
+        sys.exit(0 if check_regressions(args.baseline, args.output, args.tolerance) else 1)
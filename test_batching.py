@@ -0,0 +1,132 @@
+import sys
+import os
+import asyncio
+
+# Add project root to python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import app.rag as rag
+from app.rag import QueryBatcher
+
+class _StubBatch:
+    """Stands in for rag._encode_and_search_batch and records every batch it serves."""
+
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+
+    def __call__(self, items):
+        self.batches.append([query for query, *_ in items])
+        if self.error is not None:
+            raise self.error
+        # Row ids derived from the query, so each caller can check it got its own
+        return [
+            (np.full((1, 4), len(query), dtype=np.float32), [len(query) * 100 + i for i in range(top_k)])
+            for query, _, top_k, _ in items
+        ]
+
+def _with_stub(stub, scenario):
+    original = rag._encode_and_search_batch
+    rag._encode_and_search_batch = stub
+    try:
+        return asyncio.run(scenario())
+    finally:
+        rag._encode_and_search_batch = original
+
+def test_submissions_in_one_window_share_a_call():
+    stub = _StubBatch()
+    batcher = QueryBatcher(max_batch_size=32, window_seconds=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(query, top_k=2) for query in ("a", "bb", "ccc")))
+
+    results = _with_stub(stub, scenario)
+
+    assert stub.batches == [["a", "bb", "ccc"]]
+    assert [rows for _, rows in results] == [[100, 101], [200, 201], [300, 301]]
+    assert [float(embedding[0, 0]) for embedding, _ in results] == [1.0, 2.0, 3.0]
+    assert batcher.stats() == {"batches": 1, "queries": 3, "mean_batch_size": 3.0}
+
+def test_full_batch_is_flushed_without_waiting_for_the_window():
+    stub = _StubBatch()
+    # A window far longer than the test: only the size limit can flush the first batch
+    batcher = QueryBatcher(max_batch_size=2, window_seconds=30)
+
+    async def scenario():
+        return await asyncio.wait_for(asyncio.gather(batcher.submit("a"), batcher.submit("bb")), timeout=5)
+
+    _with_stub(stub, scenario)
+    assert stub.batches == [["a", "bb"]]
+
+def test_callers_with_different_top_k_get_their_own_slice():
+    stub = _StubBatch()
+    batcher = QueryBatcher(max_batch_size=32, window_seconds=0.01)
+
+    async def scenario():
+        return await asyncio.gather(batcher.submit("a", top_k=0), batcher.submit("bb", top_k=3), batcher.submit("ccc", top_k=1))
+
+    results = _with_stub(stub, scenario)
+    assert [rows for _, rows in results] == [[], [200, 201, 202], [300]]
+
+    # The real batch function searches once with the largest top_k and cuts each caller's prefix
+    searched = []
+
+    def dense_search_batch(corpus, embeddings, top_k):
+        searched.append((len(embeddings), top_k))
+        return [list(range(top_k)) for _ in embeddings]
+
+    patched = {
+        "_load_index": lambda: "corpus",
+        "_encode": lambda queries: np.ones((len(queries), 4), dtype=np.float32),
+        "_dense_search_batch": dense_search_batch
+    }
+    originals = {name: getattr(rag, name) for name in patched}
+    for name, value in patched.items():
+        setattr(rag, name, value)
+    try:
+        served = rag._encode_and_search_batch([("a", None, 0, None), ("bb", None, 5, None), ("ccc", None, 2, None)])
+    finally:
+        for name, value in originals.items():
+            setattr(rag, name, value)
+
+    assert searched == [(2, 5)]
+    assert [rows for _, rows in served] == [[], [0, 1, 2, 3, 4], [0, 1]]
+
+def test_error_reaches_every_waiter():
+    stub = _StubBatch(error=RuntimeError("encoder failed"))
+    batcher = QueryBatcher(max_batch_size=32, window_seconds=0.01)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(query) for query in ("a", "bb", "ccc")), return_exceptions=True)
+
+    results = _with_stub(stub, scenario)
+    assert len(stub.batches) == 1
+    assert all(isinstance(result, RuntimeError) and str(result) == "encoder failed" for result in results)
+
+def test_cancelled_caller_does_not_break_the_others():
+    stub = _StubBatch()
+    batcher = QueryBatcher(max_batch_size=32, window_seconds=0.05)
+
+    async def scenario():
+        tasks = [asyncio.create_task(batcher.submit(query, top_k=1)) for query in ("a", "bb", "ccc")]
+        await asyncio.sleep(0)
+        # As when a client disconnects while its query waits for the batch
+        tasks[1].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # The batcher still serves later submissions
+        later = await batcher.submit("dddd", top_k=1)
+        return results, later
+
+    (first, cancelled, third), later = _with_stub(stub, scenario)
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert first[1] == [100] and third[1] == [300] and later[1] == [400]
+    assert stub.batches == [["a", "bb", "ccc"], ["dddd"]]
+
+if __name__ == "__main__":
+    test_submissions_in_one_window_share_a_call()
+    test_full_batch_is_flushed_without_waiting_for_the_window()
+    test_callers_with_different_top_k_get_their_own_slice()
+    test_error_reaches_every_waiter()
+    test_cancelled_caller_does_not_break_the_others()
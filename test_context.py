@@ -0,0 +1,66 @@
+import sys
+import os
+
+# Add project root to python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.chunking import estimate_tokens
+from app.context import SENTENCE_BOUNDARY, pack_context
+
+def _chunk(content, source="ipc_1860.pdf"):
+    return {"content": content, "metadata": {"source": source, "type": "pdf"}}
+
+THEFT = _chunk(
+    "Section 378. Whoever intends to take movable property dishonestly commits theft. "
+    "The property must be moved out of the possession of another person."
+)
+# Overlaps THEFT by one sentence, as neighbouring PDF chunks do
+PUNISHMENT = _chunk(
+    "The property must be moved out of the possession of another person. "
+    "Section 379. Theft is punished with imprisonment up to three years, or fine, or both."
+)
+MURDER = _chunk("Section 302. Murder is punished with death or imprisonment for life, and fine.")
+
+def test_packs_in_rank_order_and_drops_repeats():
+    packed = pack_context([PUNISHMENT, THEFT, dict(THEFT), MURDER], max_tokens=1000)
+    context = packed["context"]
+
+    # Rank order, not source order
+    assert context.index("Section 379") < context.index("Section 378") < context.index("Section 302")
+    # The repeated chunk and the repeated sentence each appear once
+    assert context.count("The property must be moved out of the possession of another person.") == 1
+    assert packed["deduplicated"] == 2
+    assert packed["chunks"] == [PUNISHMENT, THEFT, MURDER]
+    assert not packed["truncated"]
+    assert packed["tokens"] == estimate_tokens(context)
+
+def test_short_sentences_are_not_deduplicated():
+    packed = pack_context([_chunk("Yes. Bail is granted."), _chunk("Yes. Bail is refused.")], max_tokens=1000)
+    assert packed["context"] == "Yes. Bail is granted.\nYes. Bail is refused."
+    assert packed["deduplicated"] == 0
+
+def test_truncates_on_a_sentence_boundary():
+    budget = estimate_tokens(THEFT["content"]) + 10
+    packed = pack_context([THEFT, PUNISHMENT, MURDER], max_tokens=budget)
+    context = packed["context"]
+
+    assert packed["truncated"]
+    assert packed["tokens"] <= budget
+    assert context.startswith(THEFT["content"])
+    # Whole sentences only: the long sentence about section 379 did not fit, and packing stopped there
+    sentences = set(SENTENCE_BOUNDARY.split(" ".join(chunk["content"] for chunk in (THEFT, PUNISHMENT, MURDER))))
+    assert all(sentence in sentences for line in context.split("\n") for sentence in SENTENCE_BOUNDARY.split(line))
+    assert "three years" not in context and "Section 302" not in context
+    assert packed["chunks"] == [THEFT, PUNISHMENT]
+
+def test_keeps_part_of_a_best_sentence_longer_than_the_budget():
+    packed = pack_context([MURDER], max_tokens=5)
+    assert packed["truncated"]
+    assert packed["context"] and MURDER["content"].startswith(packed["context"])
+    assert packed["tokens"] <= 5
+
+if __name__ == "__main__":
+    test_packs_in_rank_order_and_drops_repeats()
+    test_short_sentences_are_not_deduplicated()
+    test_truncates_on_a_sentence_boundary()
+    test_keeps_part_of_a_best_sentence_longer_than_the_budget()
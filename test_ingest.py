@@ -0,0 +1,205 @@
+import sys
+import os
+import json
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+# Add project root to python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import faiss
+
+import app.ingest as ingest
+from app.chunk_store import ChunkStore
+from app.chunking import chunk_pages, estimate_tokens, section_title, split_to_budget
+from app.question_index import QuestionIndex
+from app.sparse import SparseBM25Index, tokenize
+from app.vector_index import load_index
+from benchmarks.bench_load import text_pdf
+
+ANSWER = (
+    "Under Section 379 of the Indian Penal Code, whoever commits theft shall be punished with imprisonment "
+    "of either description for a term which may extend to three years, or with fine, or with both."
+)
+QA_PAIRS = [
+    {"question": "What is the punishment for theft?", "answer": ANSWER},
+    {"question": "What does Article 21 guarantee?", "answer": "Article 21 protects life and personal liberty."},
+]
+# Collapses into the first pair, which gains it as an alternate question
+PARAPHRASE = {"question": "What is the punishment for theft in India?", "answer": ANSWER}
+
+STORE_PATHS = {
+    "INDEX_PATH": "index.faiss",
+    "CHUNK_STORE_DIR": "chunks",
+    "BM25_DIR": "bm25",
+    "QUESTION_INDEX_DIR": "questions",
+    "PARTITIONS_DIR": "partitions",
+    "MANIFEST_PATH": "manifest.json",
+    "CHECKPOINT_DIR": ".ingest_checkpoint",
+}
+
+def _fake_encode(texts, batch_size):
+    """Hashed bag-of-words vectors instead of the embedding model."""
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % 64] += 1.0
+    return vectors
+
+@contextmanager
+def _ingest_into(data_dir, index_dir):
+    """Point app.ingest at temporary data and index directories, with a fake encoder."""
+    patched = {"DATA_DIR": data_dir, "INDEX_DIR": index_dir, "_encode": _fake_encode}
+    patched.update({name: index_dir / path for name, path in STORE_PATHS.items()})
+    originals = {name: getattr(ingest, name) for name in patched}
+    for name, value in patched.items():
+        setattr(ingest, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(ingest, name, value)
+
+def _write_json(path, items):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(items, f)
+
+def _snapshot(index_dir):
+    """Everything an incremental run and a full rebuild must agree on, independent of row order."""
+    store = ChunkStore.open(index_dir / "chunks")
+    chunks = sorted((chunk["id"], chunk["content"], json.dumps(chunk["metadata"], sort_keys=True)) for chunk in store)
+    index, _ = load_index(index_dir / "index.faiss")
+    bm25 = SparseBM25Index.load(index_dir / "bm25")
+    questions = QuestionIndex.load(index_dir / "questions") if QuestionIndex.exists(index_dir / "questions") else QuestionIndex()
+    scores = {}
+    for query in ("punishment for theft in india", "notice period termination", "article 21 liberty"):
+        for chunk_id, score in zip(store.ids, bm25.get_scores(tokenize(query))):
+            scores[(query, int(chunk_id))] = round(float(score), 9)
+    return {
+        "chunks": chunks,
+        "vector_ids": sorted(faiss.vector_to_array(index.id_map).tolist()),
+        "bm25": scores,
+        "questions": sorted(zip(questions.chunk_ids.tolist(), questions.variants.tolist())),
+    }
+
+def test_incremental_update_matches_full_rebuild_for_qa_metadata():
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, incremental_dir, rebuilt_dir = (Path(tmp) / name for name in ("data", "incremental", "rebuilt"))
+        data_dir.mkdir()
+        _write_json(data_dir / "ipc_qa.json", QA_PAIRS)
+        with _ingest_into(data_dir, incremental_dir):
+            ingest.ingest_documents(workers=1)
+
+        _write_json(data_dir / "ipc_qa.json", QA_PAIRS + [PARAPHRASE])
+        encoded = []
+        with _ingest_into(data_dir, incremental_dir):
+            ingest._encode = lambda texts, batch_size: encoded.extend(texts) or _fake_encode(texts, batch_size)
+            ingest.ingest_documents(workers=1)
+        with _ingest_into(data_dir, rebuilt_dir):
+            ingest.ingest_documents(workers=1, rebuild=True)
+
+        incremental, rebuilt = _snapshot(incremental_dir), _snapshot(rebuilt_dir)
+
+    assert incremental == rebuilt
+    representative = [json.loads(metadata) for _, content, metadata in rebuilt["chunks"] if "theft?" in content][0]
+    assert representative["alternate_questions"] == [PARAPHRASE["question"]]
+    # Two questions of the representative pair, one of the other
+    assert len(rebuilt["questions"]) == 3
+    # The representative's text did not change, so its stored embedding was reused
+    assert not any(text.startswith("Question: What is the punishment for theft?") for text in encoded)
+
+def _contract_pages(heading):
+    clauses = [
+        "Either party may terminate this agreement by giving thirty days written notice.",
+        "The notice shall be delivered to the registered office of the other party.",
+        "Any dispute arising under this clause shall be referred to arbitration.",
+        "The seat of arbitration shall be New Delhi and the language English.",
+    ]
+    return [
+        ["Section 1. Definitions.", "Agreement means this contract and its schedules.", "Party means a signatory."],
+        [heading] + clauses,
+    ]
+
+def test_incremental_update_matches_full_rebuild_for_pdf_pages():
+    chunking = {"max_tokens": 40, "overlap_tokens": 8}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, incremental_dir, rebuilt_dir = (Path(tmp) / name for name in ("data", "incremental", "rebuilt"))
+        data_dir.mkdir()
+        (data_dir / "contract.pdf").write_bytes(text_pdf(_contract_pages("Section 2. Notice period.")))
+        with _ingest_into(data_dir, incremental_dir):
+            ingest.ingest_documents(workers=1, chunking=chunking)
+
+        # A cover page shifts every page, and the heading of section 2 is renamed
+        cover = ["Services agreement between the parties named below."]
+        (data_dir / "contract.pdf").write_bytes(text_pdf([cover] + _contract_pages("Section 2. Termination.")))
+        with _ingest_into(data_dir, incremental_dir):
+            ingest.ingest_documents(workers=1, chunking=chunking)
+        with _ingest_into(data_dir, rebuilt_dir):
+            ingest.ingest_documents(workers=1, chunking=chunking, rebuild=True)
+
+        incremental, rebuilt = _snapshot(incremental_dir), _snapshot(rebuilt_dir)
+
+    assert incremental == rebuilt
+    arbitration = [json.loads(metadata) for _, content, metadata in rebuilt["chunks"] if "seat of arbitration" in content]
+    assert arbitration and all(m["page"] == 3 and m["section"] == "Section 2. Termination." for m in arbitration)
+
+def test_split_to_budget():
+    paragraphs = [" ".join(f"p{i}w{j}" for j in range(20)) for i in range(5)]
+    text = "\n\n".join(paragraphs)
+    pieces = split_to_budget(text, 60)
+    assert all(estimate_tokens(piece) <= 60 for piece in pieces)
+    # Split between paragraphs, never inside one
+    assert pieces == ["\n\n".join(paragraphs[i:i + 2]) for i in range(0, 5, 2)]
+    # Text without separators is cut into budget-sized pieces
+    assert split_to_budget("x" * 100, 10) == ["x" * 40, "x" * 40, "x" * 20]
+    assert split_to_budget("short", 10) == ["short"]
+
+def test_section_title():
+    assert section_title("Section 302. Punishment for murder.") == "Section 302. Punishment for murder."
+    assert section_title("CHAPTER XVI") == "CHAPTER XVI"
+    assert section_title("OF OFFENCES AGAINST PROPERTY") == "OF OFFENCES AGAINST PROPERTY"
+    # The section body follows on the same line: only the number and caption are kept
+    body = "Whoever commits murder shall be punished with death, or imprisonment for life, and shall also be liable to fine."
+    assert section_title(f"Section 302. Punishment for murder. {body}") == "Section 302. Punishment for murder."
+    assert section_title(f"Section 378. Theft.-{body}") == "Section 378."
+    assert section_title("The accused was arrested on the same day.") is None
+    assert section_title("IPC") is None
+
+def test_chunk_pages_budget_overlap_and_sections():
+    theft = [f"Line {i} of the theft section explains one more element of the offence." for i in range(6)]
+    continued = [f"Line {i} continues the theft section on the next page." for i in range(6, 9)]
+    pages = [
+        (1, "\n".join(["CHAPTER XVII", "OF OFFENCES AGAINST PROPERTY", "Section 378. Theft."] + theft)),
+        (2, "\n".join(continued + ["Section 379. Punishment for theft.", "Whoever commits theft shall be punished."])),
+    ]
+    chunks = chunk_pages(pages, max_tokens=60, overlap_tokens=20)
+
+    assert all(estimate_tokens(chunk["content"]) <= 60 for chunk in chunks)
+    *theft_chunks, punishment = chunks
+    # Consecutive headings form one title, carried over to every chunk of the section, across the page break
+    assert {chunk["section"] for chunk in theft_chunks} == {"CHAPTER XVII OF OFFENCES AGAINST PROPERTY Section 378. Theft."}
+    assert (theft_chunks[0]["page"], theft_chunks[-1]["page_end"]) == (1, 2)
+    assert any(chunk["page"] == 1 and chunk["page_end"] == 2 for chunk in theft_chunks)
+    # Neighbouring chunks of a section share their boundary line
+    for previous, chunk in zip(theft_chunks, theft_chunks[1:]):
+        assert chunk["content"].split("\n")[0] == previous["content"].split("\n")[-1]
+    # Every line is in some chunk
+    lines = [line for chunk in theft_chunks for line in chunk["content"].split("\n")]
+    assert set(theft + continued) <= set(lines)
+    # A new heading starts a new chunk, without overlap from the previous section
+    assert punishment == {
+        "content": "Section 379. Punishment for theft.\nWhoever commits theft shall be punished.",
+        "page": 2,
+        "page_end": 2,
+        "section": "Section 379. Punishment for theft."
+    }
+
+if __name__ == "__main__":
+    test_incremental_update_matches_full_rebuild_for_qa_metadata()
+    test_incremental_update_matches_full_rebuild_for_pdf_pages()
+    test_split_to_budget()
+    test_section_title()
+    test_chunk_pages_budget_overlap_and_sections()
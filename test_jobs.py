@@ -0,0 +1,99 @@
+import sys
+import os
+import signal
+import asyncio
+import tempfile
+import threading
+
+# Add project root to python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app.jobs as jobs
+from app.jobs import JobQueue, MemoryJobStore, SQLiteJobStore, new_job, owner_token, run_in_extraction_pool
+
+def _submit_concurrently(store, submissions, limit):
+    """Add jobs from many threads at once, each with its own connection, as several workers would."""
+    barrier = threading.Barrier(submissions)
+    added = []
+
+    def submit():
+        job = new_job("contract.pdf", None, 3600)
+        barrier.wait()
+        added.append(store.add_if_below(job, limit))
+
+    threads = [threading.Thread(target=submit) for _ in range(submissions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return added
+
+def test_pending_limit_holds_under_concurrent_submissions():
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in (MemoryJobStore(), SQLiteJobStore(os.path.join(tmp, "jobs.db"))):
+            added = _submit_concurrently(store, submissions=16, limit=5)
+            assert added.count(True) == 5
+            assert store.count_pending() == 5
+
+def test_finished_jobs_free_their_slot():
+    store = MemoryJobStore()
+    first, second = new_job("a.pdf", None, 3600), new_job("b.pdf", None, 3600)
+    assert store.add_if_below(first, 1)
+    assert not store.add_if_below(second, 1)
+    store.update(first["job_id"], status="completed")
+    assert store.add_if_below(second, 1)
+    assert store.get(second["job_id"])["status"] == "queued"
+
+def test_job_runs_after_an_extraction_worker_died():
+    async def extract(report):
+        return {"pid": await run_in_extraction_pool(os.getpid)}
+
+    async def run_jobs():
+        queue = JobQueue(MemoryJobStore(), workers=1)
+        first = await queue.submit(extract, "a.pdf", None)
+        while (await queue.get(first["job_id"]))["status"] != "completed":
+            await asyncio.sleep(0.05)
+        # As when the parser crashes a worker: the whole pool is broken
+        killed = list(jobs.extraction_pool()._processes)
+        for pid in killed:
+            os.kill(pid, signal.SIGKILL)
+        second = await queue.submit(extract, "b.pdf", None)
+        while (await queue.get(second["job_id"]))["status"] in ("queued", "running"):
+            await asyncio.sleep(0.05)
+        await queue.stop()
+        return await queue.get(second["job_id"]), killed
+
+    try:
+        job, killed = asyncio.run(run_jobs())
+    finally:
+        jobs.shutdown_extraction_pool()
+
+    assert job["status"] == "completed", job
+    assert job["result"]["pid"] not in killed
+
+def test_jobs_of_a_restarted_process_fail_even_when_its_pid_is_reused():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteJobStore(os.path.join(tmp, "jobs.db"))
+        # Left running by an earlier process that had this process's pid
+        orphan = dict(new_job("a.pdf", None, 3600), status="running", owner=f"{os.getpid()}-earlier")
+        alive = dict(new_job("b.pdf", None, 3600), status="running", owner="other-worker")
+        for job in (orphan, alive):
+            assert store.add_if_below(job, 10)
+        store.heartbeat("other-worker")
+
+        async def start():
+            queue = JobQueue(store)
+            queue.start()
+            await queue.stop()
+
+        asyncio.run(start())
+
+        assert store.get(orphan["job_id"])["status"] == "failed"
+        assert store.get(alive["job_id"])["status"] == "running"
+        assert owner_token() != orphan["owner"]
+
+if __name__ == "__main__":
+    test_pending_limit_holds_under_concurrent_submissions()
+    test_finished_jobs_free_their_slot()
+    test_job_runs_after_an_extraction_worker_died()
+    test_jobs_of_a_restarted_process_fail_even_when_its_pid_is_reused()
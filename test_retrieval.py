@@ -1,11 +1,18 @@
 import sys
 import os
+import tempfile
 from pathlib import Path
 
+import pytest
+
 # Add project root to python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.rag import retrieve_legal_context
+import app.ingest as ingest
+import app.rag as rag
+from app.rag import INDEX_PATH, retrieve_legal_context
+from app.partitions import partition_name
+from test_ingest import QA_PAIRS, _fake_encode, _ingest_into, _write_json
 
 def test_retrieval():
     query = "What is the penalty for murder?"
@@ -20,5 +27,61 @@ def test_retrieval():
     except Exception as e:
         print(f"Error: {e}")
 
+def test_retrieval_by_source():
+    query = "What is the penalty for murder?"
+    if not INDEX_PATH.exists():
+        pytest.skip(f"No index at {INDEX_PATH}; run python -m app.ingest first")
+    print(f"Query: {query} (IPC only)")
+    results = retrieve_legal_context(query, sources=["ipc"])
+    print(f"Retrieved {len(results)} chunks.")
+    for res in results:
+        print(f"Source: {res['metadata']}")
+    assert all(partition_name(res["metadata"]["source"]) == "ipc" for res in results)
+
+class _FakeEncoder:
+    def encode(self, texts, **kwargs):
+        return _fake_encode(texts, 32)
+
+def _point_rag_at(index_dir):
+    for name in ("INDEX_PATH", "CHUNK_STORE_DIR", "BM25_DIR", "QUESTION_INDEX_DIR", "PARTITIONS_DIR"):
+        setattr(rag, name, index_dir / getattr(ingest, name).relative_to(ingest.INDEX_DIR))
+
+def test_search_keeps_its_snapshot_across_a_reload():
+    amended = [{"question": pair["question"], "answer": f"Amended: {pair['answer']}"} for pair in QA_PAIRS]
+    amended.append({"question": "What is criminal breach of trust?", "answer": "Section 405 IPC defines it."})
+    patched = ("INDEX_PATH", "CHUNK_STORE_DIR", "BM25_DIR", "QUESTION_INDEX_DIR", "PARTITIONS_DIR", "corpus", "model", "query_model", "_sparse_search")
+    originals = {name: getattr(rag, name) for name in patched}
+    reloaded = []
+
+    def sparse_search_during_reload(corpus, query, top_k):
+        # Another request notices the rebuilt index while this one is between its searches
+        _point_rag_at(new_dir)
+        reloaded.append(rag._load_index())
+        return originals["_sparse_search"](corpus, query, top_k)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_dir, new_dir = Path(tmp) / "old", Path(tmp) / "new"
+        for index_dir, pairs in ((old_dir, QA_PAIRS), (new_dir, amended)):
+            data_dir = Path(tmp) / f"data-{index_dir.name}"
+            data_dir.mkdir()
+            _write_json(data_dir / "ipc_qa.json", pairs)
+            with _ingest_into(data_dir, index_dir):
+                ingest.ingest_documents(workers=1)
+        try:
+            _point_rag_at(old_dir)
+            rag.corpus, rag.model, rag.query_model = None, None, lambda spec: _FakeEncoder()
+            before = rag._load_index()
+            rag._sparse_search = sparse_search_during_reload
+            results = retrieve_legal_context("What is the punishment for theft?", top_k=3)
+        finally:
+            for name, value in originals.items():
+                setattr(rag, name, value)
+
+    assert reloaded and reloaded[0] is not before
+    old_contents = {chunk["content"] for chunk in before.chunk_store}
+    assert results and all(chunk["content"] in old_contents for chunk in results)
+
 if __name__ == "__main__":
     test_retrieval()
+    test_retrieval_by_source()
+    test_search_keeps_its_snapshot_across_a_reload()
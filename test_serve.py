@@ -0,0 +1,127 @@
+import sys
+import os
+import re
+import signal
+import subprocess
+import multiprocessing
+import tempfile
+import threading
+import time
+
+# Add project root to python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import numpy as np
+
+from app.embedding_server import EmbeddingServer, RemoteEmbeddingModel, _spec_key
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+class _FakeEncoder:
+    """Encodes each text as its length."""
+
+    def encode(self, texts, **kwargs):
+        if any(text == "fail" for text in texts):
+            raise ValueError("cannot encode")
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+def _wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+def test_serve_runs_workers_and_stops_on_sigterm():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])),
+            PYTHONUNBUFFERED="1",
+            TMPDIR=tmp,
+            RAG_WARMUP="false",
+        )
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        process = subprocess.Popen(
+            [sys.executable, "-m", "app.serve", "--workers", "2", "--port", "0", "--log-level", "warning"],
+            cwd=tmp, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        output = []
+        try:
+            port = None
+            for line in process.stdout:
+                output.append(line)
+                match = re.search(r"Serving on http://127\.0\.0\.1:(\d+) with 2 workers", line)
+                if match:
+                    port = int(match.group(1))
+                    break
+            assert port, "".join(output)
+            reader = threading.Thread(target=lambda: output.extend(process.stdout), daemon=True)
+            reader.start()
+
+            base = f"http://127.0.0.1:{port}"
+
+            def healthy():
+                try:
+                    return httpx.get(f"{base}/health", timeout=1).status_code == 200
+                except httpx.TransportError:
+                    return False
+
+            _wait_for(healthy)
+            response = httpx.delete(f"{base}/analyze/sessions/abc", timeout=5)
+            assert response.status_code == 400
+            assert "sessions are disabled" in response.json()["detail"]
+
+            process.send_signal(signal.SIGTERM)
+            assert process.wait(timeout=30) == 0, "".join(output)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        assert "Document sessions are disabled" in "".join(output)
+        # The temporary metrics directory is removed on exit
+        assert not [name for name in os.listdir(tmp) if name.startswith("legal-metrics-")]
+
+def _round_trip(address, spec):
+    model = RemoteEmbeddingModel(address, spec, authkey=b"secret")
+    embeddings = model.encode(["a", "abc"])
+    assert embeddings.dtype == np.float32
+    np.testing.assert_array_equal(embeddings, [[1, 1], [3, 1]])
+    np.testing.assert_array_equal(model.encode("ab"), [[2, 1]])
+
+    # An encoding error is reported to the client, and the server keeps serving
+    try:
+        model.encode(["fail"])
+        assert False, "expected a RuntimeError"
+    except RuntimeError as e:
+        assert "ValueError: cannot encode" in str(e)
+    np.testing.assert_array_equal(model.encode(["abcd"]), [[4, 1]])
+
+    # A client with the wrong key is rejected without stopping the server
+    try:
+        RemoteEmbeddingModel(address, spec, authkey=b"wrong").encode(["a"])
+        assert False, "expected the connection to be refused"
+    except multiprocessing.AuthenticationError:
+        pass
+    np.testing.assert_array_equal(model.encode(["abcde"]), [[5, 1]])
+
+def test_embedding_server_round_trip():
+    spec = {"backend": "fake", "model": "lengths"}
+    with tempfile.TemporaryDirectory() as tmp:
+        address = os.path.join(tmp, "embedding.sock")
+        server = EmbeddingServer(address, b"secret")
+        server._models[_spec_key(spec)] = _FakeEncoder()
+        # A separate process, as under app.serve, that is stopped before the socket is removed
+        process = multiprocessing.get_context("fork").Process(target=server.serve_forever, daemon=True)
+        process.start()
+        try:
+            _wait_for(lambda: os.path.exists(address))
+            _round_trip(address, spec)
+        finally:
+            process.terminate()
+            process.join()
+
+if __name__ == "__main__":
+    test_serve_runs_workers_and_stops_on_sigterm()
+    test_embedding_server_round_trip()
+    print("All serve tests passed!")
@@ -0,0 +1,219 @@
+import sys
+import os
+import re
+import time
+import asyncio
+
+# Add project root to python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import app.services as services
+from app.chunking import estimate_tokens
+from app.services import (
+    DocumentAnalysisService,
+    DocumentResultCache,
+    SemanticAnswerCache,
+    _group_by_tokens,
+    document_digest,
+    new_document
+)
+
+SOURCES = [{"source": "ipc_qa.json", "type": "json_qa"}]
+
+def _embedding(*values):
+    return np.array(values, dtype=np.float32)
+
+def test_answer_cache_hits_and_misses():
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    cache.put("What is the punishment under section 302?", _embedding(1.0, 0.0, 0.0), "Death or life imprisonment.", SOURCES, "v1")
+
+    exact = cache.get_exact("what is the punishment under Section 302", "v1")
+    # Reworded, nearly the same embedding
+    similar = cache.get_similar("Punishment for section 302?", _embedding(0.99, 0.05, 0.0), "v1")
+    # Close in embedding space, but about another section
+    other_section = cache.get_similar("What is the punishment under section 304?", _embedding(0.99, 0.05, 0.0), "v1")
+    unrelated = cache.get_similar("What is bail for section 302?", _embedding(0.0, 1.0, 0.0), "v1")
+    other_scope = cache.get_similar("Punishment for section 302?", _embedding(1.0, 0.0, 0.0), "v1", scope="crpc")
+
+    assert exact["answer"] == "Death or life imprisonment."
+    assert similar["answer"] == "Death or life imprisonment."
+    assert other_section is None and unrelated is None and other_scope is None
+    stats = cache.stats()
+    assert (stats["hits_exact"], stats["hits_semantic"], stats["misses"]) == (1, 1, 3)
+
+def test_answer_cache_expires_and_invalidates():
+    cache = SemanticAnswerCache(ttl_seconds=0.05)
+    cache.put("What is theft?", _embedding(1.0, 0.0), "Section 378 IPC.", SOURCES, "v1")
+    assert cache.get_exact("What is theft?", "v1") is not None
+    time.sleep(0.1)
+    assert cache.get_exact("What is theft?", "v1") is None
+    assert cache.stats()["expirations"] == 1
+
+    cache = SemanticAnswerCache()
+    cache.put("What is theft?", _embedding(1.0, 0.0), "Section 378 IPC.", SOURCES, "v1")
+    # The index was rebuilt
+    assert cache.get_exact("What is theft?", "v2") is None
+    assert cache.get_similar("What is theft?", _embedding(1.0, 0.0), "v2") is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["invalidations"] == 1
+
+def _extraction_result(n_pages, words_per_page):
+    pages = [" ".join(f"p{page}w{word}" for word in range(words_per_page)) for page in range(1, n_pages + 1)]
+    return {
+        "full_text": "\n\n".join(pages),
+        "total_pages": n_pages,
+        "text_chunks": [{"page": page, "text": text} for page, text in enumerate(pages, 1)]
+    }
+
+def _map_reduce(map_output):
+    """
+    Run prepare_key_points over 12 pages with a fake LLM whose map calls
+    return map_output(pages).
+
+    Returns the sections, the prompts sent, the key points of every merge
+    prompt built (the final one last), the final prompt and its stage.
+    """
+    prompts = []
+    merged_groups = []
+
+    async def fake_generate(prompt):
+        prompts.append(prompt)
+        if "SECTION CONTENT:" in prompt:
+            return map_output(re.search(r"text is (pages? [\d-]+) of", prompt).group(1))
+        return "- merged " + " ".join(re.findall(r"points of pages? [\d-]+", prompt))
+
+    def recording_merge_prompt(section_key_points):
+        merged_groups.append(list(section_key_points))
+        return original_merge_prompt(section_key_points)
+
+    service = DocumentAnalysisService(section_tokens=150, merge_tokens=400, concurrency=2)
+    extraction_result = _extraction_result(n_pages=12, words_per_page=40)
+    sections = service.split(extraction_result)
+    original_generate = services.generate_response_async
+    original_merge_prompt = services.merge_key_points_prompt
+    services.generate_response_async = fake_generate
+    services.merge_key_points_prompt = recording_merge_prompt
+    try:
+        timings = services.new_analysis_timings()
+        prompt, stage, n_sections = asyncio.run(service.prepare_key_points(extraction_result, timings))
+    finally:
+        services.generate_response_async = original_generate
+        services.merge_key_points_prompt = original_merge_prompt
+    assert n_sections == len(sections)
+    return sections, prompts, merged_groups, prompt, stage
+
+def _page_references(sections):
+    return [
+        f"points of page {s['first_page']}" if s["first_page"] == s["last_page"]
+        else f"points of pages {s['first_page']}-{s['last_page']}"
+        for s in sections
+    ]
+
+def test_key_points_map_reduce():
+    # Long enough that the map outputs need more than one merge round
+    sections, prompts, merged_groups, prompt, stage = _map_reduce(lambda pages: f"- points of {pages} " + "detail " * 60)
+
+    assert len(sections) > 1
+    assert all(estimate_tokens(section["text"]) <= 150 for section in sections)
+    # Sections cover the pages in order, without gaps
+    assert sections[0]["first_page"] == 1 and sections[-1]["last_page"] == 12
+    assert all(a["last_page"] + 1 == b["first_page"] for a, b in zip(sections, sections[1:]))
+    assert len([p for p in prompts if "SECTION CONTENT:" in p]) == len(sections)
+
+    # The map outputs did not fit in one merge prompt, so they were merged in groups first
+    *intermediate, final = merged_groups
+    assert intermediate
+    for group in intermediate:
+        assert len(group) > 1 and estimate_tokens("".join(group)) <= 400
+    # The final reduce prompt carries every section's key points, in document order
+    assert stage == "key_points_reduce_seconds"
+    assert len(final) < len(sections)
+    assert re.findall(r"points of pages? [\d-]+", prompt) == _page_references(sections)
+
+def test_key_points_map_reduce_trims_oversized_points():
+    # Every map output is over half the merge budget, so no two neighbours fit in one merge prompt
+    detail = "\n".join(["- detail " * 10] * 15)
+    sections, _, merged_groups, prompt, _ = _map_reduce(lambda pages: f"- points of {pages}\n{detail}")
+
+    assert merged_groups
+    for group in merged_groups:
+        assert estimate_tokens("".join(group)) <= 400
+    # Trimming keeps the start of each section's points
+    assert re.findall(r"points of pages? [\d-]+", prompt) == _page_references(sections)
+
+def test_group_by_tokens_respects_budget():
+    texts = ["a" * 4 * tokens for tokens in (30, 50, 40, 90, 10, 120, 5)]
+    groups = _group_by_tokens(texts, 100)
+    assert [text for group in groups for text in group] == texts
+    for group in groups:
+        # A single text over the budget gets a group of its own
+        assert len(group) == 1 or sum(estimate_tokens(text) for text in group) <= 100
+    assert [len(group) for group in groups] == [2, 1, 2, 1, 1]
+
+def test_document_cache_reuses_results_of_the_same_file():
+    calls = []
+
+    async def fake_generate(prompt):
+        calls.append(prompt)
+        return f"answer {len(calls)}"
+
+    pdf = b"%PDF-1.4 contract"
+    extraction_result = _extraction_result(n_pages=2, words_per_page=10)
+    service = DocumentAnalysisService(result_cache=DocumentResultCache())
+
+    def analyze(content, question):
+        digest = document_digest(content)
+        document = service.cached_document(digest) or new_document(digest, extraction_result, {"total_pages": 2})
+        return asyncio.run(service.analyze(document, question))
+
+    original_generate = services.generate_response_async
+    services.generate_response_async = fake_generate
+    try:
+        first = analyze(pdf, "Who are the parties?")
+        repeat = analyze(bytes(pdf), "who are the parties")
+        other_question = analyze(pdf, "When does it end?")
+        other_file = analyze(pdf + b" amended", "Who are the parties?")
+    finally:
+        services.generate_response_async = original_generate
+
+    # Key points and analysis for each new file, only the analysis for a new question
+    assert len(calls) == 2 + 1 + 2
+    assert first["cached"] == {"document": False, "analysis": False}
+    assert repeat["cached"] == {"document": True, "analysis": True}
+    assert repeat["analysis"] == first["analysis"] and repeat["key_points"] == first["key_points"]
+    # Only the new question is analyzed
+    assert other_question["cached"] == {"document": True, "analysis": False}
+    assert other_question["key_points"] == first["key_points"]
+    assert other_file["cached"] == {"document": False, "analysis": False}
+    stats = service.cache_stats()
+    assert (stats["hits"], stats["misses"], stats["analysis_hits"]) == (2, 2, 1)
+
+def test_document_cache_evicts_and_expires():
+    extraction_result = _extraction_result(n_pages=1, words_per_page=10)
+    cache = DocumentResultCache(max_entries=2, ttl_seconds=60)
+    for name in ("a", "b", "c"):
+        cache.put(name, extraction_result, {}, f"key points of {name}", 1)
+    # Least recently used first
+    assert cache.get("a") is None and cache.get("b") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+    cache = DocumentResultCache(max_questions=2)
+    cache.put("a", extraction_result, {}, "key points", 1)
+    for question in ("one?", "two?", "three?"):
+        cache.put_analysis("a", question, f"analysis of {question}")
+    assert cache.get_analysis("a", "one?") is None and cache.get_analysis("a", "three?") is not None
+
+    cache = DocumentResultCache(ttl_seconds=0.05)
+    cache.put("a", extraction_result, {}, "key points", 1)
+    time.sleep(0.1)
+    assert cache.get("a") is None and cache.stats()["expirations"] == 1
+
+if __name__ == "__main__":
+    test_answer_cache_hits_and_misses()
+    test_answer_cache_expires_and_invalidates()
+    test_key_points_map_reduce()
+    test_key_points_map_reduce_trims_oversized_points()
+    test_group_by_tokens_respects_budget()
+    test_document_cache_reuses_results_of_the_same_file()
+    test_document_cache_evicts_and_expires()
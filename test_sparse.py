@@ -0,0 +1,76 @@
+import sys
+import os
+
+# Add project root to python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from app.sparse import SparseBM25Index, tokenize
+
+CORPUS = [tokenize(text) for text in [
+    "Section 378 IPC defines theft as dishonestly taking movable property.",
+    "Section 379 IPC: punishment for theft is imprisonment up to three years, or fine, or both.",
+    "Section 302 IPC: punishment for murder is death or imprisonment for life, and fine.",
+    "Section 304 IPC: punishment for culpable homicide not amounting to murder.",
+    "Article 21 of the Constitution: no person shall be deprived of life or personal liberty.",
+    "Section 154 CrPC: information in cognizable cases is recorded as an FIR.",
+    "Section 41 CrPC: when police may arrest without warrant.",
+]]
+
+QUERIES = [
+    "What is the punishment for theft?",
+    # "section" is in more than half the documents, so its IDF is floored at epsilon
+    "section",
+    "punishment for murder under section 302",
+    "life life liberty",
+    "words found nowhere",
+    "",
+]
+
+def test_scores_match_rank_bm25():
+    reference = BM25Okapi(CORPUS)
+    index = SparseBM25Index.build(CORPUS)
+
+    for query in QUERIES:
+        tokens = tokenize(query)
+        expected = reference.get_scores(tokens)
+        assert np.allclose(index.get_scores(tokens), expected, rtol=0, atol=1e-9), query
+
+        ids, scores = index.top_k(tokens, 3)
+        # Best first, with BM25Okapi's scores, among documents sharing a term
+        assert np.allclose(scores, expected[ids], atol=1e-9), query
+        matching = [i for i, doc in enumerate(CORPUS) if set(doc) & set(tokens)]
+        assert len(ids) == min(3, len(matching)), query
+        assert np.allclose(scores, np.sort(expected[matching])[::-1][:3], atol=1e-9), query
+
+    batch = index.top_k_batch([tokenize(query) for query in QUERIES], 3)
+    for query, (_, scores) in zip(QUERIES, batch):
+        assert np.allclose(scores, index.top_k(tokenize(query), 3)[1], atol=1e-9), query
+
+def test_epsilon_floor_and_empty_query():
+    index = SparseBM25Index.build(CORPUS)
+    reference = BM25Okapi(CORPUS)
+    section = index.vocabulary["section"]
+    assert index.idf[section] > 0
+    assert np.isclose(index.idf[section], reference.idf["section"])
+
+    ids, scores = index.top_k([], 5)
+    assert len(ids) == 0 and len(scores) == 0
+    assert not index.get_scores([]).any()
+
+def test_updates_match_a_rebuild():
+    index = SparseBM25Index.build(CORPUS[:5])
+    index.remove_documents([1, 3])
+    index.add_documents(CORPUS[5:])
+    remaining = [CORPUS[0], CORPUS[2], CORPUS[4]] + CORPUS[5:]
+    reference = BM25Okapi(remaining)
+    for query in QUERIES:
+        tokens = tokenize(query)
+        assert np.allclose(index.get_scores(tokens), reference.get_scores(tokens), atol=1e-9), query
+
+if __name__ == "__main__":
+    test_scores_match_rank_bm25()
+    test_epsilon_floor_and_empty_query()
+    test_updates_match_a_rebuild()
@@ -0,0 +1,522 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# Add project root to python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Retrieval is faked below, so keep the app from loading the model or index
+os.environ["ANSWER_CACHE_ENABLED"] = "false"
+os.environ["RAG_FAST_PATH_ENABLED"] = "false"
+os.environ["RAG_WARMUP"] = "false"
+
+import numpy as np
+from fastapi.testclient import TestClient
+from groq import AsyncStream
+
+from benchmarks.fake_groq_server import FakeGroqServer, DEFAULT_ANSWER
+import app.llm as llm
+import app.rag as rag
+import app.services as services
+import app.main as main
+from app.main import app
+from app.partitions import UnknownSourceError
+from benchmarks.bench_load import synthetic_pdf
+
+FAKE_CHUNKS = [
+    {"content": "Question: What is theft?\nAnswer: Section 378 IPC defines theft.", "metadata": {"source": "ipc_qa.json", "type": "json_qa"}},
+    {"content": "Question: Punishment for theft?\nAnswer: Section 379 IPC.", "metadata": {"source": "ipc_qa.json", "type": "json_qa"}},
+]
+
+def _use_fake_groq(server):
+    os.environ["GROQ_BASE_URL"] = server.base_url
+    os.environ["GROQ_API_KEY"] = "fake-key"
+    llm.client = None
+    llm.async_client = None
+
+def _parse_sse(lines):
+    events = []
+    event = None
+    for line in lines:
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+def test_generate_response_stream():
+    with FakeGroqServer(first_token_latency=0.3, token_interval=0.05) as server:
+        _use_fake_groq(server)
+
+        async def consume():
+            started = time.perf_counter()
+            first_token_at = None
+            tokens = []
+            async for token in llm.generate_response_stream("What is the punishment for theft?"):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter() - started
+                tokens.append(token)
+            return first_token_at, time.perf_counter() - started, tokens
+
+        first_token_at, total, tokens = asyncio.run(consume())
+        print(f"Time to first token: {first_token_at:.3f}s, total: {total:.3f}s, tokens: {len(tokens)}")
+
+        assert "".join(tokens) == DEFAULT_ANSWER
+        assert len(tokens) > 1
+        assert first_token_at < total / 2
+
+def test_closing_stream_early_closes_groq_stream():
+    closed = []
+    original_close = AsyncStream.close
+
+    async def recording_close(self):
+        closed.append(self)
+        await original_close(self)
+
+    AsyncStream.close = recording_close
+    try:
+        with FakeGroqServer(first_token_latency=0.0, token_interval=0.05) as server:
+            _use_fake_groq(server)
+
+            async def read_one_token():
+                stream = llm.generate_response_stream("What is the punishment for theft?")
+                token = await stream.__anext__()
+                # As when the client of /ask/stream disconnects
+                await stream.aclose()
+                return token
+
+            token = asyncio.run(read_one_token())
+    finally:
+        AsyncStream.close = original_close
+
+    assert token
+    assert len(closed) == 1
+
+def test_identical_prompts_share_one_call():
+    with FakeGroqServer(first_token_latency=0.2, token_interval=0.0) as server:
+        _use_fake_groq(server)
+
+        async def ask_concurrently():
+            return await asyncio.gather(*(
+                llm.generate_response_async("What is the punishment for theft?") for _ in range(5)
+            ), llm.generate_response_async("What is the punishment for murder?"))
+
+        answers = asyncio.run(ask_concurrently())
+
+    assert answers == [DEFAULT_ANSWER] * 6
+    # One call per distinct prompt
+    assert server.requests == 2
+
+def test_retries_rate_limited_calls():
+    original_base = llm.RETRY_BASE_SECONDS
+    llm.RETRY_BASE_SECONDS = 0.01
+    try:
+        with FakeGroqServer(first_token_latency=0.0, token_interval=0.0, failures=2, failure_status=429) as server:
+            _use_fake_groq(server)
+            answer = asyncio.run(llm.generate_response_async("What is bail?"))
+            assert server.requests == 3
+        with FakeGroqServer(first_token_latency=0.0, token_interval=0.0, failures=5, failure_status=503) as server:
+            _use_fake_groq(server)
+            try:
+                asyncio.run(llm.generate_response_async("What is anticipatory bail?"))
+                raise AssertionError("expected the call to fail once retries ran out")
+            except llm.APIStatusError as e:
+                assert e.status_code == 503
+            assert server.requests == llm.MAX_RETRIES + 1
+    finally:
+        llm.RETRY_BASE_SECONDS = original_base
+
+    assert answer == DEFAULT_ANSWER
+
+def test_groq_clients_are_closed():
+    with FakeGroqServer(first_token_latency=0.0, token_interval=0.0) as server:
+        _use_fake_groq(server)
+        # A client made in a loop that is still running is closed when another loop needs one
+        other_loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=other_loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(llm.generate_response_async("What is bail?"), other_loop).result(10)
+            replaced = llm.async_client
+            asyncio.run(llm.generate_response_async("What is anticipatory bail?"))
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0.1), other_loop).result(10)
+        finally:
+            other_loop.call_soon_threadsafe(other_loop.stop)
+            thread.join()
+            other_loop.close()
+
+        # The app closes its client at shutdown
+        with TestClient(app) as client:
+            client.portal.call(llm.generate_response_async, "What is a charge sheet?")
+            at_shutdown = llm.async_client
+
+    assert replaced.is_closed()
+    assert at_shutdown is not replaced and at_shutdown.is_closed()
+    assert llm.async_client is None
+
+def test_failed_warm_up_is_retried_until_ready():
+    attempts = []
+    statuses = []
+
+    async def flaky_warm_up():
+        attempts.append(main.warmup_state["status"])
+        if len(attempts) < 3:
+            raise FileNotFoundError("Index files not found.")
+        return 0.5
+
+    async def warm_up_and_poll():
+        task = asyncio.create_task(main._warm_up())
+        while not task.done():
+            statuses.append(TestClient(app).get("/ready").status_code)
+            await asyncio.sleep(0.005)
+        return TestClient(app).get("/ready")
+
+    original_warm_up, original_base = main.warm_up_async, main.WARMUP_RETRY_BASE_SECONDS
+    original_state = dict(main.warmup_state)
+    main.warm_up_async = flaky_warm_up
+    main.WARMUP_RETRY_BASE_SECONDS = 0.01
+    try:
+        ready = asyncio.run(warm_up_and_poll())
+    finally:
+        main.warm_up_async, main.WARMUP_RETRY_BASE_SECONDS = original_warm_up, original_base
+        main.warmup_state.update(original_state)
+
+    assert len(attempts) == 3
+    assert 503 in statuses
+    assert ready.status_code == 200 and ready.json()["status"] == "ready" and ready.json()["detail"] is None
+
+def test_ask_stream_sends_sources_first():
+    async def fake_retrieve(query, top_k=5, query_embedding=None, sources=None):
+        return FAKE_CHUNKS
+
+    original_retrieve = services.retrieve_legal_context_async
+    services.retrieve_legal_context_async = fake_retrieve
+    try:
+        with FakeGroqServer(first_token_latency=0.05, token_interval=0.01) as server:
+            _use_fake_groq(server)
+            client = TestClient(app)
+            with client.stream("POST", "/ask/stream", json={"question": "What is the punishment for theft?"}) as response:
+                assert response.status_code == 200
+                assert response.headers["content-type"].startswith("text/event-stream")
+                events = _parse_sse(response.iter_lines())
+    finally:
+        services.retrieve_legal_context_async = original_retrieve
+
+    names = [name for name, _ in events]
+    print(f"Received {len(events)} events: {names[0]} ... {names[-1]}")
+
+    assert names[0] == "sources"
+    assert events[0][1]["sources"] == [chunk["metadata"] for chunk in FAKE_CHUNKS]
+    assert 0 < events[0][1]["tokens"]["context"] <= events[0][1]["tokens"]["context_budget"]
+    assert names[-1] == "done"
+    assert "".join(data["content"] for name, data in events if name == "token") == DEFAULT_ANSWER
+
+def test_ask_batch_retrieves_once():
+    questions = [f"What is the punishment for theft under clause {i}?" for i in range(6)]
+    calls = []
+
+    async def fake_retrieve_batch(queries, top_k=5, query_embeddings=None, sources=None):
+        calls.append(list(queries))
+        return [FAKE_CHUNKS for _ in queries]
+
+    original_retrieve = services.retrieve_legal_context_batch_async
+    services.retrieve_legal_context_batch_async = fake_retrieve_batch
+    try:
+        with FakeGroqServer(first_token_latency=0.05, token_interval=0.01) as server:
+            _use_fake_groq(server)
+            client = TestClient(app)
+            response = client.post("/ask/batch", json={"questions": questions})
+            with client.stream("POST", "/ask/batch/stream", json={"questions": questions}) as stream:
+                events = _parse_sse(stream.iter_lines())
+    finally:
+        services.retrieve_legal_context_batch_async = original_retrieve
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["question"] for result in results] == questions
+    assert all(result["answer"] == DEFAULT_ANSWER for result in results)
+    # One retrieval call per request, not per question
+    assert calls == [questions, questions]
+
+    names = [name for name, _ in events]
+    assert names == ["result"] * len(questions) + ["done"]
+    assert sorted(data["index"] for name, data in events if name == "result") == list(range(len(questions)))
+
+def test_ask_fast_path_answers_curated_question():
+    question, answer = "What is theft?", "Section 378 IPC defines theft."
+    match = {
+        "question": question,
+        "answer": answer,
+        "chunk": FAKE_CHUNKS[0],
+        "similarity": 0.99,
+        "sparse_agrees": True
+    }
+
+    async def fake_embed(query):
+        return [[1.0, 0.0]]
+
+    async def fake_match(queries, query_embeddings):
+        return [match if query.startswith("What is theft") else None for query in queries]
+
+    async def fake_retrieve(query, top_k=5, query_embedding=None, sources=None):
+        return FAKE_CHUNKS
+
+    patched = {
+        "embed_query_async": fake_embed,
+        "match_questions_async": fake_match,
+        "retrieve_legal_context_async": fake_retrieve
+    }
+    originals = {name: getattr(services, name) for name in patched}
+    for name, function in patched.items():
+        setattr(services, name, function)
+    try:
+        with FakeGroqServer(first_token_latency=0.05, token_interval=0.0) as server:
+            _use_fake_groq(server)
+            service = services.QueryProcessingService(fast_path_threshold=0.9)
+            fast = asyncio.run(service.process_query("What is theft?"))
+            # Same match, but the user asks about a different section
+            guarded = asyncio.run(service.process_query("What is theft under section 380?"))
+    finally:
+        for name, function in originals.items():
+            setattr(services, name, function)
+
+    assert fast["fast_path"] and fast["answer"] == answer
+    assert fast["sources"] == [FAKE_CHUNKS[0]["metadata"]]
+    assert not guarded["fast_path"] and guarded["answer"] == DEFAULT_ANSWER
+    # Only the question that missed the fast path reached the LLM
+    assert server.requests == 1
+
+def test_ask_searches_selected_sources():
+    searched = []
+
+    async def fake_resolve(sources):
+        if sources and "tax" in sources:
+            raise UnknownSourceError("Unknown source(s): tax. Available sources: constitution, crpc, ipc")
+        return sources
+
+    async def fake_retrieve(query, top_k=5, query_embedding=None, sources=None):
+        searched.append(sources)
+        return FAKE_CHUNKS
+
+    original_resolve = services.resolve_sources_async
+    original_retrieve = services.retrieve_legal_context_async
+    services.resolve_sources_async = fake_resolve
+    services.retrieve_legal_context_async = fake_retrieve
+    try:
+        with FakeGroqServer(first_token_latency=0.05, token_interval=0.0) as server:
+            _use_fake_groq(server)
+            client = TestClient(app)
+            filtered = client.post("/ask", json={"question": "What is theft?", "sources": ["ipc"]})
+            unknown = client.post("/ask", json={"question": "What is theft?", "sources": ["tax"]})
+    finally:
+        services.resolve_sources_async = original_resolve
+        services.retrieve_legal_context_async = original_retrieve
+
+    assert filtered.status_code == 200
+    assert searched == [["ipc"]]
+    assert unknown.status_code == 400 and "tax" in unknown.json()["detail"]
+
+def test_analyze_job_runs_in_background():
+    pdf = synthetic_pdf(3)
+    with FakeGroqServer(first_token_latency=0.05, token_interval=0.0) as server:
+        _use_fake_groq(server)
+        with TestClient(app) as client:
+            submitted = client.post("/analyze/jobs", files={"file": ("contract.pdf", pdf, "application/pdf")})
+            assert submitted.status_code == 202
+            job_id = submitted.json()["job_id"]
+
+            statuses = []
+            deadline = time.perf_counter() + 30
+            while time.perf_counter() < deadline:
+                status = client.get(f"/analyze/jobs/{job_id}").json()
+                statuses.append(status["status"])
+                if status["status"] not in ("queued", "running"):
+                    break
+                time.sleep(0.05)
+            result = client.get(f"/analyze/jobs/{job_id}/result")
+
+            original_max_pending = main.job_queue.max_pending
+            main.job_queue.max_pending = 0
+            try:
+                full = client.post("/analyze/jobs", files={"file": ("contract.pdf", pdf, "application/pdf")})
+            finally:
+                main.job_queue.max_pending = original_max_pending
+            missing = client.get("/analyze/jobs/unknown")
+
+    print(f"Job statuses while polling: {statuses}")
+    assert status["status"] == "completed", status
+    assert status["partial"]["document_stats"]["total_pages"] == 3
+    assert status["partial"]["key_points"] == DEFAULT_ANSWER
+    assert result.status_code == 200
+    assert result.json()["analysis"] == DEFAULT_ANSWER and result.json()["document_stats"]["total_pages"] == 3
+    assert full.status_code == 503 and "Retry-After" in full.headers
+    assert missing.status_code == 404
+
+def _fake_embeddings(texts):
+    """Hashed bag-of-words vectors, enough to rank chunks by shared words."""
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row, hash(word) % 64] += 1.0
+    return vectors
+
+class _FakeEncoder:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def encode(self, texts, **kwargs):
+        if self.fail:
+            raise RuntimeError("encoder unavailable")
+        return _fake_embeddings(texts)
+
+@contextmanager
+def _encoder_without_index(encoder):
+    """Serve `encoder` as the embedding model while no corpus index exists."""
+    patched = {
+        "query_model": lambda spec: encoder,
+        "model": None,
+        "model_embedding": None,
+        "INDEX_PATH": Path(tempfile.gettempdir()) / "no-index" / "index.faiss"
+    }
+    originals = {name: getattr(rag, name) for name in patched}
+    for name, value in patched.items():
+        setattr(rag, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(rag, name, value)
+
+def test_analyze_session_answers_follow_up():
+    # Sessions need only the encoder; the corpus index is never loaded
+    with _encoder_without_index(_FakeEncoder()):
+        with FakeGroqServer(first_token_latency=0.0, token_interval=0.0) as server:
+            _use_fake_groq(server)
+            client = TestClient(app)
+            analyzed = client.post(
+                "/analyze",
+                files={"file": ("contract.pdf", synthetic_pdf(12), "application/pdf")},
+                data={"create_session": "true"}
+            )
+            session = analyzed.json()["session"]
+            calls_before = server.requests
+            follow_up = client.post(
+                f"/analyze/sessions/{session['session_id']}/ask",
+                json={"question": "Where is the seat of arbitration?"}
+            )
+            calls_for_follow_up = server.requests - calls_before
+            missing = client.post("/analyze/sessions/unknown/ask", json={"question": "Anything?"})
+            deleted = client.delete(f"/analyze/sessions/{session['session_id']}")
+            after_delete = client.post(
+                f"/analyze/sessions/{session['session_id']}/ask", json={"question": "Where is the seat of arbitration?"}
+            )
+
+    assert analyzed.status_code == 200 and session["chunks"] > 0
+    assert follow_up.status_code == 200, follow_up.text
+    body = follow_up.json()
+    assert body["answer"] == DEFAULT_ANSWER and body["filename"] == "contract.pdf"
+    # Only the retrieved chunks are sent, not the whole document
+    assert 0 < body["tokens"]["chunks_retrieved"] <= 5 < session["chunks"]
+    assert all("page" in source for source in body["sources"])
+    assert calls_for_follow_up == 1
+    assert missing.status_code == 404
+    assert deleted.status_code == 204 and after_delete.status_code == 404
+
+def test_analyze_returns_null_session_when_indexing_fails():
+    with _encoder_without_index(_FakeEncoder(fail=True)):
+        with FakeGroqServer(first_token_latency=0.0, token_interval=0.0) as server:
+            _use_fake_groq(server)
+            analyzed = TestClient(app).post(
+                "/analyze",
+                files={"file": ("contract.pdf", synthetic_pdf(3), "application/pdf")},
+                data={"create_session": "true"}
+            )
+
+    # The analysis is returned all the same
+    assert analyzed.status_code == 200, analyzed.text
+    assert analyzed.json()["analysis"] == DEFAULT_ANSWER and analyzed.json()["session"] is None
+
+def test_failed_analysis_deletes_its_session():
+    store = main.session_service.store
+
+    async def wait_for_session():
+        # Fail only once the session is built, whose id the client then never gets
+        for _ in range(500):
+            if store.stats()["sessions"]:
+                return
+            await asyncio.sleep(0.01)
+
+    async def failing_generate(prompt):
+        await wait_for_session()
+        raise RuntimeError("LLM unavailable")
+
+    async def failing_stream(prompt):
+        await wait_for_session()
+        raise RuntimeError("LLM unavailable")
+        yield
+
+    original_generate, original_stream = services.generate_response_async, main.generate_response_stream
+    services.generate_response_async = failing_generate
+    main.generate_response_stream = failing_stream
+    try:
+        with _encoder_without_index(_FakeEncoder()):
+            client = TestClient(app)
+            sessions_before = store.stats()["sessions"]
+            analyzed = client.post(
+                "/analyze",
+                files={"file": ("lease.pdf", synthetic_pdf(2), "application/pdf")},
+                data={"create_session": "true"}
+            )
+            sessions_after_analyze = store.stats()["sessions"]
+            with client.stream(
+                "POST", "/analyze/stream",
+                files={"file": ("deed.pdf", synthetic_pdf(4), "application/pdf")},
+                data={"create_session": "true"}
+            ) as response:
+                events = _parse_sse(response.iter_lines())
+            sessions_after_stream = store.stats()["sessions"]
+    finally:
+        services.generate_response_async, main.generate_response_stream = original_generate, original_stream
+
+    assert analyzed.status_code == 500
+    assert [event for event, _ in events][-1] == "error"
+    assert sessions_after_analyze == sessions_after_stream == sessions_before
+
+def test_metrics_add_up_over_worker_processes():
+    """Under PROMETHEUS_MULTIPROC_DIR a scrape reports every worker, not only the one serving it."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as metrics_dir:
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+        record = "from app.metrics import llm_requests; llm_requests.labels(mode='stream').inc()"
+        for _ in range(3):
+            subprocess.run([sys.executable, "-c", record], cwd=root, env=env, check=True)
+        scrape = "import sys; from app.metrics import render; sys.stdout.write(render().decode())"
+        exposition = subprocess.run(
+            [sys.executable, "-c", scrape], cwd=root, env=env, check=True, capture_output=True, text=True
+        ).stdout
+
+    assert 'legal_assistant_llm_requests_total{mode="stream"} 3.0' in exposition.splitlines()
+
+if __name__ == "__main__":
+    test_generate_response_stream()
+    test_closing_stream_early_closes_groq_stream()
+    test_identical_prompts_share_one_call()
+    test_retries_rate_limited_calls()
+    test_groq_clients_are_closed()
+    test_failed_warm_up_is_retried_until_ready()
+    test_ask_stream_sends_sources_first()
+    test_ask_batch_retrieves_once()
+    test_ask_fast_path_answers_curated_question()
+    test_ask_searches_selected_sources()
+    test_analyze_job_runs_in_background()
+    test_analyze_session_answers_follow_up()
+    test_analyze_returns_null_session_when_indexing_fails()
+    test_failed_analysis_deletes_its_session()
+    test_metrics_add_up_over_worker_processes()